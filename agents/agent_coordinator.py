@@ -14,6 +14,9 @@ Agents used:
 
 import os
 import sys
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 load_dotenv()
 base_dir = os.getenv('base_dir')
@@ -23,12 +26,26 @@ sys.path.append(base_dir)
 
 #Load in specialized agents
 from agents.synonym_generator import SynonymGeneratorAgent
-from agents.trial_explainer import TrialExplainerAgent
+from agents.trial_explainer import TrialExplainerAgent, PROMPT_VERSION
 from agents.knowledge_curator import KnowledgeCuratorAgent
 from agents.location_fixer import LocationFixerAgent
 
+from utils import llm_governor
+from utils.single_flight import SingleFlight, FlightAbandoned
+
 #Load in agent helpers
 from agents.helpers import trial_filters
+from agents.helpers import geocoding
+from agents.helpers import synonym_cache
+from agents.helpers import local_synonyms
+from agents.helpers import explanation_store
+from agents.helpers import search_stats
+from agents.helpers import drug_resolver
+
+#How conditions are expanded into synonyms: 'llm', 'local' or 'hybrid', see get_synonyms
+SYNONYM_MODE = os.getenv('synonym_mode', 'llm')
+#In hybrid mode local synonyms are used when the closest trial condition is at least this similar
+HYBRID_MIN_SIMILARITY = float(os.getenv('synonym_hybrid_min_similarity', 0.9))
 
 
 class AgentCoordinator:
@@ -38,6 +55,15 @@ class AgentCoordinator:
         self.explainer_agent = TrialExplainerAgent()
         self.knowledge_agent = KnowledgeCuratorAgent()
         self.location_agent= LocationFixerAgent()
+
+        # Background work (e.g. refreshing stale cached explanations)
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='coordinator')
+        # Independent stages of interactive requests, kept separate so background work never delays a page
+        self.pipeline_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='coordinator-pipeline')
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+        # Concurrent identical requests (same condition, trial or drug) from different sessions share one computation
+        self.flights = SingleFlight()
                 
         
     def process_search_request(self, condition, location, filters=None):
@@ -64,11 +90,34 @@ class AgentCoordinator:
     
     def get_synonyms(self, input_condition):
         """
-        Use the Synonym Generator Agent to expand the condition term
+        Expand the condition term according to SYNONYM_MODE:
+        - 'llm': Synonym Generator Agent, served from the synonym cache when possible
+        - 'local': nearest neighbours in the trial condition embeddings, no LLM call
+        - 'hybrid': cached LLM synonyms, else local ones when the closest trial condition is a near match, else the LLM
+        Concurrent requests for the same normalized condition share one expansion.
         """
+        key = ('synonyms', synonym_cache.normalize_condition(input_condition))
+        synonyms = self.flights.do(key, self._expand_condition, input_condition)
+        # The first synonym is the condition as this user typed it
+        return [input_condition] + list(synonyms[1:])
+
+    def _expand_condition(self, input_condition):
+        if SYNONYM_MODE == 'local':
+            synonyms, _ = local_synonyms.expand_condition(input_condition)
+            return synonyms
+
+        synonyms = synonym_cache.get_cached_synonyms(input_condition)
+        if synonyms is not None:
+            return synonyms
+
+        if SYNONYM_MODE == 'hybrid':
+            synonyms, top_similarity = local_synonyms.expand_condition(input_condition)
+            if top_similarity >= HYBRID_MIN_SIMILARITY:
+                return synonyms
       
         # Generate new synonyms
         synonyms = self.synonym_agent.generate_synonyms(input_condition)
+        synonym_cache.cache_synonyms(input_condition, synonyms)
                 
         return synonyms
     
@@ -81,38 +130,220 @@ class AgentCoordinator:
 
     def find_matching_trials_from_location_with_age_gender(self, trials, location,  max_distance=250):
         """
-        Get matching trial sites for the input location with age and gender information within 250 miles of location
+        Get matching trial sites for the input location with age and gender information within 250 miles of location.
+        location can also be a list of locations (e.g. two homes), sites are then ranked by distance to the nearest one
+        and labelled with it in the nearest_origin column.
         """
         matching_trial_sites = trial_filters.get_sites_sorted_by_distance_with_age_gender(trials, location, max_distance=max_distance)
+
+        # Track which trials users see so batch jobs can precompute their explanations first
+        if not matching_trial_sites.empty:
+            search_stats.record_search_results(matching_trial_sites['nct_id'])
         
         return matching_trial_sites
     
     
-    def get_trial_explanation(self, ssp):
+    def _submit(self, executor, fn, *args):
+        """
+        Submit fn to a thread pool in a copy of the current context, so the LLM metrics session and search ids follow it
+        """
+        return executor.submit(contextvars.copy_context().run, fn, *args)
+
+    def get_trial_explanation(self, ssp, trial_dfs=None):
         """
-        Get simplified explanation of a specific trial
+        Get simplified explanation of a specific trial, served from the explanation store when possible.
+        A stored explanation for an older version of the trial (or prompt) is served right away and refreshed in the background.
         """
+        nct_id = ssp['nct_id']
+        study_details = trial_dfs['study_details'] if trial_dfs is not None else None
+        last_update = trial_filters.get_trial_last_update(nct_id, study_details)
+
+        entry = explanation_store.get_explanation(nct_id)
+        if entry is None:
+            # Nothing stored yet, generate it now (once, however many sessions opened the trial meanwhile)
+            trial_summary = self.flights.do(('explanation', nct_id), self._generate_trial_explanation, ssp, trial_dfs, last_update)
+        else:
+            trial_summary = entry['summary']
+            if not explanation_store.is_current(entry, last_update, PROMPT_VERSION):
+                self.refresh_trial_explanation(ssp, last_update)
 
         # Get simplified trial explanation data from study site pair
-        trial_data = self.explainer_agent.explain_trial(ssp)
+        trial_data = self.explainer_agent.add_site_details(trial_summary, ssp)
 
         trial_md=self.explainer_agent.generate_trial_markdown(trial_data)
 
         return trial_data,trial_md
+
+    def _generate_trial_explanation(self, ssp, trial_dfs, last_update):
+        nct_id = ssp['nct_id']
+        if trial_dfs is None:
+            trial_dfs = trial_filters.get_trial_details(ssp)
+        trial_summary = self.explainer_agent.summarize_trial(nct_id, trial_dfs)
+        explanation_store.save_explanation(nct_id, last_update, PROMPT_VERSION, trial_summary)
+        return trial_summary
+
+    def refresh_trial_explanation(self, ssp, last_update):
+        """
+        Regenerate a trial's stored explanation in the background, at most one refresh per trial at a time
+        """
+        nct_id = ssp['nct_id']
+        with self._refreshing_lock:
+            if nct_id in self._refreshing:
+                return
+            self._refreshing.add(nct_id)
+
+        def refresh():
+            try:
+                # Nobody is waiting on a refresh, so interactive LLM calls go first
+                with llm_governor.priority(llm_governor.BACKGROUND):
+                    trial_dfs = trial_filters.get_trial_details(ssp)
+                    trial_summary = self.explainer_agent.summarize_trial(nct_id, trial_dfs)
+                    explanation_store.save_explanation(nct_id, last_update, PROMPT_VERSION, trial_summary)
+            except Exception as e:
+                print(f"Background refresh of {nct_id} failed: {e}")
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(nct_id)
+
+        self._submit(self.executor, refresh)
     
+    def get_trial_page(self, ssp):
+        """
+        Get everything the trial details page needs: (trial_data, trial_md, drug_md).
+        The explanation and the drug lookup run concurrently, so the drug work (DailyMed, LLM summary) does not wait
+        for the explainer LLM call. A stored explanation only needs the trial's last update date, the full AACT
+        details are then fetched for the drug lookup alone.
+        """
+        if explanation_store.get_explanation(ssp['nct_id']) is not None:
+            drug_future = self._submit(self.pipeline_executor, self._get_trial_drug_md, ssp)
+            explanation_future = self._submit(self.pipeline_executor, self.get_trial_explanation, ssp)
+        else:
+            trial_dfs = trial_filters.get_trial_details(ssp)
+            # The drug lookup only needs the titles and interventions, which AACT already gave us
+            drug_future = self._submit(self.pipeline_executor, self._get_trial_drug_md, ssp, trial_dfs)
+            explanation_future = self._submit(self.pipeline_executor, self.get_trial_explanation, ssp, trial_dfs)
+
+        trial_data, trial_md = explanation_future.result()
+        drug_md = drug_future.result()
+
+        return trial_data, trial_md, drug_md
+
+    def stream_trial_explanation(self, ssp, trial_dfs=None):
+        """
+        Streaming version of get_trial_explanation, yields (trial_data, trial_md) as sections of the explanation complete.
+        A stored explanation is yielded once, otherwise the LLM output is streamed and saved to the store at the end
+        if every section was generated. If the explanation is already being generated for another session it is waited for and yielded once,
+        unless that session is closed or its stream ends incomplete, in which case this one streams it itself.
+        """
+        nct_id = ssp['nct_id']
+        study_details = trial_dfs['study_details'] if trial_dfs is not None else None
+        last_update = trial_filters.get_trial_last_update(nct_id, study_details)
+
+        entry = explanation_store.get_explanation(nct_id)
+        if entry is not None:
+            if not explanation_store.is_current(entry, last_update, PROMPT_VERSION):
+                self.refresh_trial_explanation(ssp, last_update)
+            trial_data = self.explainer_agent.add_site_details(entry['summary'], ssp)
+            yield trial_data, self.explainer_agent.generate_trial_markdown(trial_data)
+            return
+
+        key = ('explanation', nct_id)
+        while True:
+            future, is_leader = self.flights.begin(key)
+            if is_leader:
+                break
+            try:
+                trial_summary = future.result()
+            except FlightAbandoned:
+                # The session generating it went away or got an incomplete stream, generate it here instead
+                continue
+            trial_data = self.explainer_agent.add_site_details(trial_summary, ssp)
+            yield trial_data, self.explainer_agent.generate_trial_markdown(trial_data)
+            return
+
+        trial_summary = None
+        try:
+            if trial_dfs is None:
+                trial_dfs = trial_filters.get_trial_details(ssp)
+
+            for trial_summary in self.explainer_agent.summarize_trial_stream(nct_id, trial_dfs):
+                trial_data = self.explainer_agent.add_site_details(trial_summary, ssp)
+                yield trial_data, self.explainer_agent.generate_trial_markdown(trial_data)
+
+            complete = self.explainer_agent.is_complete_summary(trial_summary)
+            if complete:
+                explanation_store.save_explanation(nct_id, last_update, PROMPT_VERSION, trial_summary)
+        except Exception as e:
+            self.flights.finish(key, error=e)
+            raise
+        except BaseException:
+            # The page was closed or rerun mid stream (GeneratorExit, Streamlit's rerun exception), that is no reason to
+            # fail the sessions waiting on it, one of them takes over
+            self.flights.abandon(key)
+            raise
+
+        if complete:
+            self.flights.finish(key, trial_summary)
+        else:
+            # A stream that ended early (length limit, content filter, dropped connection) is shown but never stored
+            # or handed to waiting sessions, they and the next visit generate it again
+            print(f"Explanation stream for {nct_id} ended before every section was generated, not saved")
+            self.flights.abandon(key)
+
+    def stream_trial_page(self, ssp):
+        """
+        Streaming version of get_trial_page, returns (explanation_stream, drug_future).
+        explanation_stream yields (trial_data, trial_md) section by section while the drug lookup runs in the background.
+        A stored explanation is yielded without waiting for the full AACT details.
+        """
+        if explanation_store.get_explanation(ssp['nct_id']) is not None:
+            drug_future = self._submit(self.pipeline_executor, self._get_trial_drug_md, ssp)
+            return self.stream_trial_explanation(ssp), drug_future
+
+        trial_dfs = trial_filters.get_trial_details(ssp)
+        drug_future = self._submit(self.pipeline_executor, self._get_trial_drug_md, ssp, trial_dfs)
+
+        return self.stream_trial_explanation(ssp, trial_dfs), drug_future
+
+    def _get_trial_drug_md(self, ssp, trial_dfs=None):
+        # The drug lookup only needs the titles and interventions
+        if trial_dfs is None:
+            trial_dfs = trial_filters.get_trial_details(ssp)
+        return self.get_drug_md(trial_filters.get_trial_about_text(trial_dfs), trial_dfs, nct_id=ssp['nct_id'])
+
     def get_knowledge_resources(self, condition, trial_about):
 
-        condition_md=self.knowledge_agent.curate_medical_page(condition)
-        drug_md = self.knowledge_agent.generate_drug_markdown_from_trial_about(trial_about)
+        condition_md=self.get_condition_md(condition)
+        drug_md = self.get_drug_md(trial_about)
                 
         return condition_md,drug_md
     
     def get_condition_md(self, condition):
-        condition_md=self.knowledge_agent.curate_medical_page(condition)
+        """
+        Condition page, concurrent requests for the same normalized condition share one scrape and LLM call
+        """
+        key = ('condition_page', synonym_cache.normalize_condition(condition))
+        condition_md=self.flights.do(key, self.knowledge_agent.curate_medical_page, condition)
         return condition_md
 
-    def get_drug_md(self, trial_about):
-        drug_md = self.knowledge_agent.generate_drug_markdown_from_trial_about(trial_about)
+    def get_drug_md(self, trial_about, trial_dfs=None, nct_id=None):
+        """
+        Drug page for a trial. With the trial's AACT details the drug is resolved from its structured interventions,
+        the LLM classifier is only asked when they are ambiguous (or only the text is given).
+        Given the trial's nct_id, identifying the drug is shared between concurrent requests for the same trial,
+        and the drug page itself between requests for the same drug (different trials often test the same drug).
+        """
+        decision = drug_resolver.resolve_drug(trial_dfs) if trial_dfs is not None else None
+        if decision is None and nct_id is not None:
+            decision = self.flights.do(('drug_study', nct_id), self.knowledge_agent.identify_drug_study, trial_about)
+        elif decision is None:
+            decision = self.knowledge_agent.identify_drug_study(trial_about)
+        if not decision.get("is_drug_study", False):
+            return self.knowledge_agent.generate_no_drug_markdown(decision)
+
+        drug_name = decision['drug_name']
+        key = ('drug_page', synonym_cache.normalize_condition(drug_name))
+        drug_md = self.flights.do(key, self.knowledge_agent.curate_drug_page, drug_name)
                 
         return drug_md
 
@@ -132,6 +363,12 @@ class AgentCoordinator:
 
         return self.location_agent.fix_location(input_location)
 
+    def geocode_location(self, location):
+        """
+        Resolve a location string to coordinates through the shared geocoding cache
+        """
+        return geocoding.geocode(location)
+
 
 
 
@@ -0,0 +1,163 @@
+"""
+drug_resolver.py
+
+This module decides whether a trial studies a drug, and which one, straight from its AACT interventions, so the
+drug page no longer waits on an LLM classifier call for most trials. The interventions and design groups come
+from trial_filters.get_trial_details, which the trial page already fetches.
+
+A trial resolves to:
+- a drug study, when exactly one drug or biological remains after dropping placebos, shams and standard of care
+  and, where there are several, after preferring the ones named in the experimental arms or in the title
+- not a drug study, when none of its interventions is a drug or biological
+- None (ambiguous), when there are no interventions or several candidate drugs remain. The caller then falls
+  back to the Knowledge Curator Agent's LLM classifier.
+
+Decisions use the same fields as KnowledgeCuratorAgent.identify_drug_study (is_drug_study, drug_name,
+reason_if_no_drug), so either can feed the drug page.
+
+Functions:
+- normalize_drug_name(name): Strips doses, forms and codes in brackets from an intervention name.
+- is_placebo(name): True for placebo, sham, vehicle and standard of care interventions.
+- resolve_drug(trial_dfs): Returns the decision for a trial's details, or None when it is ambiguous.
+"""
+
+
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+base_dir = os.getenv('base_dir')
+#Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+
+#File specific imports
+import re
+import pandas as pd
+
+
+DRUG_TYPES = {'DRUG', 'BIOLOGICAL'}
+PLACEBO_PATTERN = re.compile(
+    r'\b(placebo|sham|vehicle|dummy|saline|sugar pill|standard of care|usual care|best supportive care|no intervention|no treatment)\b',
+    re.IGNORECASE,
+)
+#Doses ("81 mg", "0.5 mg/kg", "10%") and everything after them, and dosage forms
+DOSE_PATTERN = re.compile(r'\s*\d+(\.\d+)?\s*(mg|mcg|µg|ug|g|ml|iu|units?|%|mg/kg|mg/m2|mg/ml)\b.*$', re.IGNORECASE)
+FORM_PATTERN = re.compile(
+    r'\b(tablets?|capsules?|injections?|infusion|oral solution|solution|suspension|cream|ointment|gel|patch|spray|'
+    r'extended[- ]release|delayed[- ]release|for injection|intravenous|subcutaneous|oral|iv|sc)\b',
+    re.IGNORECASE,
+)
+BRACKET_PATTERN = re.compile(r'\s*[\(\[][^\)\]]*[\)\]]')
+
+INTERVENTION_TYPE_NAMES = {
+    'DEVICE': 'a device',
+    'PROCEDURE': 'a procedure',
+    'BEHAVIORAL': 'a behavioral program',
+    'RADIATION': 'radiation therapy',
+    'DIETARY_SUPPLEMENT': 'a dietary supplement',
+    'GENETIC': 'a genetic therapy',
+    'DIAGNOSTIC_TEST': 'a diagnostic test',
+    'COMBINATION_PRODUCT': 'a combination product',
+}
+
+
+def _type(intervention_type):
+    #Older AACT loads use "Drug" / "Dietary Supplement" rather than "DRUG" / "DIETARY_SUPPLEMENT"
+    return str(intervention_type).strip().upper().replace(' ', '_')
+
+
+def normalize_drug_name(name):
+    """
+    Normalize an intervention name into a drug name, e.g. "Aspirin 81 mg tablets (ASA)" -> "Aspirin".
+    """
+    name = str(name).strip()
+    name = BRACKET_PATTERN.sub('', name)
+    name = DOSE_PATTERN.sub('', name)
+    name = FORM_PATTERN.sub('', name)
+    name = re.sub(r'\s+', ' ', name).strip(' ,;:-/')
+    return name
+
+
+def is_placebo(name):
+    #Only the name, descriptions of active drugs often mention the placebo ("compared with placebo", "diluted in saline")
+    return bool(PLACEBO_PATTERN.search(str(name)))
+
+
+def _mentioned(name, text):
+    return re.search(r'\b' + re.escape(name.lower()) + r'\b', text.lower()) is not None
+
+
+def _no_drug_decision(interventions):
+    kinds = []
+    for intervention_type, name in zip(interventions['intervention_type'], interventions['name']):
+        kind = INTERVENTION_TYPE_NAMES.get(_type(intervention_type))
+        if kind and f"{kind} ({name})" not in kinds:
+            kinds.append(f"{kind} ({name})")
+    if kinds:
+        reason = f"This study tests {', '.join(kinds[:3])} rather than a drug."
+    else:
+        reason = "This study focuses on something other than testing a drug."
+    return {'is_drug_study': False, 'drug_name': '', 'reason_if_no_drug': reason}
+
+
+def resolve_drug(trial_dfs):
+    """
+    Decide from a trial's structured interventions whether it studies a drug.
+    Returns a decision dict (is_drug_study, drug_name, reason_if_no_drug), or None when the interventions are ambiguous.
+    """
+    interventions = trial_dfs['interventions']
+    if interventions.empty:
+        return None
+
+    candidates = {}
+    for intervention_type, name in zip(interventions['intervention_type'], interventions['name']):
+        if _type(intervention_type) not in DRUG_TYPES or is_placebo(name):
+            continue
+        drug_name = normalize_drug_name(name)
+        if drug_name:
+            candidates.setdefault(drug_name.lower(), drug_name)
+
+    if not candidates:
+        #Only placebo means the drug is described somewhere we cannot parse, let the LLM read it
+        if any(_type(t) in DRUG_TYPES for t in interventions['intervention_type']):
+            return None
+        return _no_drug_decision(interventions)
+
+    if len(candidates) > 1:
+        #Prefer drugs named in the experimental arms but not in the comparator arms, then the one named in the title
+        design_groups = trial_dfs.get('design_groups')
+        if design_groups is not None and not design_groups.empty:
+            group_text = {'EXPERIMENTAL': '', 'COMPARATOR': ''}
+            for group_type, title, description in zip(design_groups['group_type'], design_groups['title'], design_groups['description']):
+                group = 'EXPERIMENTAL' if _type(group_type) == 'EXPERIMENTAL' else 'COMPARATOR' if 'COMPARATOR' in _type(group_type) else None
+                if group:
+                    group_text[group] += f" {title} {description if pd.notna(description) else ''}"
+            experimental = {key: name for key, name in candidates.items()
+                            if _mentioned(name, group_text['EXPERIMENTAL']) and not _mentioned(name, group_text['COMPARATOR'])}
+            if experimental:
+                candidates = experimental
+
+    if len(candidates) > 1:
+        study_details = trial_dfs['study_details']
+        if not study_details.empty:
+            title = str(study_details.loc[0]['brief_title'])
+            in_title = {key: name for key, name in candidates.items() if _mentioned(name, title)}
+            if in_title:
+                candidates = in_title
+
+    if len(candidates) > 1:
+        return None
+
+    drug_name = next(iter(candidates.values()))
+    return {'is_drug_study': True, 'drug_name': drug_name, 'reason_if_no_drug': ''}
+
+
+"""
+#Usage
+trial_dfs = trial_filters.get_trial_details(study_site_pair)
+decision = resolve_drug(trial_dfs)
+if decision is None:
+    decision = KnowledgeCuratorAgent().identify_drug_study(trial_filters.get_trial_about_text(trial_dfs))
+"""
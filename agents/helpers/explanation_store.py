@@ -0,0 +1,83 @@
+"""
+explanation_store.py
+
+This module provides a persistent store of trial explanations generated by the Trial Explainer Agent, so a
+popular trial's details page loads instantly instead of waiting on seven SQL queries and a long LLM call.
+
+Explanations only depend on the trial, not the site, so entries hold the trial level summary (see
+TrialExplainerAgent.summarize_trial) keyed by NCT ID. Each entry records the trial's last update date and the
+prompt version it was generated with; when either changes the entry is stale and should be regenerated.
+The app reads the default store, test runs against a stub LLM can write to a separately named one.
+
+Functions:
+- get_explanation(nct_id): Returns the stored entry for a trial, or None.
+- is_current(entry, last_update, prompt_version): Whether an entry matches the trial's last update and the current prompt.
+- save_explanation(nct_id, last_update, prompt_version, summary): Stores a freshly generated summary.
+"""
+
+
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+base_dir = os.getenv('base_dir')
+#Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+
+#File specific imports
+import time
+import threading
+from utils.cache_util import PersistentCache, MISSING
+
+
+EXPLANATION_MAX_ENTRIES = int(os.getenv('explanation_store_max_entries', 100000))
+
+DEFAULT_STORE = 'trial_explanations'
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _get_store(store_name):
+    #Entries do not expire by age, they go stale when the trial or the prompt changes
+    with _stores_lock:
+        if store_name not in _stores:
+            _stores[store_name] = PersistentCache(store_name, ttl_seconds=None, max_entries=EXPLANATION_MAX_ENTRIES)
+        return _stores[store_name]
+
+
+def get_explanation(nct_id, store_name=DEFAULT_STORE):
+    """
+    Return the stored entry for a trial ({'nct_id', 'last_update', 'prompt_version', 'summary', 'created_at'}), or None.
+    """
+    entry = _get_store(store_name).get(nct_id)
+    return None if entry is MISSING else entry
+
+
+def is_current(entry, last_update, prompt_version):
+    """
+    True when the entry was generated from the trial's latest update with the current prompt.
+    """
+    return entry['last_update'] == last_update and entry['prompt_version'] == prompt_version
+
+
+def save_explanation(nct_id, last_update, prompt_version, summary, store_name=DEFAULT_STORE):
+    """
+    Store a trial level summary for a trial.
+    """
+    _get_store(store_name).set(nct_id, {
+        'nct_id': nct_id,
+        'last_update': last_update,
+        'prompt_version': prompt_version,
+        'summary': summary,
+        'created_at': time.time(),
+    })
+
+
+"""
+#Usage
+entry=get_explanation('NCT04929210')
+entry['summary']
+"""
@@ -0,0 +1,305 @@
+"""
+gazetteer.py
+
+This module provides an offline U.S. geocoder backed by a local gazetteer, so common location inputs
+("Boston, Massachusetts", "PA", "19103") resolve without a network round trip to Nominatim.
+
+The state table is bundled in this module and always available. Census places and ZIP code (ZCTA) centroids
+are loaded from data/us_gazetteer.pkl, which is built by scripts/us_gazetteer_init.py. Without that file
+the gazetteer still resolves states and simply misses on cities and ZIP codes.
+
+Functions:
+- normalize_state(text): Returns the two letter abbreviation for a state name or abbreviation (with typo tolerance).
+- lookup(query): Returns the best GazetteerMatch for a "City, State", state or ZIP code query, or None.
+- suggest(prefix): Returns "City, State" completions for a typed prefix using a sorted prefix index.
+"""
+
+
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+base_dir = os.getenv('base_dir')
+#Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+
+#File specific imports
+import re
+import bisect
+import difflib
+import threading
+from collections import namedtuple
+import pandas as pd
+
+
+GazetteerMatch = namedtuple('GazetteerMatch', ['name', 'kind', 'latitude', 'longitude', 'score'])
+
+#Abbreviation -> (state name, latitude, longitude) of the state's central point
+STATES = {
+    'AL': ('Alabama', 32.806671, -86.791130),
+    'AK': ('Alaska', 61.370716, -152.404419),
+    'AZ': ('Arizona', 33.729759, -111.431221),
+    'AR': ('Arkansas', 34.969704, -92.373123),
+    'CA': ('California', 36.116203, -119.681564),
+    'CO': ('Colorado', 39.059811, -105.311104),
+    'CT': ('Connecticut', 41.597782, -72.755371),
+    'DE': ('Delaware', 39.318523, -75.507141),
+    'DC': ('District of Columbia', 38.897438, -77.026817),
+    'FL': ('Florida', 27.766279, -81.686783),
+    'GA': ('Georgia', 33.040619, -83.643074),
+    'HI': ('Hawaii', 21.094318, -157.498337),
+    'ID': ('Idaho', 44.240459, -114.478828),
+    'IL': ('Illinois', 40.349457, -88.986137),
+    'IN': ('Indiana', 39.849426, -86.258278),
+    'IA': ('Iowa', 42.011539, -93.210526),
+    'KS': ('Kansas', 38.526600, -96.726486),
+    'KY': ('Kentucky', 37.668140, -84.670067),
+    'LA': ('Louisiana', 31.169546, -91.867805),
+    'ME': ('Maine', 44.693947, -69.381927),
+    'MD': ('Maryland', 39.063946, -76.802101),
+    'MA': ('Massachusetts', 42.230171, -71.530106),
+    'MI': ('Michigan', 43.326618, -84.536095),
+    'MN': ('Minnesota', 45.694454, -93.900192),
+    'MS': ('Mississippi', 32.741646, -89.678696),
+    'MO': ('Missouri', 38.456085, -92.288368),
+    'MT': ('Montana', 46.921925, -110.454353),
+    'NE': ('Nebraska', 41.125370, -98.268082),
+    'NV': ('Nevada', 38.313515, -117.055374),
+    'NH': ('New Hampshire', 43.452492, -71.563896),
+    'NJ': ('New Jersey', 40.298904, -74.521011),
+    'NM': ('New Mexico', 34.840515, -106.248482),
+    'NY': ('New York', 42.165726, -74.948051),
+    'NC': ('North Carolina', 35.630066, -79.806419),
+    'ND': ('North Dakota', 47.528912, -99.784012),
+    'OH': ('Ohio', 40.388783, -82.764915),
+    'OK': ('Oklahoma', 35.565342, -96.928917),
+    'OR': ('Oregon', 44.572021, -122.070938),
+    'PA': ('Pennsylvania', 40.590752, -77.209755),
+    'PR': ('Puerto Rico', 18.220833, -66.590149),
+    'RI': ('Rhode Island', 41.680893, -71.511780),
+    'SC': ('South Carolina', 33.856892, -80.945007),
+    'SD': ('South Dakota', 44.299782, -99.438828),
+    'TN': ('Tennessee', 35.747845, -86.692345),
+    'TX': ('Texas', 31.054487, -97.563461),
+    'UT': ('Utah', 40.150032, -111.862434),
+    'VT': ('Vermont', 44.045876, -72.710686),
+    'VA': ('Virginia', 37.769337, -78.169968),
+    'WA': ('Washington', 47.400902, -121.490494),
+    'WV': ('West Virginia', 38.491226, -80.954453),
+    'WI': ('Wisconsin', 44.268543, -89.616508),
+    'WY': ('Wyoming', 42.755966, -107.302490),
+}
+
+_STATE_NAME_TO_ABBR = {name.lower(): abbr for abbr, (name, _, _) in STATES.items()}
+
+#Common city nicknames, checked before state abbreviations so "LA" means Los Angeles rather than Louisiana
+CITY_ALIASES = {
+    'la': ('los angeles', 'CA'),
+    'nyc': ('new york', 'NY'),
+    'new york': ('new york', 'NY'),
+    'sf': ('san francisco', 'CA'),
+    'philly': ('philadelphia', 'PA'),
+    'vegas': ('las vegas', 'NV'),
+}
+
+#Minimum difflib similarity for a fuzzy match to count
+FUZZY_CUTOFF = 0.8
+#Matches scoring below this (fuzzy, ambiguous or bare city names) should be confirmed elsewhere (Nominatim, the LLM)
+MIN_SCORE = 0.9
+#A bare city name found in a single state may still be a foreign city ("Toronto" is also in Ohio)
+BARE_CITY_SCORE = 0.8
+
+gazetteer_file = os.path.join(base_dir, 'data', 'us_gazetteer.pkl')
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _normalize(text):
+    text = str(text).strip().lower()
+    text = re.sub(r'[.]', '', text)
+    text = re.sub(r'\s*,\s*', ', ', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip(' ,')
+
+
+def _load_index():
+    """
+    Build the lookup structures from the gazetteer file once per process.
+    """
+    global _index
+    if _index is not None:
+        return _index
+
+    with _index_lock:
+        if _index is not None:
+            return _index
+
+        places = {}
+        names_by_state = {}
+        states_by_name = {}
+        zips = {}
+
+        if os.path.exists(gazetteer_file):
+            gazetteer_object = pd.read_pickle(gazetteer_file)
+            places_df = gazetteer_object['places']
+            zips_df = gazetteer_object['zips']
+
+            for name, state, lat, lon in zip(places_df['name'], places_df['state'], places_df['latitude'], places_df['longitude']):
+                key = _normalize(name)
+                places[(key, state)] = (name, lat, lon)
+                names_by_state.setdefault(state, []).append(key)
+                states_by_name.setdefault(key, []).append(state)
+
+            zips = dict(zip(zips_df['zip'], zip(zips_df['latitude'], zips_df['longitude'])))
+
+        #Sorted "city, st" keys power prefix completion with bisect
+        prefix_keys = sorted(f'{name}, {state.lower()}' for name, state in places)
+
+        _index = {
+            'places': places,
+            'names_by_state': names_by_state,
+            'states_by_name': states_by_name,
+            'zips': zips,
+            'prefix_keys': prefix_keys,
+        }
+        return _index
+
+
+def normalize_state(text):
+    """
+    Return (abbreviation, score) for a state name or abbreviation, or (None, 0) if it is not a state.
+    """
+    key = _normalize(text)
+    if key.upper() in STATES:
+        return key.upper(), 1.0
+    if key in _STATE_NAME_TO_ABBR:
+        return _STATE_NAME_TO_ABBR[key], 1.0
+
+    #Typo tolerance on full state names only, two letter codes are too short to fuzz
+    if len(key) > 3:
+        close = difflib.get_close_matches(key, _STATE_NAME_TO_ABBR.keys(), n=1, cutoff=FUZZY_CUTOFF)
+        if close:
+            return _STATE_NAME_TO_ABBR[close[0]], difflib.SequenceMatcher(None, key, close[0]).ratio()
+    return None, 0
+
+
+def _state_match(abbr, score):
+    name, lat, lon = STATES[abbr]
+    return GazetteerMatch(name, 'state', lat, lon, score)
+
+
+def _place_match(city, state, score):
+    index = _load_index()
+    key = _normalize(city)
+    if (key, state) in index['places']:
+        name, lat, lon = index['places'][(key, state)]
+        return GazetteerMatch(f'{name}, {STATES[state][0]}', 'place', lat, lon, score)
+
+    close = difflib.get_close_matches(key, index['names_by_state'].get(state, []), n=1, cutoff=FUZZY_CUTOFF)
+    if close:
+        name, lat, lon = index['places'][(close[0], state)]
+        ratio = difflib.SequenceMatcher(None, key, close[0]).ratio()
+        return GazetteerMatch(f'{name}, {STATES[state][0]}', 'place', lat, lon, score * ratio)
+    return None
+
+
+def _split_trailing_state(query):
+    """
+    Split "boston ma" or "new york new york" into ("boston", "MA") when the query ends with a state.
+    """
+    tokens = query.split(' ')
+    for n in (3, 2, 1):
+        if len(tokens) > n:
+            abbr, score = normalize_state(' '.join(tokens[-n:]))
+            if abbr and score == 1.0:
+                return ' '.join(tokens[:-n]), abbr
+    return None, None
+
+
+def lookup(query):
+    """
+    Resolve a U.S. location query to its best GazetteerMatch, or None when nothing plausible is found.
+    The score is 1.0 for exact matches and lower for fuzzy, ambiguous or bare city name ones.
+    """
+    if query is None:
+        return None
+    query = _normalize(query)
+    if not query:
+        return None
+    query = re.sub(r',? (usa|us|united states)$', '', query)
+
+    #ZIP codes (ZIP+4 is reduced to its five digit ZIP)
+    zip_match = re.fullmatch(r'(\d{5})(-\d{4})?', query)
+    if zip_match:
+        coords = _load_index()['zips'].get(zip_match.group(1))
+        if coords is None:
+            return None
+        return GazetteerMatch(zip_match.group(1), 'zip', coords[0], coords[1], 1.0)
+
+    #"City, State"
+    if ',' in query:
+        city, state_text = [part.strip() for part in query.rsplit(',', 1)]
+        #Drop a trailing ZIP code from "City, ST 12345"
+        state_text = re.sub(r'\s+\d{5}(-\d{4})?$', '', state_text)
+        abbr, state_score = normalize_state(state_text)
+        if abbr is None:
+            return None
+        return _place_match(city, abbr, state_score)
+
+    #City nicknames
+    if query in CITY_ALIASES:
+        match = _place_match(*CITY_ALIASES[query], 1.0)
+        #Without the places file "new york" still resolves to the state
+        if match is not None:
+            return match
+
+    #A bare state
+    abbr, state_score = normalize_state(query)
+    if abbr is not None:
+        return _state_match(abbr, state_score)
+
+    #"City ST" without a comma
+    city, abbr = _split_trailing_state(query)
+    if city:
+        match = _place_match(city, abbr, 1.0)
+        if match is not None:
+            return match
+
+    #A bare city name is never confident, even in a single state it may be a foreign city
+    states = _load_index()['states_by_name'].get(query, [])
+    if states:
+        return _place_match(query, states[0], BARE_CITY_SCORE if len(states) == 1 else 0.5)
+
+    return None
+
+
+def suggest(prefix, limit=10):
+    """
+    Return up to limit "City, State" completions for a typed prefix.
+    """
+    index = _load_index()
+    key = _normalize(prefix)
+    if not key:
+        return []
+    keys = index['prefix_keys']
+    start = bisect.bisect_left(keys, key)
+    suggestions = []
+    for candidate in keys[start:start + limit]:
+        if not candidate.startswith(key):
+            break
+        name_key, state = candidate.rsplit(', ', 1)
+        name, _, _ = index['places'][(name_key, state.upper())]
+        suggestions.append(f'{name}, {STATES[state.upper()][0]}')
+    return suggestions
+
+
+"""
+#Usage
+lookup('Boston, MA')
+lookup('pensylvania')
+lookup('19103')
+suggest('allen')
+"""
@@ -0,0 +1,122 @@
+"""
+geocoding.py
+
+This module provides a shared geocoding service for the app so that each unique location string is resolved
+against Nominatim at most once, no matter how many users or pages ask for it.
+
+Lookups go through four layers:
+- the offline U.S. gazetteer (see gazetteer.py), which resolves states, "City, State" and ZIP codes locally,
+- an in-memory LRU for the current process,
+- an on-disk SQLite store with a TTL shared by every Streamlit session (see utils/cache_util.py),
+- Nominatim itself, called with a fixed user agent and throttled to its usage policy of one request per second.
+
+Failed lookups are cached too (negative caching) with a shorter TTL, so a bad location string does not
+hit Nominatim again on every search.
+
+Functions:
+- normalize_location_query(location): Normalizes a free-text location into the cache key.
+- geocode(location): Returns a GeocodedLocation (address, latitude, longitude) or None if it cannot be resolved.
+"""
+
+
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+base_dir = os.getenv('base_dir')
+#Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+
+#File specific imports
+import re
+import time
+import threading
+from collections import namedtuple
+from geopy.geocoders import Nominatim
+from utils.cache_util import PersistentCache, MISSING
+from utils import cassette
+from agents.helpers import gazetteer
+
+
+GeocodedLocation = namedtuple('GeocodedLocation', ['address', 'latitude', 'longitude'])
+
+#Positive results rarely change, failures are retried sooner in case Nominatim was just having a bad day
+GEOCODE_TTL_SECONDS = 30 * 24 * 60 * 60
+NEGATIVE_TTL_SECONDS = 24 * 60 * 60
+
+#Nominatim usage policy allows at most one request per second per application
+NOMINATIM_MIN_INTERVAL_SECONDS = 1.0
+NOMINATIM_USER_AGENT = os.getenv('nominatim_user_agent') or 'clinical_trial_agent_seekers'
+
+#Gazetteer matches below this score (fuzzy, ambiguous or bare city names) fall through to Nominatim
+GAZETTEER_MIN_SCORE = gazetteer.MIN_SCORE
+
+_cache = PersistentCache('geocode', ttl_seconds=GEOCODE_TTL_SECONDS, memory_entries=4096)
+_geolocator = Nominatim(user_agent=NOMINATIM_USER_AGENT, timeout=10)
+_nominatim_lock = threading.Lock()
+_last_nominatim_call = 0.0
+
+
+def normalize_location_query(location):
+    """
+    Normalize a location string so trivially different inputs ("boston,ma ", "Boston, MA") share a cache entry.
+    """
+    if location is None:
+        return ''
+    query = str(location).strip().lower()
+    query = re.sub(r'\s*,\s*', ', ', query)
+    query = re.sub(r'\s+', ' ', query)
+    return query.strip(' ,.')
+
+
+def _geocode_with_nominatim(query):
+    global _last_nominatim_call
+    #Serialize calls so we stay within the Nominatim rate limit across all sessions
+    with _nominatim_lock:
+        wait = NOMINATIM_MIN_INTERVAL_SECONDS - (time.monotonic() - _last_nominatim_call)
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            location = _geolocator.geocode(query, exactly_one=True, country_codes='us')
+        finally:
+            _last_nominatim_call = time.monotonic()
+
+    if location is None:
+        return None
+    return GeocodedLocation(location.address, location.latitude, location.longitude)
+
+
+def geocode(location):
+    """
+    Geocode a free-text location to a GeocodedLocation, or None if it cannot be resolved.
+    The local gazetteer is tried first, Nominatim results (including failures) are cached in memory and on disk.
+    """
+    query = normalize_location_query(location)
+    if not query:
+        return None
+
+    #Recorded or replayed when a cassette is active (utils/cassette.py)
+    return cassette.through('geocode', [query], lambda: _geocode(query))
+
+
+def _geocode(query):
+    match = gazetteer.lookup(query)
+    if match is not None and match.score >= GAZETTEER_MIN_SCORE:
+        return GeocodedLocation(match.name, match.latitude, match.longitude)
+
+    cached = _cache.get(query)
+    if cached is not MISSING:
+        return cached
+
+    result = _geocode_with_nominatim(query)
+    _cache.set(query, result, ttl_seconds=GEOCODE_TTL_SECONDS if result is not None else NEGATIVE_TTL_SECONDS)
+    return result
+
+
+"""
+#Usage
+location=geocode('Boston, MA')
+location.latitude, location.longitude
+"""
@@ -7,6 +7,7 @@ about conditions and drugs from trusted public sources.
 Functions:
 - get_condition_page(condition): Fetches and extracts simplified textual content about a medical condition from MedlinePlus by simulating a search and cleaning the resulting HTML page.
 - get_drug_page(drug): Searches for a consumer-friendly drug label on DailyMed and extracts readable content from the label's page, removing navigation and extraneous elements.
+- extract_section_text(content, tag, id=None, class_=None): Extracts the cleaned text of one section of a page, parsing only that section with lxml when it is installed.
 """
 
 
@@ -21,9 +22,139 @@ os.chdir(base_dir)
 sys.path.append(base_dir)
 
 #File specific imports
+import re
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse, parse_qs 
+try:
+    from lxml import etree
+except ImportError:
+    #Without lxml pages are parsed with BeautifulSoup's pure Python html.parser, same output only slower
+    etree = None
+from utils import cassette
+from utils.http_cache import HTTPCache
+
+
+WEB_CACHE_MAX_BYTES = int(float(os.getenv('web_cache_max_mb', 200)) * 1024 * 1024)
+WEB_CACHE_FRESH_SECONDS = int(os.getenv('web_cache_fresh_seconds', 24 * 60 * 60))
+
+#Search result and content pages, revalidated with ETag / Last-Modified once stale
+_pages = HTTPCache('web_pages', max_bytes=WEB_CACHE_MAX_BYTES, fresh_seconds=WEB_CACHE_FRESH_SECONDS)
+
+
+UNWANTED_TAGS = ["nav", "footer", "aside", "script", "style"]
+TEXT_TAGS = ["h1", "h2", "h3", "p", "ul", "ol"]
+#Everything after the first text containing this is dropped (reference lists)
+CUT_MARKER = "References"
+#Bytes fed to the incremental parser at a time, parsing stops once the section has been closed
+PARSE_CHUNK_SIZE = 16384
+
+
+def _http_get(url, headers):
+    """
+    GET a page and return its decoded text, from the conditional GET page cache (utils/http_cache.py) or through
+    the pooled per host client with timeouts and retries (utils/http_client.py).
+    Recorded or replayed when a cassette is active (utils/cassette.py).
+    """
+    return cassette.through('http', [url], lambda: _pages.get(url, headers=headers))
+
+
+def _section_start(content, tag, id=None, class_=None):
+    #Offset of the section's opening tag in the raw page, so parsing can start there. Like BeautifulSoup's class_=
+    #the class must be a whole entry of the class list ("drug-label-sections-wrapper" is not "drug-label-sections")
+    if id is not None:
+        attribute = r'\sid\s*=\s*["\']' + re.escape(id) + r'["\']'
+    else:
+        attribute = r'\sclass\s*=\s*["\'](?:[^"\']*\s)?' + re.escape(class_) + r'(?=[\s"\'])'
+    match = re.search(r'<' + tag + r'\b[^>]*' + attribute, content, re.IGNORECASE)
+    return match.start() if match else None
+
+
+def _parse_section(content, start, tag):
+    #Feed the page from the section's opening tag until the section's end tag has been parsed, the rest is never parsed
+    parser = etree.HTMLPullParser(events=('end',))
+    for offset in range(start, len(content), PARSE_CHUNK_SIZE):
+        parser.feed(content[offset:offset + PARSE_CHUNK_SIZE])
+        for _, elem in parser.read_events():
+            parent = elem.getparent()
+            if elem.tag == tag and parent is not None and parent.tag == 'body':
+                return elem
+    return parser.close().find('.//body/' + tag)
+
+
+def _section_text_lxml(section):
+    #One walk over the section: unwanted subtrees are skipped, text goes to every open TEXT_TAGS element
+    #and everything after the CUT_MARKER text is skipped (same output as the BeautifulSoup version)
+    blocks = []
+    open_blocks = []
+    cut = False
+
+    def add(text):
+        nonlocal cut
+        if text:
+            for parts in open_blocks:
+                parts.append(text)
+            if not cut and CUT_MARKER in text:
+                cut = True
+
+    def visit(elem):
+        #Comments and processing instructions have no string tag, only their tail is text
+        if cut or not isinstance(elem.tag, str) or elem.tag in UNWANTED_TAGS:
+            return
+        is_block = elem.tag in TEXT_TAGS
+        if is_block:
+            parts = []
+            blocks.append(parts)
+            open_blocks.append(parts)
+        add(elem.text)
+        for child in elem:
+            visit(child)
+            add(child.tail)
+        if is_block:
+            open_blocks.pop()
+
+    add(section.text)
+    for child in section:
+        visit(child)
+        add(child.tail)
+
+    texts = (" ".join(part.strip() for part in parts if part.strip()) for parts in blocks)
+    return "".join(f"{text}\n\n" for text in texts if text)
+
+
+def _section_text_bs4(content, tag, id=None, class_=None):
+    soup = BeautifulSoup(content, 'html.parser')
+    main_content = soup.find(tag, id=id) if id is not None else soup.find(tag, class_=class_)
+
+    # Remove unwanted elements
+    for unwanted in main_content.find_all(UNWANTED_TAGS):
+        unwanted.decompose()
+
+    # Optionally remove anything after 'References'
+    refs = main_content.find(string=lambda text: CUT_MARKER in text)
+    if refs:
+        for elem in refs.find_all_next():
+            elem.decompose()
+
+    # Convert remaining content to plain text with newlines for headings
+    texts = (elem.get_text(separator=" ",strip=True) for elem in main_content.find_all(TEXT_TAGS))
+    return "".join(f"{text}\n\n" for text in texts if text)
+
+
+def extract_section_text(content, tag, id=None, class_=None):
+    """
+    Plain text of the section <tag id=...> or <tag class=...> of a page: one paragraph per heading, paragraph and list,
+    without navigation, scripts and anything after the references. With lxml only the section itself is parsed,
+    otherwise (or if the section cannot be located in the raw page) the whole page is parsed with BeautifulSoup.
+    """
+    if etree is not None:
+        start = _section_start(content, tag, id=id, class_=class_)
+        if start is not None:
+            section = _parse_section(content, start, tag)
+            if section is not None:
+                return _section_text_lxml(section)
+    return _section_text_bs4(content, tag, id=id, class_=class_)
+
 
 #condition="Nash"
 def get_condition_page(condition):
@@ -34,9 +165,12 @@ def get_condition_page(condition):
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
     }
 
-    r=requests.get(url, headers=headers)
-    #Get the content of the response
-    content = r.content.decode('utf-8')
+    #Get the content of the response, a slow or failing NLM search should not fail the whole search
+    try:
+        content = _http_get(url, headers)
+    except requests.RequestException as e:
+        print(f'MedlinePlus search failed: {e}')
+        return 'Issue pulling page data for condition'
 
     #Extract ol class="results"
 
@@ -70,30 +204,11 @@ def get_condition_page(condition):
 
 
         #Now make a request to the first href
-        r = requests.get(url, headers=headers)
         #Get the content of the response
-        content = r.content.decode('utf-8')
+        content = _http_get(url, headers)
 
         #Extract div id="mplus-content"
-        soup = BeautifulSoup(content, 'html.parser')
-        main_content = soup.find('div', id='mplus-content')
-
-        # Remove unwanted elements
-        for unwanted in main_content.find_all(["nav", "footer", "aside", "script", "style"]):
-            unwanted.decompose()
-
-        # Optionally remove anything after 'References'
-        refs = main_content.find(string=lambda text: "References" in text)
-        if refs:
-            for elem in refs.find_all_next():
-                elem.decompose()
-
-        # Convert remaining content to plain text with newlines for headings
-        cleaned_text = ""
-        for elem in main_content.find_all(["h1", "h2", "h3", "p", "ul", "ol"]):
-            text = elem.get_text(separator=" ",strip=True)
-            if text:
-                cleaned_text += f"{text}\n\n"
+        cleaned_text = extract_section_text(content, 'div', id='mplus-content')
     except:
         cleaned_text='Issue pulling page data for condition'
     return cleaned_text
@@ -113,16 +228,20 @@ def get_drug_page(drug):
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
     }
 
-    r=requests.get(url, headers=headers)
-    #Get the content of the response
-    content = r.content.decode('utf-8')
-
-    #First check if there are any results
-    #Get result info
-    soup = BeautifulSoup(content, 'html.parser')
-
-    #First check if there are search results
-    results = soup.find('span', class_='count')
+    #Get the content of the response, a slow or failing DailyMed should not break the page
+    try:
+        content = _http_get(url, headers)
+    except requests.RequestException as e:
+        print(f'DailyMed search failed: {e}')
+        return 'No data for this drug',''
+
+    #First check if there are search results, a single match redirects straight to the label page
+    #which then does not need a full parse here
+    results = None
+    if _section_start(content, 'span', class_='count') is not None:
+        #Get result info
+        soup = BeautifulSoup(content, 'html.parser')
+        results = soup.find('span', class_='count')
     if results:
         num_results=int(results.text.replace("(",'').replace(')','').split(' ')[0])
         if num_results>0:
@@ -132,36 +251,18 @@ def get_drug_page(drug):
             new_url=results['href']
             url='https://dailymed.nlm.nih.gov'+new_url
             #Now get data from this url
-            r=requests.get(url, headers=headers)
             #Get the content of the response
-            content = r.content.decode('utf-8')
-            soup = BeautifulSoup(content, 'html.parser')
+            try:
+                content = _http_get(url, headers)
+            except requests.RequestException as e:
+                print(f'DailyMed label failed: {e}')
+                return 'No data for this drug',''
         else:
             #No Data!
             print('No data for this drug...')
             return 'No data for this drug',''
     #If there are no results check if there is drug-information
-
-    results = soup.find('div', class_='drug-label-sections')
-    #Extract the links from the results
-    main_content = results
-
-    # Remove unwanted elements
-    for unwanted in main_content.find_all(["nav", "footer", "aside", "script", "style"]):
-        unwanted.decompose()
-
-    # Optionally remove anything after 'References'
-    refs = main_content.find(string=lambda text: "References" in text)
-    if refs:
-        for elem in refs.find_all_next():
-            elem.decompose()
-
-    # Convert remaining content to plain text with newlines for headings
-    cleaned_text = ""
-    for elem in main_content.find_all(["h1", "h2", "h3", "p", "ul", "ol"]):
-        text = elem.get_text(separator=" ",strip=True)
-        if text:
-            cleaned_text += f"{text}\n\n"
+    cleaned_text = extract_section_text(content, 'div', class_='drug-label-sections')
 
     return cleaned_text,url
 
@@ -0,0 +1,97 @@
+"""
+local_synonyms.py
+
+This module expands a condition into synonyms without an LLM call, using the condition vocabulary active trials
+already use. The user's condition is embedded with the same sentence transformer as the trial conditions, its
+nearest neighbours are taken from the existing condition embedding matrix, and the neighbours are filtered down
+to a coherent cluster so loosely related conditions ("breast cancer" -> "lung cancer") are left out.
+
+Used by AgentCoordinator.get_synonyms when synonym_mode is 'local' or 'hybrid'.
+
+Functions:
+- expand_condition(condition): Returns (synonyms, top_similarity), synonyms starts with the condition itself like the Synonym Generator Agent's output.
+"""
+
+
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+base_dir = os.getenv('base_dir')
+#Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+
+#File specific imports
+import threading
+import numpy as np
+from agents.helpers import trial_filters
+
+
+#Neighbours taken from the condition matrix, and the similarity they need to count as a synonym
+NEIGHBOUR_COUNT = 30
+MIN_SIMILARITY = float(os.getenv('local_synonym_min_similarity', 0.75))
+#A neighbour is only kept if it is also this similar, on average, to the neighbours already kept
+MIN_CLUSTER_SIMILARITY = 0.65
+MAX_SYNONYMS = 10
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+
+def _normalized_condition_matrix():
+    """
+    Unit length numpy copy of the condition embeddings, so cosine similarity is a single matrix product.
+    """
+    global _matrix
+    if _matrix is None:
+        with _matrix_lock:
+            if _matrix is None:
+                embeddings = trial_filters.condition_embeddings
+                if hasattr(embeddings, 'cpu'):
+                    embeddings = embeddings.cpu().numpy()
+                embeddings = np.asarray(embeddings, dtype=np.float32)
+                _matrix = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True).clip(min=1e-12)
+    return _matrix
+
+
+def expand_condition(condition, neighbour_count=NEIGHBOUR_COUNT, min_similarity=MIN_SIMILARITY, max_synonyms=MAX_SYNONYMS):
+    """
+    Return ([condition] + synonyms, top_similarity) where synonyms are trial condition strings close to the
+    condition and to each other. top_similarity is the best neighbour's similarity, a confidence for hybrid mode.
+    """
+    matrix = _normalized_condition_matrix()
+    query = np.asarray(trial_filters.model.encode([condition], device=trial_filters.device), dtype=np.float32)[0]
+    query = query / max(np.linalg.norm(query), 1e-12)
+
+    similarities = matrix @ query
+    neighbour_count = min(neighbour_count, len(similarities))
+    candidates = np.argpartition(-similarities, neighbour_count - 1)[:neighbour_count]
+    candidates = candidates[np.argsort(-similarities[candidates])]
+    top_similarity = float(similarities[candidates[0]]) if len(candidates) else 0.0
+
+    synonyms = [condition]
+    seen = {condition.strip().lower()}
+    kept = []
+    for ind in candidates:
+        if similarities[ind] < min_similarity or len(synonyms) > max_synonyms:
+            break
+        name = str(trial_filters.conditions_df.iloc[ind]['condition'])
+        if name.strip().lower() in seen:
+            continue
+        #Keep the list a tight cluster around the query rather than a chain of loosely related conditions
+        if kept and float(np.mean(matrix[kept] @ matrix[ind])) < MIN_CLUSTER_SIMILARITY:
+            continue
+        seen.add(name.strip().lower())
+        kept.append(ind)
+        synonyms.append(name)
+
+    return synonyms, top_similarity
+
+
+#Example usage
+'''
+synonyms, confidence = expand_condition("MS")
+synonyms
+'''
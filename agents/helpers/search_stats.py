@@ -0,0 +1,56 @@
+"""
+search_stats.py
+
+This module keeps a running count of how often each trial shows up in users' search results, so offline jobs
+(e.g. scripts/precompute_trial_explanations.py) can prioritize the trials people are most likely to click.
+
+Functions:
+- record_search_results(nct_ids): Increments the counts for the trials returned by one search.
+- get_top_trials(n): Returns the n most frequently returned NCT IDs.
+"""
+
+
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+base_dir = os.getenv('base_dir')
+#Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+
+#File specific imports
+import sqlite3
+import threading
+from utils.cache_util import cache_dir
+
+
+stats_file = os.path.join(cache_dir, 'search_stats.sqlite')
+
+_lock = threading.Lock()
+os.makedirs(cache_dir, exist_ok=True)
+_conn = sqlite3.connect(stats_file, check_same_thread=False, timeout=30)
+_conn.execute('CREATE TABLE IF NOT EXISTS trial_hits (nct_id TEXT PRIMARY KEY, hits INTEGER NOT NULL)')
+_conn.commit()
+
+
+def record_search_results(nct_ids):
+    """
+    Count one appearance for each unique trial in a search's results.
+    """
+    with _lock:
+        _conn.executemany(
+            'INSERT INTO trial_hits (nct_id, hits) VALUES (?, 1) ON CONFLICT(nct_id) DO UPDATE SET hits = hits + 1',
+            [(nct_id,) for nct_id in set(nct_ids)]
+        )
+        _conn.commit()
+
+
+def get_top_trials(n):
+    """
+    Return the n NCT IDs that appeared in the most searches.
+    """
+    with _lock:
+        rows = _conn.execute('SELECT nct_id FROM trial_hits ORDER BY hits DESC LIMIT ?', (n,)).fetchall()
+    return [row[0] for row in rows]
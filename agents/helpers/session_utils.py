@@ -4,7 +4,8 @@ session_utils.py
 Session state management and navigation helpers for the Streamlit clinical trial search app.
 
 Functions:
-- initialize_session_state(): Initializes all session state keys with default values used throughout the app.
+- initialize_session_state(): Initializes all session state keys with default values used throughout the app,
+  and tags the run's LLM calls with the session and search ids (utils/llm_metrics.py).
 - go_back_to_search(): Resets the view to the search page and clears search status.
 - go_back_to_results(): Switches the current view to the results page without modifying state data.
 
@@ -13,6 +14,7 @@ This module helps maintain application state across user interactions and page t
 
 
 import streamlit as st
+from utils import llm_metrics
 
 def initialize_session_state():
     defaults = {
@@ -28,14 +30,20 @@ def initialize_session_state():
         'selected_trial_site': None,
         'selected_trial_markdown': None,
         'selected_drug_markdown': None,
+        'selected_drug_future': None,
         'selected_age_groups': ["Any"],
         'location_suggestions': [],
         'last_typed_location': '',
+        'session_id': llm_metrics.new_id(),
+        'search_id': None,
     }
 
     for key, value in defaults.items():
         st.session_state.setdefault(key, value)
 
+    #Tag this run's LLM calls with the session and current search
+    llm_metrics.set_context(session_id=st.session_state.session_id, search_id=st.session_state.search_id)
+
 # Helper functions
 def go_back_to_search():
     st.session_state.page = 'search'
@@ -0,0 +1,70 @@
+"""
+synonym_cache.py
+
+This module provides a persistent cache of generated condition synonyms so that the Synonym Generator Agent's
+LLM call is made once per condition rather than on every search. It also keeps results stable, the same
+condition now returns the same synonyms (and so the same trial list) every time.
+
+Entries are keyed by the normalized condition, expire after a TTL and live in an on-disk SQLite store bounded
+to a maximum number of entries (least recently used entries are evicted first), see utils/cache_util.py.
+
+Functions:
+- normalize_condition(condition): Normalizes a condition string into the cache key.
+- get_cached_synonyms(condition): Returns the cached synonym list for a condition, or None on a miss.
+- cache_synonyms(condition, synonyms): Stores the synonym list for a condition.
+"""
+
+
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+base_dir = os.getenv('base_dir')
+#Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+
+#File specific imports
+import re
+from utils.cache_util import PersistentCache, MISSING
+
+
+SYNONYM_TTL_SECONDS = int(os.getenv('synonym_cache_ttl_seconds', 30 * 24 * 60 * 60))
+SYNONYM_MAX_ENTRIES = int(os.getenv('synonym_cache_max_entries', 50000))
+
+_cache = PersistentCache('synonyms', ttl_seconds=SYNONYM_TTL_SECONDS, max_entries=SYNONYM_MAX_ENTRIES)
+
+
+def normalize_condition(condition):
+    """
+    Normalize a condition so "Breast Cancer " and "breast  cancer" share a cache entry.
+    """
+    condition = str(condition).strip().lower()
+    condition = re.sub(r'\s+', ' ', condition)
+    return condition
+
+
+def get_cached_synonyms(condition):
+    """
+    Return the cached synonyms for a condition with the condition itself first, or None on a miss.
+    """
+    synonyms = _cache.get(normalize_condition(condition))
+    if synonyms is MISSING:
+        return None
+    #The first entry is whatever the user typed, keep the current spelling
+    return [condition] + synonyms
+
+
+def cache_synonyms(condition, synonyms):
+    """
+    Store the generated synonyms for a condition. synonyms is the agent output, with the condition first.
+    """
+    _cache.set(normalize_condition(condition), list(synonyms[1:]))
+
+
+"""
+#Usage
+cache_synonyms('Breast Cancer', ['Breast Cancer', 'Mammary Carcinoma'])
+get_cached_synonyms('breast cancer')
+"""
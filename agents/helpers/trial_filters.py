@@ -7,10 +7,17 @@ geographic distance, age eligibility, and trial characteristics.
 Key Functions:
 - get_relevant_studies_from_conditions(): Uses sentence embedding similarity to identify trials matching input conditions.
 - get_sites_sorted_by_distance(): Finds clinical trial sites geographically close to a user's location.
+- get_sites_within_radius(): Radius query against the precomputed BallTree over all active facilities.
+- add_origin_distances(): Distance from each site to its nearest origin as one sites x origins haversine pass.
 - get_sites_sorted_by_distance_with_age_gender(): Adds age and gender filtering on top of distance-based site filtering.
 - get_trial_details(): Retrieves detailed metadata (design, eligibility, outcomes, contacts) for a specific trial.
+- get_trial_details_bulk(): Same details for many trials at once, used by batch jobs.
+- get_trial_about_text(): Plain text description of a trial (titles and interventions) straight from AACT.
+- get_trial_last_update(): Returns a trial's last update date, used to tell when cached explanations are stale.
 - parse_age(): Converts age strings (e.g. "18 Years") into numeric values.
+- parse_age_series(): Vectorized parse_age over a whole column.
 - determine_age_groups(): Categorizes trials by age eligibility groups (Child, Adult, Senior).
+- age_group_mask(): Vectorized age groups as a bitmask (see AGE_GROUP_BITS) for fast filtering.
 """
 
 
@@ -25,15 +32,14 @@ os.chdir(base_dir)
 sys.path.append(base_dir)
 
 #File specific imports
+import time
 import pandas as pd
 from utils import sql_util
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 from sentence_transformers import SentenceTransformer
 import torch
-from geopy.geocoders import Nominatim
-import random
-import string
+from agents.helpers import geocoding
 
 # Check if GPU is available
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
@@ -47,6 +53,26 @@ active_trials_w_conditions = active_trials_w_conditions_object['active_trials_w_
 conditions_df = active_trials_w_conditions_object['conditions_df']
 condition_embeddings = active_trials_w_conditions_object['condition_embeddings']
 
+#Spatial index over every recruiting facility of every active trial, built alongside the embeddings
+#by scripts/study_condition_embeddings_init.py. Without it we fall back to querying facilities per search.
+#Facility statuses change daily, an index older than this is ignored until the script is run again.
+FACILITY_INDEX_MAX_AGE_DAYS = float(os.getenv('facility_index_max_age_days', 7))
+facility_index_file = os.path.join(base_dir, 'data', 'active_facilities_index.pkl')
+active_facilities = None
+facility_tree = None
+if os.path.exists(facility_index_file):
+    facility_index_object = pd.read_pickle(facility_index_file)
+    #Indexes written before built_at was recorded count as stale
+    facility_index_age_days = (time.time() - facility_index_object.get('built_at', 0)) / (24 * 60 * 60)
+    if facility_index_age_days <= FACILITY_INDEX_MAX_AGE_DAYS:
+        active_facilities = facility_index_object['facilities']
+        facility_tree = facility_index_object['tree']
+    else:
+        print(f"Facility index is older than {FACILITY_INDEX_MAX_AGE_DAYS:g} days, querying AACT for sites instead. "
+              f"Rebuild it with scripts/study_condition_embeddings_init.py")
+
+EARTH_RADIUS_MILES = 3958.8
+
 
 """
 Function that takes in list of conditions and returns nct_ids that have conditions most similar to the input conditions.
@@ -100,52 +126,107 @@ def haversine(lat1, lon1, lat2, lon2):
     dlon = lon2 - lon1 
     a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
     c = 2 * np.arcsin(np.sqrt(a))
-    r = 3958.8  # Radius of earth in miles
+    r = EARTH_RADIUS_MILES  # Radius of earth in miles
     return c * r
 
-def generate_random_string(length=12):
-    chars = string.ascii_letters + string.digits
-    return ''.join(random.choices(chars, k=length))
 
-#print(generate_random_string())
+def add_origin_distances(sites, origin_lats, origin_lons):
+    """
+    Add each site's distance (miles) to its nearest origin and the index of that origin, computed in one
+    vectorized pass as a sites x origins haversine matrix.
+    """
+    if len(origin_lats) == 0:
+        raise ValueError("At least one origin is needed to compute site distances.")
+    site_lats = pd.to_numeric(sites['latitude'], errors='coerce').to_numpy(dtype=float)[:, np.newaxis]
+    site_lons = pd.to_numeric(sites['longitude'], errors='coerce').to_numpy(dtype=float)[:, np.newaxis]
+    origin_lats = np.asarray(origin_lats, dtype=float)[np.newaxis, :]
+    origin_lons = np.asarray(origin_lons, dtype=float)[np.newaxis, :]
+
+    distances = haversine(origin_lats, origin_lons, site_lats, site_lons)
+
+    sites['distance'] = distances.min(axis=1)
+    sites['nearest_origin_index'] = distances.argmin(axis=1)
+    return sites
+
+
+def get_sites_within_radius(nct_ids, latitudes, longitudes, max_distance=250):
+    """
+    Return the indexed facilities of the given trials within max_distance miles of any of the origins
+    (latitudes, longitudes), with distance and nearest_origin_index columns.
+    """
+    latitudes = np.atleast_1d(latitudes)
+    longitudes = np.atleast_1d(longitudes)
+    if latitudes.size == 0:
+        raise ValueError("At least one origin is needed to search for sites within a radius.")
+
+    # BallTree with the haversine metric works on [lat, lon] in radians, one radius query per origin
+    inds = facility_tree.query_radius(
+        np.radians(np.column_stack([latitudes, longitudes])), r=max_distance / EARTH_RADIUS_MILES
+    )
+    sites = active_facilities.iloc[np.unique(np.concatenate(inds))].copy()
+
+    # Intersect with the trials that matched the condition search
+    sites = sites[sites['nct_id'].isin(nct_ids)]
+
+    return add_origin_distances(sites, latitudes, longitudes).reset_index(drop=True)
 
 def get_sites_sorted_by_distance(trials, user_location, max_distance=250):
+    """
+    Get sites of the matching trials within max_distance miles, sorted by distance. user_location can be a single
+    location string or a list of them (e.g. two homes), in which case each site is measured to its nearest origin.
+    """
     #Now get sites associated with all of the trials
     matching_nct_ids = trials['nct_ids'].unique().tolist()
 
     if not matching_nct_ids:
         return pd.DataFrame()
 
-    matching_nct_ids = tuple(matching_nct_ids)
+    user_locations = [user_location] if isinstance(user_location, str) else list(user_location)
+    if not user_locations:
+        raise ValueError("No location was given. Please enter a location like 'City, State'.")
 
-    site_sql = f"""
-    SELECT * from facilities
-    WHERE nct_id IN {matching_nct_ids}
-    and status in ('ENROLLING_BY_INVITATION','NOT_YET_RECRUITING','RECRUITING')
-    """ 
-    sites = sql_util.get_table(site_sql)
+    # Geocode each location name to lat/lon (cached across searches and sessions)
+    origins = []
+    for loc in user_locations:
+        location = geocoding.geocode(loc)
 
-    # Create geolocator instance
-    user_agent_name=generate_random_string()    
-    geolocator = Nominatim(user_agent=user_agent_name)
+        # Check if geocoding was successful
+        if location is None:
+            raise ValueError(f"Could not geocode the location: '{loc}'. Please try a different format or a more general location like 'City, State'.")
 
-    # Geocode a location name to lat/lon
-    location = geolocator.geocode(user_location)
-    
-    # Check if geocoding was successful
-    if location is None:
-        raise ValueError(f"Could not geocode the location: '{user_location}'. Please try a different format or a more general location like 'City, State'.")
+        print(f"Address: {location.address}")
+        print(f"Latitude: {location.latitude}, Longitude: {location.longitude}")
+        origins.append(location)
+
+    origin_lats = [o.latitude for o in origins]
+    origin_lons = [o.longitude for o in origins]
+
+    if facility_tree is not None:
+        # One radius query per origin against the precomputed index instead of fetching and scanning every site
+        sites = get_sites_within_radius(matching_nct_ids, origin_lats, origin_lons, max_distance)
+    else:
+        # Facilities, studies and eligibilities in one joined round trip
+        # Same facility filter the index was built with, so results do not depend on whether it exists
+        site_sql = sql_util.get_site_search_query(f"""
+        f.nct_id IN {sql_util.format_in_list(matching_nct_ids)}
+        and {sql_util.ACTIVE_FACILITY_FILTER}
+        """)
+        sites = sql_util.get_table(site_sql)
 
-    print(f"Address: {location.address}")
-    print(f"Latitude: {location.latitude}, Longitude: {location.longitude}")
+        # Calculate distances to the nearest origin
+        sites = add_origin_distances(sites, origin_lats, origin_lons)
 
-    # Calculate distances
-    sites['distance'] = haversine(location.latitude, location.longitude, sites['latitude'], sites['longitude'])
+        # Filter by distance
+        sites = sites[sites['distance'] <= max_distance]
 
-    # Filter by distance and limit to 100 closest
-    sites = sites[sites['distance'] <= max_distance]
+    # Limit to 100 closest
     sites = sites.sort_values(by='distance').head(100).reset_index(drop=True)
 
+    # Label which origin each site is closest to when searching around several locations
+    if len(user_locations) > 1:
+        sites['nearest_origin'] = [user_locations[i] for i in sites['nearest_origin_index']]
+    sites = sites.drop(columns=['nearest_origin_index'])
+
 
     # Drop rows where distance could not be computed
     sites = sites.dropna(subset=['distance'])
@@ -153,18 +234,6 @@ def get_sites_sorted_by_distance(trials, user_location, max_distance=250):
     sites = sites.sort_values(by='distance')
     sites.reset_index(drop=True, inplace=True)
 
-    #Now get relevant study details per
-    
-    study_details_sql=f"""
-    SELECT * from studies
-    WHERE nct_id IN {matching_nct_ids}
-    """ 
-    study_details=sql_util.get_table(study_details_sql)
-    study_details
-
-    #Merge to get proper columns
-    sites=sites.merge(study_details[['nct_id','phase','study_type','overall_status']],on='nct_id')
-
     return sites
 
 
@@ -230,6 +299,64 @@ def get_trial_details(study_site_pair):
 
     return out
 
+def get_trial_details_bulk(nct_ids):
+    """
+    Same tables as get_trial_details for many trials at once, one query per table instead of seven per trial.
+    Returns a dict of nct_id -> trial details dict.
+    """
+    in_list = sql_util.format_in_list(nct_ids)
+    table_sqls = {
+        'study_details': f"SELECT * from studies WHERE nct_id IN {in_list}",
+        'eligibilities': f"SELECT * from eligibilities WHERE nct_id IN {in_list}",
+        'designs': f"SELECT * from designs WHERE nct_id IN {in_list}",
+        'design_groups': f"SELECT * from design_groups WHERE nct_id IN {in_list}",
+        'interventions': f"SELECT * from interventions WHERE nct_id IN {in_list}",
+        'design_outcomes': f"select * from design_outcomes where nct_id IN {in_list} and outcome_type='primary'",
+        'central_contacts': f"SELECT * from central_contacts WHERE nct_id IN {in_list}",
+    }
+
+    out = {nct_id: {} for nct_id in nct_ids}
+    for key, sql in table_sqls.items():
+        table = sql_util.get_table(sql)
+        groups = {nct_id: group.reset_index(drop=True) for nct_id, group in table.groupby('nct_id')}
+        for nct_id in nct_ids:
+            out[nct_id][key] = groups.get(nct_id, table.iloc[:0])
+
+    return out
+
+def get_trial_about_text(trial_dfs):
+    """
+    Plain text description of a trial built straight from AACT (titles and interventions), so work that only
+    needs to know what is being tested can start without waiting for the Trial Explainer Agent.
+    """
+    study_details = trial_dfs['study_details']
+    interventions = trial_dfs['interventions']
+
+    lines = []
+    if not study_details.empty:
+        lines.append(f"Title: {study_details.loc[0]['brief_title']}")
+        lines.append(f"Official title: {study_details.loc[0]['official_title']}")
+    if not interventions.empty:
+        lines.append("Interventions:")
+        for intervention_type, name, description in zip(interventions['intervention_type'], interventions['name'], interventions['description']):
+            lines.append(f"- {intervention_type}: {name}" + (f" ({description})" if pd.notna(description) and description else ""))
+
+    return "\n".join(lines)
+
+def get_trial_last_update(nct_id, study_details=None):
+    """
+    Return the trial's last update date as a string. Uses an already fetched studies row when given,
+    otherwise runs a single lightweight query.
+    """
+    if study_details is None:
+        study_details=sql_util.get_table(f"""
+        SELECT last_update_posted_date from studies
+        WHERE nct_id = '{nct_id}'
+        """)
+    if study_details.empty:
+        return None
+    return str(study_details.loc[0]['last_update_posted_date'])
+
 # Helper function to parse age strings into numeric values
 def parse_age(age_string):
     """Parse age string into a numeric value in years."""
@@ -259,80 +386,91 @@ def parse_age(age_string):
         return None
     
 
+def parse_age_series(age_strings):
+    """
+    Vectorized parse_age over a Series of age strings. Returns ages in years, NaN where missing or unparseable.
+    """
+    parts = age_strings.astype(str).str.extract(r'^\s*(\d+(?:\.\d+)?)\s+([A-Za-z]+)')
+    values = pd.to_numeric(parts[0], errors='coerce')
+    unit = parts[1].str.lower()
+
+    # Years keep their value, anything under a year is treated as 0 years
+    is_years = unit.str.match('year').fillna(False).to_numpy(dtype=bool)
+    is_sub_year = unit.str.match('(month|week|day)').fillna(False).to_numpy(dtype=bool)
+
+    return pd.Series(np.select([is_years, is_sub_year], [values, 0], default=np.nan), index=age_strings.index)
+
+
+# Age groups are stored as a small bitmask so UI filters are a single bitwise AND
+AGE_GROUP_CHILD = 1
+AGE_GROUP_ADULT = 2
+AGE_GROUP_SENIOR = 4
+
+AGE_GROUP_BITS = {
+    "Child: 0-17": AGE_GROUP_CHILD,
+    "Adult: 18-64": AGE_GROUP_ADULT,
+    "Senior: 65+": AGE_GROUP_SENIOR,
+}
+
+# Display strings for every possible mask value
+AGE_GROUP_LABELS = [
+    ", ".join(label for label, bit in AGE_GROUP_BITS.items() if mask & bit)
+    for mask in range(8)
+]
+
+
+def age_group_mask(min_age_vals, max_age_vals):
+    """
+    Vectorized age group bitmask from numeric min/max ages (missing ages already filled with 0 and 120).
+    A maximum age of 0 (under a year, e.g. "6 Months") counts as no upper limit, as determine_age_groups always did.
+    """
+    min_age_vals = np.asarray(min_age_vals, dtype=float)
+    max_age_vals = np.asarray(max_age_vals, dtype=float)
+    max_age_vals = np.where(max_age_vals == 0, 120, max_age_vals)
+
+    mask = np.zeros(len(min_age_vals), dtype=np.uint8)
+    # Child: 0-17
+    mask |= np.where((min_age_vals <= 17) & (max_age_vals >= 0), AGE_GROUP_CHILD, 0).astype(np.uint8)
+    # Adult: 18-64
+    mask |= np.where((min_age_vals <= 65) & (max_age_vals >= 18), AGE_GROUP_ADULT, 0).astype(np.uint8)
+    # Senior: 65+
+    mask |= np.where(max_age_vals >= 65, AGE_GROUP_SENIOR, 0).astype(np.uint8)
+    return mask
+
+
 def determine_age_groups(min_age, max_age):
     """
     Determine which age groups a trial belongs to based on min and max ages.
     Returns a list of applicable age groups.
     """
-    # Parse ages to integers, handling None values
+    # Parse ages to numbers, missing ages (and a maximum under a year) mean no limit
     min_age_val = 0 if min_age is None else parse_age(min_age) or 0
     max_age_val = 120 if max_age is None else parse_age(max_age) or 120
-    
-    groups = []
-    
-    # Child: 0-17
-    if min_age_val <= 17 and max_age_val >= 0:
-        groups.append("Child: 0-17")
-    
-    # Adult: 18-64
-    if min_age_val <= 65 and max_age_val >= 18:
-        groups.append("Adult: 18-64")
-    
-    # Senior: 65+
-    if max_age_val >= 65:
-        groups.append("Senior: 65+")
-    
-    return groups
+
+    mask = int(age_group_mask([min_age_val], [max_age_val])[0])
+    return [label for label, bit in AGE_GROUP_BITS.items() if mask & bit]
 
     
 def get_sites_sorted_by_distance_with_age_gender(trials, user_location, max_distance=250):
     """Get sites sorted by distance and include age eligibility information"""
-    # First get the regular sorted sites
+    # Sorted sites already carry the study and eligibility columns from the joined site search
     sites = get_sites_sorted_by_distance(trials, user_location, max_distance)
 
     if sites.empty:
         return sites
     
-    # Get unique NCT IDs from the sites
-    matching_nct_ids = tuple(sites['nct_id'].unique().tolist())
-    
-    # Fetch eligibility data for these trials
-    if len(matching_nct_ids) == 1:
-        # Handle the case of a single NCT ID differently to avoid SQL syntax errors
-        nct_id = matching_nct_ids[0]
-        eligibilities_sql = f"""
-        SELECT nct_id, gender, minimum_age, maximum_age 
-        FROM eligibilities
-        WHERE nct_id = '{nct_id}'
-        """
-    else:
-        eligibilities_sql = f"""
-        SELECT nct_id, gender, minimum_age, maximum_age 
-        FROM eligibilities
-        WHERE nct_id IN {matching_nct_ids}
-        """
-    
-    eligibilities = sql_util.get_table(eligibilities_sql)
-    
-    # Merge the eligibility data with sites
-    sites = sites.merge(eligibilities[['nct_id', 'minimum_age', 'maximum_age', 'gender']], 
-                        on='nct_id', how='left')
-    
     # Parse age values
-    sites['min_age_val'] = sites['minimum_age'].apply(parse_age).fillna(0)
-    sites['max_age_val'] = sites['maximum_age'].apply(parse_age).fillna(120)
+    sites['min_age_val'] = parse_age_series(sites['minimum_age']).fillna(0)
+    sites['max_age_val'] = parse_age_series(sites['maximum_age']).fillna(120)
     sites['gender'] = sites['gender'].fillna('ALL')
     
     # Create human-readable age range column
-    sites['age_range'] = sites.apply(
-        lambda row: f"{row['minimum_age'] if pd.notna(row['minimum_age']) else 'Any'} to {row['maximum_age'] if pd.notna(row['maximum_age']) else 'Any'}", 
-        axis=1
+    sites['age_range'] = (
+        sites['minimum_age'].fillna('Any').astype(str) + ' to ' + sites['maximum_age'].fillna('Any').astype(str)
     )
     
-    # Determine age groups for filtering
-    sites['age_groups'] = sites.apply(
-        lambda row: determine_age_groups(row['minimum_age'], row['maximum_age']), 
-        axis=1
-    )
+    # Determine age groups for filtering (bitmask) and display
+    sites['age_group_mask'] = age_group_mask(sites['min_age_val'], sites['max_age_val'])
+    sites['age_groups'] = [AGE_GROUP_LABELS[mask] for mask in sites['age_group_mask']]
     
     return sites
\ No newline at end of file
@@ -0,0 +1,232 @@
+"""
+trial_payload.py
+
+This module builds the trial payload the Trial Explainer Agent sends to the LLM, keeping it under a token budget.
+Some trials have eligibility criteria that run to thousands of tokens, which made the explainer call slow and
+expensive, so the payload is cleaned, deduplicated and then trimmed until it fits, and everything that was
+cut is recorded in a report.
+
+Trimming happens in stages, each only if the payload is still over budget:
+1. Long arm and intervention descriptions are truncated.
+2. Long individual criteria lines are truncated.
+3. Criteria lines are dropped from the end of the longest section (inclusion or exclusion).
+4. Arm and intervention descriptions are dropped.
+
+Functions:
+- parse_criteria(criteria): Splits the AACT criteria text into sections of cleaned, deduplicated lines.
+- build_trial_payload(trial_dfs, token_budget): Returns (payload, report) for a trial's details from trial_filters.get_trial_details.
+"""
+
+
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+base_dir = os.getenv('base_dir')
+#Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+
+#File specific imports
+import re
+import json
+import pandas as pd
+from utils.openai_util import count_tokens, truncate_to_tokens
+
+
+PAYLOAD_TOKEN_BUDGET = int(os.getenv('explainer_payload_token_budget', 2500))
+DESCRIPTION_TOKEN_LIMIT = 80
+CRITERIA_LINE_TOKEN_LIMIT = 60
+
+#Bump when the payload format or trimming changes, explanations built from an older payload are regenerated
+PAYLOAD_VERSION = 1
+
+
+def _clean_text(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    value = re.sub(r'\s+', ' ', str(value)).strip()
+    return value or None
+
+
+def parse_criteria(criteria):
+    """
+    Split AACT criteria text into [[header, [lines]], ...]. Bullets are stripped, whitespace collapsed and
+    repeated lines (which are common in copy pasted criteria) removed.
+    """
+    sections = [['', []]]
+    seen = set()
+    for raw_line in str(criteria or '').splitlines():
+        line = _clean_text(re.sub(r'^\s*(?:[*\-•]|\d+[.)])\s*', '', raw_line))
+        if not line:
+            continue
+        if re.fullmatch(r'[A-Za-z ]*criteria:?', line, flags=re.IGNORECASE):
+            sections.append([line.rstrip(':'), []])
+            continue
+        key = line.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        sections[-1][1].append(line)
+    return [section for section in sections if section[1]]
+
+
+def _format_criteria(sections):
+    parts = []
+    for header, lines in sections:
+        if header:
+            parts.append(f"{header}:")
+        parts.extend(f"- {line}" for line in lines)
+    return "\n".join(parts)
+
+
+def _records(df, columns, key_columns):
+    #Clean each record and drop repeats of the same key (e.g. an intervention listed once per arm)
+    records = []
+    seen = set()
+    for record in df[columns].to_dict('records'):
+        record = {column: _clean_text(record[column]) for column in columns}
+        key = tuple((record[column] or '').lower() for column in key_columns)
+        if key in seen:
+            continue
+        seen.add(key)
+        records.append(record)
+    return records
+
+
+def _assemble(base, criteria_sections, arms, interventions):
+    payload = dict(base)
+    payload['eligibility_criteria'] = _format_criteria(criteria_sections)
+    payload['arms'] = arms
+    payload['interventions'] = interventions
+    return payload
+
+
+def _payload_tokens(payload):
+    return count_tokens(json.dumps(payload, indent=2))
+
+
+def _truncate_descriptions(records, max_tokens):
+    truncated = 0
+    for record in records:
+        if record.get('description') and count_tokens(record['description']) > max_tokens:
+            record['description'] = truncate_to_tokens(record['description'], max_tokens)
+            truncated += 1
+    return truncated
+
+
+def build_trial_payload(trial_dfs, token_budget=PAYLOAD_TOKEN_BUDGET):
+    """
+    Build the LLM payload for a trial, trimmed to token_budget tokens.
+    Returns (payload, report) where report has tokens_before, tokens_after, token_budget and a list of what was dropped.
+    """
+    study_details = trial_dfs['study_details']
+    eligibilities = trial_dfs['eligibilities']
+    designs = trial_dfs['designs']
+    design_groups = trial_dfs['design_groups']
+    interventions_df = trial_dfs['interventions']
+    design_outcomes = trial_dfs['design_outcomes']
+
+    base = {
+        "brief_summary": _clean_text(study_details.loc[0]["brief_title"]),
+        "official_title": _clean_text(study_details.loc[0]["official_title"]),
+        "gender": _clean_text(eligibilities.loc[0]['gender']),
+        "minimum_age": _clean_text(eligibilities.loc[0]['minimum_age']),
+        "maximum_age": _clean_text(eligibilities.loc[0]['maximum_age']),
+        "design_details": {
+            "allocation": _clean_text(designs.loc[0]['allocation']),
+            "intervention_model": _clean_text(designs.loc[0]['intervention_model']),
+            "masking": _clean_text(designs.loc[0]['masking']),
+            "primary_purpose": _clean_text(designs.loc[0]['primary_purpose'])
+        },
+        "primary_outcome_measurements": [
+            {
+            "measure": _clean_text(design_outcomes.loc[0]['measure']),
+            "time_frame": _clean_text(design_outcomes.loc[0]['time_frame'])
+            }
+        ] if not design_outcomes.empty else []
+    }
+
+    raw_criteria = eligibilities.loc[0]["criteria"]
+    report = {
+        'token_budget': token_budget,
+        'tokens_before': count_tokens(json.dumps({
+            **base,
+            'eligibility_criteria': raw_criteria,
+            'arms': design_groups[['group_type','title','description']].to_json(orient='records'),
+            'interventions': interventions_df[['intervention_type','name','description']].to_json(orient='records'),
+        }, indent=2, default=str)),
+        'dropped': [],
+    }
+
+    criteria_sections = parse_criteria(raw_criteria)
+    arms = _records(design_groups, ['group_type','title','description'], ['group_type','title','description'])
+    interventions = _records(interventions_df, ['intervention_type','name','description'], ['intervention_type','name'])
+
+    duplicate_arms = len(design_groups) - len(arms)
+    duplicate_interventions = len(interventions_df) - len(interventions)
+    if duplicate_arms:
+        report['dropped'].append(f"{duplicate_arms} duplicate arms")
+    if duplicate_interventions:
+        report['dropped'].append(f"{duplicate_interventions} duplicate interventions")
+
+    payload = _assemble(base, criteria_sections, arms, interventions)
+    tokens = _payload_tokens(payload)
+
+    #1. Truncate long arm and intervention descriptions
+    if tokens > token_budget:
+        truncated = _truncate_descriptions(arms, DESCRIPTION_TOKEN_LIMIT) + _truncate_descriptions(interventions, DESCRIPTION_TOKEN_LIMIT)
+        if truncated:
+            report['dropped'].append(f"{truncated} arm/intervention descriptions truncated to {DESCRIPTION_TOKEN_LIMIT} tokens")
+            payload = _assemble(base, criteria_sections, arms, interventions)
+            tokens = _payload_tokens(payload)
+
+    #2. Truncate long criteria lines
+    if tokens > token_budget:
+        truncated = 0
+        for section in criteria_sections:
+            for i, line in enumerate(section[1]):
+                if count_tokens(line) > CRITERIA_LINE_TOKEN_LIMIT:
+                    section[1][i] = truncate_to_tokens(line, CRITERIA_LINE_TOKEN_LIMIT)
+                    truncated += 1
+        if truncated:
+            report['dropped'].append(f"{truncated} criteria lines truncated to {CRITERIA_LINE_TOKEN_LIMIT} tokens")
+            payload = _assemble(base, criteria_sections, arms, interventions)
+            tokens = _payload_tokens(payload)
+
+    #3. Drop criteria lines from the end of the longest section. Each line's tokens are counted once and the
+    #   payload recounted after each pass, since the per line counts slightly underestimate the JSON
+    dropped_lines = [0] * len(criteria_sections)
+    while tokens > token_budget and any(lines for _, lines in criteria_sections):
+        line_tokens = [[count_tokens(line) + 3 for line in lines] for _, lines in criteria_sections]
+        while tokens > token_budget and any(line_tokens):
+            longest = max(range(len(line_tokens)), key=lambda i: sum(line_tokens[i]))
+            tokens -= line_tokens[longest].pop()
+            criteria_sections[longest][1].pop()
+            dropped_lines[longest] += 1
+        payload = _assemble(base, criteria_sections, arms, interventions)
+        tokens = _payload_tokens(payload)
+    for (header, _), count in zip(criteria_sections, dropped_lines):
+        if count:
+            report['dropped'].append(f"{count} {(header or 'criteria').lower()} lines")
+
+    #4. Drop arm and intervention descriptions
+    if tokens > token_budget:
+        for record in arms + interventions:
+            record['description'] = None
+        report['dropped'].append("arm and intervention descriptions")
+        payload = _assemble(base, criteria_sections, arms, interventions)
+        tokens = _payload_tokens(payload)
+
+    report['tokens_after'] = tokens
+    return payload, report
+
+
+#Example usage
+'''
+from agents.helpers import trial_filters
+trial_dfs = trial_filters.get_trial_details_bulk(['NCT04929210'])['NCT04929210']
+payload, report = build_trial_payload(trial_dfs, token_budget=1500)
+report
+'''
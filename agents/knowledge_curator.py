@@ -7,6 +7,8 @@ by generating patient-friendly educational content about both medical conditions
 Core Methods:
 - curate_medical_page(condition): Generates a readable, structured summary and essential links for a given condition.
 - generate_drug_markdown_from_trial_about(trial_about_text): Determines if a trial is drug-related and creates appropriate Markdown content.
+- identify_drug_study(trial_about_text): Asks the LLM whether a trial tests a specific drug and which one.
+- generate_no_drug_markdown(decision): Creates the Markdown shown when no specific drug is being studied.
 - curate_drug_page(drug_name): Retrieves and summarizes consumer-oriented drug information from trusted sources like DailyMed.
 """
 
@@ -129,7 +131,8 @@ class KnowledgeCuratorAgent:
             }
         ]
 
-        response = self.client.chat.completions.create(
+        response = openai_util.create_chat_completion(
+            self.client, 'knowledge_curator',
 
             messages=messages,
             temperature=0.7,
@@ -176,6 +179,20 @@ class KnowledgeCuratorAgent:
 
     def generate_drug_markdown_from_trial_about(self,trial_about_text):
 
+        decision = self.identify_drug_study(trial_about_text)
+        # Now decide what markdown to return
+        if decision.get("is_drug_study", False):
+            # Normal drug info flow
+            return self.curate_drug_page(decision['drug_name'])
+        # No drug is being studied
+        return self.generate_no_drug_markdown(decision)
+
+    def identify_drug_study(self, trial_about_text):
+        """
+        Asks the LLM whether a study tests a specific drug, returns the decision dict
+        (is_drug_study, drug_name, reason_if_no_drug).
+        """
+
         system_message = {
             "role": "system",
             "content": "You are a clinical trial explainer. Determine if a study is testing a specific drug based on the study description. If yes, explain about the drug. If not, explain that no specific drug is being tested."
@@ -201,7 +218,8 @@ class KnowledgeCuratorAgent:
             }
         ]
 
-        response = self.client.chat.completions.create(
+        response = openai_util.create_chat_completion(
+            self.client, 'knowledge_curator',
             model=azure_deployment,
             messages=[system_message, user_message],
             functions=functions,
@@ -212,17 +230,16 @@ class KnowledgeCuratorAgent:
 
         decision = json.loads(response.choices[0].message.function_call.arguments)
         print(decision)
-        # Now decide what markdown to return
-        md = []
+        return decision
 
-        if decision.get("is_drug_study", False):
-            # Normal drug info flow
-            md.append(self.curate_drug_page(decision['drug_name']))
-        else:
-            # No drug is being studied
-            md.append("## 💬 No Specific Drug Being Studied\n")
-            reason = decision.get("reason_if_no_drug", "This study focuses on something other than testing a drug.")
-            md.append(f"{reason}\n")
+    def generate_no_drug_markdown(self, decision):
+        """
+        Markdown for a study that does not test a specific drug.
+        """
+        md = []
+        md.append("## 💬 No Specific Drug Being Studied\n")
+        reason = decision.get("reason_if_no_drug", "This study focuses on something other than testing a drug.")
+        md.append(f"{reason}\n")
 
         return "\n".join(md).strip()
 
@@ -260,7 +277,8 @@ class KnowledgeCuratorAgent:
             }
         ]
 
-        response = self.client.chat.completions.create(
+        response = openai_util.create_chat_completion(
+            self.client, 'knowledge_curator',
             model=azure_deployment,
             messages=[system_message, user_message],
             functions=functions,
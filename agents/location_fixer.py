@@ -5,6 +5,9 @@ This module defines the `LocationFixerAgent` class, which standardizes and corre
 
 Core Method:
 - fix_location(location_text): Accepts a free-text location input and returns a corrected, standardized U.S. location or '-1' if invalid.
+
+Inputs the local gazetteer resolves confidently (state names and abbreviations, "City, ST", ZIP codes and small
+typos in them) are answered without an LLM call, see agents/helpers/gazetteer.py.
 """
 
 
@@ -22,23 +25,35 @@ sys.path.append(base_dir)
 from utils import openai_util
 import json
 
+#Load in agent helpers
+from agents.helpers import gazetteer
+
 
 azure_model_name = "gpt-4o-mini"
 azure_deployment = "gpt-4o-mini"
 #github_model_name = "openai/gpt-4o-mini"
 
+#Gazetteer matches scoring at least this are used as is, anything less goes to the LLM (same cutoff as geocoding)
+LOCAL_MIN_SCORE = gazetteer.MIN_SCORE
+
 class LocationFixerAgent:
     def __init__(self):
         """
         Initialize the LocationFixerAgent.
         """
+        self.client = openai_util.get_azure_openai_client()
 
     def fix_location(self,location_text):
         """
         Function to correct and format a free-text U.S. location input into a properly structured United States location.
         If the input is not a valid U.S. location, return '-1'.
         """
-        client = openai_util.get_azure_openai_client()
+        #Fast path, most inputs are a state, a city and state or a ZIP code the gazetteer knows
+        local_location = self.fix_location_locally(location_text)
+        if local_location is not None:
+            return local_location
+
+        client = self.client
 
         system_message = """
         You are a helpful assistant that corrects user-entered location text to valid United States city or state names.
@@ -70,7 +85,8 @@ class LocationFixerAgent:
             }
         ]
 
-        response = client.chat.completions.create(
+        response = openai_util.create_chat_completion(
+            client, 'location_fixer',
             messages=messages,
             functions=functions,
             function_call={"name": "get_location"},
@@ -86,6 +102,16 @@ class LocationFixerAgent:
             return output_data.get('location', None)
         except (KeyError, json.JSONDecodeError, AttributeError):
             return None
+
+    def fix_location_locally(self,location_text):
+        """
+        Resolve the location with the local gazetteer in the same format the LLM returns
+        ("Boston, Massachusetts", "Pennsylvania" or a ZIP code), or None when the match is not confident.
+        """
+        match = gazetteer.lookup(location_text)
+        if match is None or match.score < LOCAL_MIN_SCORE:
+            return None
+        return match.name
     
 
 """
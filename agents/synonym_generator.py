@@ -34,13 +34,14 @@ class SynonymGeneratorAgent:
         """
         Initialize the SynonymGeneratorAgent.
         """
+        self.client = openai_util.get_azure_openai_client()
 
     def generate_synonyms(self,disease_description):
         """
         Function to generate synonyms for a disease name using the OpenAI API.
         """
-        # Get the OpenAI client
-        client = openai_util.get_azure_openai_client()
+        # Get the shared OpenAI client
+        client = self.client
 
         # Define the messages
         system_message = """
@@ -82,7 +83,8 @@ class SynonymGeneratorAgent:
         ]
 
         # Make the API call
-        response = client.chat.completions.create(
+        response = openai_util.create_chat_completion(
+            client, 'synonym_generator',
             messages=messages,
                 max_tokens=4096,
                 temperature=1.0,
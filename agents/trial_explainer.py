@@ -6,6 +6,9 @@ of clinical trials using structured data retrieved from the AACT database.
 
 Core Methods:
 - explain_trial(study_site_pair): Returns a structured explanation dictionary for a trial at a given site.
+- summarize_trial(nct_id, trial_dfs): Returns the trial level part of the explanation (cached by the explanation store).
+- summarize_trial_stream(nct_id, trial_dfs): Yields the trial level explanation section by section as the LLM streams it.
+- add_site_details(trial_summary, study_site_pair): Adds the selected site's details to a trial level summary.
 - generate_trial_markdown(trial_data): Converts the structured explanation into clean, readable Markdown with patient-friendly formatting.
 """
 
@@ -23,159 +26,188 @@ sys.path.append(base_dir)
 
 #File specific imports
 from utils import openai_util
+from utils.json_stream import TopLevelFieldParser
 import json
+import hashlib
 
 #Load in agent helpers
 from agents.helpers import trial_filters
+from agents.helpers import trial_payload as trial_payload_builder
 
 
 
 azure_model_name = "gpt-4o-mini"
 azure_deployment = "gpt-4o-mini"
 
+SYSTEM_MESSAGE = "You are a clinical trial explainer agent tasked with summarizing and structuring trial information for patients."
+
+TRIAL_SUMMARY_FUNCTIONS = [
+    {
+        "name": "generate_patient_friendly_trial_summary",
+        "description": "Creates a clear and easy-to-understand structured summary from clinical trial data, written for a patient audience.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "what_is_this_study_about": {
+                    "type": "string",
+                    "description": "In 2-4 sentences, clearly explain the main goal of this study. Include the condition being studied and what the study hopes to find out. Use simple, reassuring language appropriate for patients."
+                },
+                "who_can_join_this_study": {
+                    "type": "object",
+                    "properties": {
+                        "inclusion_criteria": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "List of simple, patient-friendly bullet points summarizing who CAN join the study based on inclusion criteria."
+                        },
+                        "exclusion_criteria": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "List of simple, patient-friendly bullet points summarizing who CANNOT join the study based on exclusion criteria."
+                        }
+                    },
+                    "description": "Summarizes the eligibility criteria into two friendly lists: who can and who cannot join the study."
+                },
+                "what_happens_in_this_study": {
+                    "type": "object",
+                    "properties": {
+                        "summary_of_activities": {
+                            "type": "string",
+                            "description": "Brief paragraph (3-6 sentences) explaining what participants will do during the study. Include how treatments are given, how long it lasts, any important study procedures (like blood tests), and any important outcome goals. Focus on what the participant experience will be like."
+                        }
+                    },
+                    "description": "Summarizes the design, treatments, activities, and duration of participation into a single, easy-to-read paragraph."
+                }
+            },
+            "required": [
+                "what_is_this_study_about",
+                "who_can_join_this_study",
+                "what_happens_in_this_study"
+            ]
+        }
+    }
+]
+
+#Hash of everything that shapes the LLM output, cached explanations made with a different prompt are stale
+PROMPT_VERSION = hashlib.sha256(
+    json.dumps([azure_deployment, SYSTEM_MESSAGE, TRIAL_SUMMARY_FUNCTIONS,
+                trial_payload_builder.PAYLOAD_VERSION, trial_payload_builder.PAYLOAD_TOKEN_BUDGET], sort_keys=True).encode('utf-8')
+).hexdigest()[:16]
+
 class TrialExplainerAgent:
-    def __init__(self):
+    def __init__(self, client=None):
         """
-        Initialize the TrialExplainerAgent.
+        Initialize the TrialExplainerAgent. client overrides the shared Azure OpenAI client (e.g. a stub for testing).
         """
+        self.client = client if client is not None else openai_util.get_azure_openai_client()
 
-    def explain_trial(self,study_site_pair):
+    def explain_trial(self,study_site_pair,trial_dfs=None):
         """
-        Function to generate synonyms for a disease name using the OpenAI API.
+        Generate a structured, patient-friendly explanation of the trial at the given study site pair.
+        trial_dfs can be passed in when the trial details were already fetched with trial_filters.get_trial_details.
         """
-        # Get the OpenAI client
-        client = openai_util.get_azure_openai_client()
+        if trial_dfs is None:
+            trial_dfs=trial_filters.get_trial_details(study_site_pair)
 
+        trial_summary=self.summarize_trial(study_site_pair['nct_id'],trial_dfs)
 
-        trial_dfs=trial_filters.get_trial_details(study_site_pair)
-        study_details=trial_dfs['study_details']
-        trial_dfs.keys()
-        eligibilities=trial_dfs['eligibilities']
-        designs=trial_dfs['designs']
-        design_groups=trial_dfs['design_groups']
-        interventions=trial_dfs['interventions']
-        design_outcomes=trial_dfs['design_outcomes']
-        central_contacts=trial_dfs['central_contacts']
+        return self.add_site_details(trial_summary,study_site_pair)
 
-        #1. Trial name and link to study on clinical trial .gov
-        trial_name = study_details['brief_title'].values[0]
-        trial_link = f"https://clinicaltrials.gov/study/{study_site_pair['nct_id']}"
-
-        #2-4 are generated from LLM tool calling so we send payload of
-        #  the study details for it to parse
-
-
-
-        arm_payload=design_groups[['group_type','title','description']].to_json(orient='records')
-        interventions_payload=interventions[['intervention_type','name','description']].to_json(orient='records')
-
-        trial_payload={
-        "brief_summary": study_details.loc[0]["brief_title"],
-        "official_title": study_details.loc[0]["official_title"],
-        "eligibility_criteria": eligibilities.loc[0]["criteria"],
-        "gender": eligibilities.loc[0]['gender'],
-        "minimum_age": eligibilities.loc[0]['minimum_age'],
-        "maximum_age": eligibilities.loc[0]['maximum_age'],
-        "design_details": {
-            "allocation": designs.loc[0]['allocation'],
-            "intervention_model": designs.loc[0]['intervention_model'],
-            "masking": designs.loc[0]['masking'],
-            "primary_purpose": designs.loc[0]['primary_purpose']
-        },
-        "arms": arm_payload,
-        "interventions": interventions_payload,
-        "primary_outcome_measurements": [
-            {
-            "measure": design_outcomes.loc[0]['measure'],
-            "time_frame": design_outcomes.loc[0]['time_frame']
-            }
-        ]
-        }
+    def summarize_trial(self,nct_id,trial_dfs):
+        """
+        Generate the trial level part of the explanation (everything except the site) using the OpenAI API.
+        This only depends on the trial, so it is what the explanation store caches.
+        """
+        # Get the shared OpenAI client
+        client = self.client
 
-        functions = [
-            {
-                "name": "generate_patient_friendly_trial_summary",
-                "description": "Creates a clear and easy-to-understand structured summary from clinical trial data, written for a patient audience.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "what_is_this_study_about": {
-                            "type": "string",
-                            "description": "In 2-4 sentences, clearly explain the main goal of this study. Include the condition being studied and what the study hopes to find out. Use simple, reassuring language appropriate for patients."
-                        },
-                        "who_can_join_this_study": {
-                            "type": "object",
-                            "properties": {
-                                "inclusion_criteria": {
-                                    "type": "array",
-                                    "items": {"type": "string"},
-                                    "description": "List of simple, patient-friendly bullet points summarizing who CAN join the study based on inclusion criteria."
-                                },
-                                "exclusion_criteria": {
-                                    "type": "array",
-                                    "items": {"type": "string"},
-                                    "description": "List of simple, patient-friendly bullet points summarizing who CANNOT join the study based on exclusion criteria."
-                                }
-                            },
-                            "description": "Summarizes the eligibility criteria into two friendly lists: who can and who cannot join the study."
-                        },
-                        "what_happens_in_this_study": {
-                            "type": "object",
-                            "properties": {
-                                "summary_of_activities": {
-                                    "type": "string",
-                                    "description": "Brief paragraph (3-6 sentences) explaining what participants will do during the study. Include how treatments are given, how long it lasts, any important study procedures (like blood tests), and any important outcome goals. Focus on what the participant experience will be like."
-                                }
-                            },
-                            "description": "Summarizes the design, treatments, activities, and duration of participation into a single, easy-to-read paragraph."
-                        }
-                    },
-                    "required": [
-                        "what_is_this_study_about",
-                        "who_can_join_this_study",
-                        "what_happens_in_this_study"
-                    ]
-                }
-            }
-        ]
+        response = openai_util.create_chat_completion(
+            client, 'trial_explainer',
+            model=azure_deployment,
+            messages=self.build_trial_messages(trial_dfs),
+            functions=TRIAL_SUMMARY_FUNCTIONS,
+            function_call={"name": "generate_patient_friendly_trial_summary"},
+            temperature=0.7,
+            max_tokens=4096
+        )
 
+        output=json.loads(response.choices[0].message.function_call.arguments)
+
+        return self.build_trial_summary(nct_id,trial_dfs,output)
+
+    def summarize_trial_stream(self,nct_id,trial_dfs):
+        """
+        Streaming version of summarize_trial. Yields the trial level summary again each time a section of the
+        LLM output completes, starting with the title and contacts (which need no LLM) before the first token.
+        The last summary yielded is the same as summarize_trial would return, unless the stream ended early
+        (length limit, content filter, dropped connection), check it with is_complete_summary before caching it.
+        """
+        client = self.client
 
-        client = openai_util.get_azure_openai_client()
+        output={}
+        yield self.build_trial_summary(nct_id,trial_dfs,output,partial=True)
+
+        stream = openai_util.create_chat_completion(
+            client, 'trial_explainer',
+            model=azure_deployment,
+            messages=self.build_trial_messages(trial_dfs),
+            functions=TRIAL_SUMMARY_FUNCTIONS,
+            function_call={"name": "generate_patient_friendly_trial_summary"},
+            temperature=0.7,
+            max_tokens=4096,
+            stream=True
+        )
+
+        #Parse the streamed function call arguments as they come in, a section is shown once its field is complete
+        parser = TopLevelFieldParser()
+        for chunk in stream:
+            # Azure sends chunks without choices (e.g. content filter results), skip them
+            if not chunk.choices:
+                continue
+            function_call = chunk.choices[0].delta.function_call
+            if function_call is None or not function_call.arguments:
+                continue
+
+            fields = parser.feed(function_call.arguments)
+            if fields:
+                output.update(fields)
+                yield self.build_trial_summary(nct_id,trial_dfs,output,partial=True)
+
+    def build_trial_messages(self,trial_dfs):
+        """
+        Build the system and user messages sent to the LLM for a trial, see agents/helpers/trial_payload.py.
+        """
+        #The about, who and what sections are generated from LLM tool calling so we send payload of
+        #  the study details for it to parse, trimmed to the token budget
+        trial_payload, payload_report = trial_payload_builder.build_trial_payload(trial_dfs)
+        if payload_report['tokens_before'] > payload_report['token_budget']:
+            print(f"Trial payload trimmed from {payload_report['tokens_before']} to {payload_report['tokens_after']} tokens, dropped: {'; '.join(payload_report['dropped'])}")
 
         system_message = {
             "role": "system",
-            "content": "You are a clinical trial explainer agent tasked with summarizing and structuring trial information for patients."
+            "content": SYSTEM_MESSAGE
         }
         user_message = {
             "role": "user",
             "content": f"Summarize the following trial information into patient-friendly fields:\n\n{json.dumps(trial_payload, indent=2)}"
         }
 
+        return [system_message, user_message]
 
-        response = client.chat.completions.create(
-            model=azure_deployment,
-            messages=[system_message, user_message],
-            functions=functions,
-            function_call={"name": "generate_patient_friendly_trial_summary"},
-            temperature=0.7,
-            max_tokens=4096
-        )
+    def build_trial_summary(self,nct_id,trial_dfs,output,partial=False):
+        """
+        Build the trial level summary from the LLM function call output.
+        Missing LLM fields raise a KeyError, unless partial (while streaming), then sections that have not been
+        generated yet are left out.
+        """
+        study_details=trial_dfs['study_details']
+        central_contacts=trial_dfs['central_contacts']
 
-        output=json.loads(response.choices[0].message.function_call.arguments)
-        output
-        output['what_is_this_study_about']
-        output['who_can_join_this_study']
-        output['who_can_join_this_study']['inclusion_criteria']
-        output['who_can_join_this_study']['exclusion_criteria']
-        output['what_happens_in_this_study']['summary_of_activities']
-
-        #Lastly site details and contacts...
-        site_details={
-            'site_name':study_site_pair['name'],
-            'city':study_site_pair['city'],
-            'state':study_site_pair['state'],
-            'zip':study_site_pair['zip'],
-        }
+        #1. Trial name and link to study on clinical trial .gov
+        trial_name = study_details['brief_title'].values[0]
+        trial_link = f"https://clinicaltrials.gov/study/{nct_id}"
+
+        #Lastly trial contacts, site details are added per site in add_site_details
         if not central_contacts.empty:
             contact_details={
                 'contact_name':central_contacts.loc[0]['name'],
@@ -195,16 +227,49 @@ class TrialExplainerAgent:
                 'trial_name':trial_name,
                 'trial_link':trial_link
             },
-            'about':output['what_is_this_study_about'],
-            'who':output['who_can_join_this_study'],
-            'what':output['what_happens_in_this_study']['summary_of_activities'],
             'contacts':{
-                'site_details':site_details,
                 'contact_details':contact_details
             }
         }
+        #2-4 come from the LLM
+        if not partial:
+            out['about']=output['what_is_this_study_about']
+            out['who']=output['who_can_join_this_study']
+            out['what']=output['what_happens_in_this_study']['summary_of_activities']
+            return out
+
+        if 'what_is_this_study_about' in output:
+            out['about']=output['what_is_this_study_about']
+        if 'who_can_join_this_study' in output:
+            out['who']=output['who_can_join_this_study']
+        if 'what_happens_in_this_study' in output:
+            out['what']=output['what_happens_in_this_study'].get('summary_of_activities','')
 
         return out 
+
+    def is_complete_summary(self,trial_summary):
+        """
+        True when a trial level summary has every LLM section, only complete summaries should be cached.
+        """
+        return trial_summary is not None and all(section in trial_summary for section in ('about','who','what'))
+
+    def add_site_details(self,trial_summary,study_site_pair):
+        """
+        Combine a trial level summary with the details of the selected site into the full explanation.
+        """
+        site_details={
+            'site_name':study_site_pair['name'],
+            'city':study_site_pair['city'],
+            'state':study_site_pair['state'],
+            'zip':study_site_pair['zip'],
+        }
+
+        out=dict(trial_summary)
+        out['contacts']={
+            'site_details':site_details,
+            'contact_details':trial_summary.get('contacts',{}).get('contact_details',{})
+        }
+        return out
     
 
     def generate_trial_markdown(self,trial_data) -> str:
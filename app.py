@@ -13,7 +13,6 @@ Streamlit app for the front end of the clinical trial search tool.
 
 import streamlit as st
 import streamlit.components.v1 as components
-from geopy.geocoders import Nominatim
 import pandas as pd
 import numpy as np
 import folium
@@ -22,6 +21,8 @@ import random
 import string
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
 from agents.agent_coordinator import AgentCoordinator
+from agents.helpers.trial_filters import AGE_GROUP_BITS
+from utils import llm_metrics
 from agents.helpers.session_utils import initialize_session_state, go_back_to_results, go_back_to_search
 
 
@@ -48,14 +49,10 @@ def select_trial_site(site_idx):
     site = st.session_state.filtered_sites.iloc[int(site_idx)]
     st.session_state.selected_trial_site = site
     
-    # Generate trial details and drug info for the selected site
-    coordinator = get_coordinator()
-    trial_data, trial_md = coordinator.get_trial_explanation(site)
-    drug_md = coordinator.get_drug_md(trial_data['about'])
-    
-    # Store in session state
-    st.session_state.selected_trial_markdown = trial_md
-    st.session_state.selected_drug_markdown = drug_md
+    # Trial details and drug info are streamed in on the details page
+    st.session_state.selected_trial_markdown = None
+    st.session_state.selected_drug_markdown = None
+    st.session_state.selected_drug_future = None
     
     # Switch to trial details page
     st.session_state.page = 'trial_details'
@@ -104,6 +101,9 @@ if st.session_state.page == 'search':
         if submitted:
             st.session_state.condition = condition
             st.session_state.location = location
+            # New search id so the LLM metrics of this search can be aggregated
+            st.session_state.search_id = llm_metrics.new_id()
+            llm_metrics.set_context(session_id=st.session_state.session_id, search_id=st.session_state.search_id)
             with st.spinner("🔍 Searching for clinical trials..."):
                 try:
                     coordinator = get_coordinator()
@@ -138,16 +138,10 @@ if st.session_state.page == 'search':
                             st.warning("No trials located in this area. Try searching in a different location.")
                             st.stop()
 
-                        sites['min_age_val'] = sites['minimum_age'].apply(coordinator.parse_age_string).fillna(0)
-                        sites['max_age_val'] = sites['maximum_age'].apply(coordinator.parse_age_string).fillna(120)
+                        # Age values and age groups are already computed by the site search
                         sites['phase'] = sites['phase'].fillna("N/A")
                         sites['phase'] = sites['phase'].replace({None: 'NA', 'N/A': 'NA'}).fillna('NA')
 
-                        sites['age_groups'] = sites.apply(
-                            lambda row: coordinator.determine_age_group(row['minimum_age'], row['maximum_age']),
-                            axis=1
-                        )
-
                         st.session_state.sites = sites
                         st.session_state.filtered_sites = sites.copy()
                         st.session_state.has_searched = True
@@ -163,6 +157,8 @@ if st.session_state.page == 'search':
                         condition_md = coordinator.get_condition_md(condition)
                         st.session_state.condition_markdown = condition_md
 
+                        llm_metrics.log_search_summary(st.session_state.search_id)
+
                         st.session_state.page = 'results'
                         st.rerun()
                     else:
@@ -328,21 +324,16 @@ elif st.session_state.page == 'results':
                 after_distance_count = starting_count
             
             # Apply age group filter
-            if 'age_groups' in filtered_sites.columns:
+            if 'age_group_mask' in filtered_sites.columns:
                 selected_groups = st.session_state.selected_age_groups
                 
                 # If "Any" is not selected, apply filter
                 if "Any" not in selected_groups:
-                    # Use a more lenient filter approach with explicit error handling
-                    try:
-                        # Check if the list contains the selected age groups
-                        filtered_sites = filtered_sites[
-                            filtered_sites['age_groups'].apply(
-                                lambda groups: any(group in selected_groups for group in groups) if isinstance(groups, list) else False
-                            )
-                        ]
-                    except Exception as e:
-                        st.error(f"Error in age group filtering: {e}")
+                    # Keep sites whose age group bitmask overlaps any selected group
+                    selected_mask = 0
+                    for group in selected_groups:
+                        selected_mask |= AGE_GROUP_BITS.get(group, 0)
+                    filtered_sites = filtered_sites[(filtered_sites['age_group_mask'] & selected_mask) != 0]
                 
                 after_age_count = len(filtered_sites)
             else:
@@ -435,10 +426,9 @@ elif st.session_state.page == 'results':
                 else:
                     zoom_level = 8
                 
-                # Get user location coordinates using geopy
-                geolocator = Nominatim(user_agent="clinical_trial_finder", timeout=10)
+                # Get user location coordinates (shared geocoding cache, usually already resolved by the search)
                 try:
-                    location_geo = geolocator.geocode(st.session_state.location, exactly_one=True, country_codes='US')
+                    location_geo = get_coordinator().geocode_location(st.session_state.location)
                     if location_geo:
                         user_lat = location_geo.latitude
                         user_lon = location_geo.longitude
@@ -495,8 +485,8 @@ elif st.session_state.page == 'results':
                             marker_icon = folium.Icon(color=marker_color, icon='info-sign')
 
                 
-                        # Convert age groups to friendly display
-                        age_groups_str = ", ".join(site['age_groups']) if 'age_groups' in site else "Any"
+                        # Age groups are already a friendly display string
+                        age_groups_str = site['age_groups'] if 'age_groups' in site else "Any"
                         
                         # Create a special onClick handler (WIP)
                         popup_html = f"""
@@ -579,10 +569,6 @@ elif st.session_state.page == 'results':
                     if 'distance' in display_df.columns:
                         display_df['distance'] = display_df['distance'].round(1)
                     
-                    # Convert age_groups list to string for display
-                    if 'age_groups' in display_df.columns:
-                        display_df['age_groups'] = display_df['age_groups'].apply(lambda x: ", ".join(x))
-                    
                     # Rename columns
                     display_df = display_df.rename(columns=rename_mapping)
                     
@@ -598,16 +584,14 @@ elif st.session_state.page == 'results':
                         # Reset index and ensure nct_id is included for selection
                         display_df = filtered_sites.copy().reset_index(drop=True)
 
-                        # Convert lists to strings for display (like age_groups)
-                        if 'age_groups' in display_df.columns:
-                            display_df['age_groups'] = display_df['age_groups'].apply(lambda x: ", ".join(x) if isinstance(x, list) else x)
-
                         # Build GridOptions
                         gb = GridOptionsBuilder.from_dataframe(display_df)
                         gb.configure_selection(selection_mode='single', use_checkbox=True)
 
                         # Optionally hide internal columns (e.g., nct_id, latitude, longitude)
                         gb.configure_column('nct_id', hide=True)
+                        if 'age_group_mask' in display_df.columns:
+                            gb.configure_column('age_group_mask', hide=True)
                         if 'latitude' in display_df.columns:
                             gb.configure_column('latitude', hide=True)
                         if 'longitude' in display_df.columns:
@@ -626,22 +610,18 @@ elif st.session_state.page == 'results':
                         )
 
                         # Get selected row
-                        with st.spinner("Loading trial details..."):
-                            selected = grid_response['selected_rows']
-                            if selected is not None and len(selected) > 0 and 'nct_id' in selected.columns:
-                                selected_nct_id = selected.iloc[0]['nct_id']
-                                selected_trial = filtered_sites[filtered_sites['nct_id'] == selected_nct_id].iloc[0]
-
-                                # Load trial details
-                                st.session_state.selected_trial_site = selected_trial
-                                coordinator = get_coordinator()
-                                trial_data, trial_md = coordinator.get_trial_explanation(selected_trial)
-                                drug_md = coordinator.get_drug_md(trial_data['about'])
+                        selected = grid_response['selected_rows']
+                        if selected is not None and len(selected) > 0 and 'nct_id' in selected.columns:
+                            selected_nct_id = selected.iloc[0]['nct_id']
+                            selected_trial = filtered_sites[filtered_sites['nct_id'] == selected_nct_id].iloc[0]
 
-                                st.session_state.selected_trial_markdown = trial_md
-                                st.session_state.selected_drug_markdown = drug_md
-                                st.session_state.page = 'trial_details'
-                                st.rerun()
+                            # Trial details are streamed in on the details page
+                            st.session_state.selected_trial_site = selected_trial
+                            st.session_state.selected_trial_markdown = None
+                            st.session_state.selected_drug_markdown = None
+                            st.session_state.selected_drug_future = None
+                            st.session_state.page = 'trial_details'
+                            st.rerun()
 
 
 
@@ -664,8 +644,7 @@ elif st.session_state.page == 'results':
 elif st.session_state.page == 'trial_details':
     # First ensure we have the necessary data
 
-    if (st.session_state.selected_trial_site is not None and 
-        st.session_state.selected_trial_markdown is not None):
+    if st.session_state.selected_trial_site is not None:
 
         # Back button to return to results
         if st.button("← Back to Search Results"):
@@ -715,14 +694,31 @@ elif st.session_state.page == 'trial_details':
         trial_tab, drug_tab, location_tab = st.tabs(["Trial Information", "Medication Details", "Location Details"])
         
         with trial_tab:
-            # Display the trial markdown
-            st.markdown(st.session_state.selected_trial_markdown)
+            if st.session_state.selected_trial_markdown is None:
+                # Stream the explanation in section by section, the drug lookup runs in the background meanwhile
+                coordinator = get_coordinator()
+                explanation_stream, drug_future = coordinator.stream_trial_page(site)
+                st.session_state.selected_drug_future = drug_future
+
+                trial_placeholder = st.empty()
+                with st.spinner("Explaining this trial..."):
+                    for trial_data, trial_md in explanation_stream:
+                        trial_placeholder.markdown(trial_md)
+                st.session_state.selected_trial_markdown = trial_md
+            else:
+                # Display the trial markdown
+                st.markdown(st.session_state.selected_trial_markdown)
             
             # Add a direct link to the clinical trials gov page
             if 'nct_id' in site and pd.notna(site['nct_id']):
                 st.markdown(f"[View full study details on ClinicalTrials.gov](https://clinicaltrials.gov/study/{site['nct_id']})")
         
         with drug_tab:
+            if st.session_state.selected_drug_markdown is None and st.session_state.selected_drug_future is not None:
+                with st.spinner("Looking up medication details..."):
+                    st.session_state.selected_drug_markdown = st.session_state.selected_drug_future.result()
+                st.session_state.selected_drug_future = None
+
             # Display drug information if available
             if st.session_state.selected_drug_markdown:
                 st.markdown(st.session_state.selected_drug_markdown)
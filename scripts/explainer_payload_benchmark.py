@@ -0,0 +1,165 @@
+"""
+explainer_payload_benchmark.py
+
+Benchmark of the Trial Explainer Agent's token-budgeted payload (agents/helpers/trial_payload.py) against the
+original payload, which sent the full criteria text and all arms and interventions as JSON strings.
+
+For a random sample of active trials it reports prompt tokens for both payloads and how often each trimming
+stage kicked in. With --llm it also calls the explainer model with both prompts and reports the latency and the
+prompt tokens the API billed.
+
+Usage:
+    python scripts/explainer_payload_benchmark.py --sample 200
+    python scripts/explainer_payload_benchmark.py --sample 30 --budget 2000 --llm
+"""
+
+import os
+import sys
+import time
+import json
+import argparse
+from collections import Counter
+from dotenv import load_dotenv
+# Load environment variables
+load_dotenv()
+base_dir = os.getenv('base_dir')
+# Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+import numpy as np
+import pandas as pd
+from utils import sql_util, openai_util
+from agents.helpers import trial_filters, trial_payload
+from agents.trial_explainer import SYSTEM_MESSAGE, TRIAL_SUMMARY_FUNCTIONS, azure_deployment
+
+
+def sample_nct_ids(sample_size):
+    sample = sql_util.get_table(f"""
+        select nct_id from aact.ctgov.studies s
+        where overall_status in ('ENROLLING_BY_INVITATION','NOT_YET_RECRUITING','RECRUITING')
+        order by random()
+        limit {int(sample_size)}
+    """)
+    return sample['nct_id'].tolist()
+
+
+def build_legacy_payload(trial_dfs):
+    #The payload TrialExplainerAgent sent before the token budget
+    study_details=trial_dfs['study_details']
+    eligibilities=trial_dfs['eligibilities']
+    designs=trial_dfs['designs']
+    design_groups=trial_dfs['design_groups']
+    interventions=trial_dfs['interventions']
+    design_outcomes=trial_dfs['design_outcomes']
+    return {
+        "brief_summary": study_details.loc[0]["brief_title"],
+        "official_title": study_details.loc[0]["official_title"],
+        "eligibility_criteria": eligibilities.loc[0]["criteria"],
+        "gender": eligibilities.loc[0]['gender'],
+        "minimum_age": eligibilities.loc[0]['minimum_age'],
+        "maximum_age": eligibilities.loc[0]['maximum_age'],
+        "design_details": {
+            "allocation": designs.loc[0]['allocation'],
+            "intervention_model": designs.loc[0]['intervention_model'],
+            "masking": designs.loc[0]['masking'],
+            "primary_purpose": designs.loc[0]['primary_purpose']
+        },
+        "arms": design_groups[['group_type','title','description']].to_json(orient='records'),
+        "interventions": interventions[['intervention_type','name','description']].to_json(orient='records'),
+        #The original raised on trials without a primary outcome, send none like the new builder does
+        "primary_outcome_measurements": [
+            {
+            "measure": design_outcomes.loc[0]['measure'],
+            "time_frame": design_outcomes.loc[0]['time_frame']
+            }
+        ] if not design_outcomes.empty else []
+    }
+
+
+def build_messages(payload):
+    return [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": f"Summarize the following trial information into patient-friendly fields:\n\n{json.dumps(payload, indent=2, default=str)}"},
+    ]
+
+
+def time_llm_call(client, messages):
+    start = time.perf_counter()
+    response = client.chat.completions.create(
+        model=azure_deployment,
+        messages=messages,
+        functions=TRIAL_SUMMARY_FUNCTIONS,
+        function_call={"name": "generate_patient_friendly_trial_summary"},
+        temperature=0.7,
+        max_tokens=4096
+    )
+    return time.perf_counter() - start, response.usage.prompt_tokens
+
+
+def describe(label, values):
+    values = np.asarray(values, dtype=float)
+    print(f"{label:<28} mean {values.mean():>9.1f}  median {np.median(values):>9.1f}  "
+          f"p95 {np.percentile(values, 95):>9.1f}  max {values.max():>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the budgeted explainer payload with the original payload.')
+    parser.add_argument('--sample', type=int, default=100, help='Number of random active trials')
+    parser.add_argument('--budget', type=int, default=trial_payload.PAYLOAD_TOKEN_BUDGET, help='Payload token budget')
+    parser.add_argument('--llm', action='store_true', help='Also time real explainer LLM calls with both payloads')
+    parser.add_argument('--output', help='Optional CSV file for the per trial results')
+    args = parser.parse_args()
+
+    nct_ids = sample_nct_ids(args.sample)
+    details = trial_filters.get_trial_details_bulk(nct_ids)
+    client = openai_util.get_azure_openai_client() if args.llm else None
+
+    rows = []
+    stages = Counter()
+    for nct_id in nct_ids:
+        trial_dfs = details[nct_id]
+        if trial_dfs['study_details'].empty or trial_dfs['eligibilities'].empty or trial_dfs['designs'].empty:
+            continue
+
+        legacy_messages = build_messages(build_legacy_payload(trial_dfs))
+        payload, report = trial_payload.build_trial_payload(trial_dfs, token_budget=args.budget)
+        budget_messages = build_messages(payload)
+        for dropped in report['dropped']:
+            #Count the stage, not the number of lines ("12 exclusion criteria lines" -> "exclusion criteria lines")
+            stages[dropped.split(' ', 1)[1] if dropped[0].isdigit() else dropped] += 1
+
+        row = {
+            'nct_id': nct_id,
+            'legacy_prompt_tokens': openai_util.count_message_tokens(legacy_messages),
+            'budget_prompt_tokens': openai_util.count_message_tokens(budget_messages),
+        }
+        if client is not None:
+            row['legacy_latency'], row['legacy_billed_tokens'] = time_llm_call(client, legacy_messages)
+            row['budget_latency'], row['budget_billed_tokens'] = time_llm_call(client, budget_messages)
+        rows.append(row)
+
+    results = pd.DataFrame(rows)
+    print(f"{len(results)} trials, payload budget {args.budget} tokens\n")
+    describe('Prompt tokens (original)', results['legacy_prompt_tokens'])
+    describe('Prompt tokens (budgeted)', results['budget_prompt_tokens'])
+    reduction = 1 - results['budget_prompt_tokens'].sum() / results['legacy_prompt_tokens'].sum()
+    print(f"Total prompt token reduction: {reduction:.1%}")
+    print(f"Trials over budget before trimming: {(results['legacy_prompt_tokens'] > args.budget).mean():.1%}")
+
+    if client is not None:
+        print()
+        describe('Latency s (original)', results['legacy_latency'])
+        describe('Latency s (budgeted)', results['budget_latency'])
+        describe('Billed tokens (original)', results['legacy_billed_tokens'])
+        describe('Billed tokens (budgeted)', results['budget_billed_tokens'])
+
+    if stages:
+        print("\nTrimming applied (trials):")
+        for stage, count in stages.most_common():
+            print(f"  {stage}: {count}")
+
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+fake_llm_server.py
+
+Local OpenAI compatible stand-in for Azure OpenAI, for load and latency testing the agent pipeline without
+spending on Azure or inheriting its variance. It speaks the chat completions function calling protocol the four
+agents use, on both the Azure path (/openai/deployments/<deployment>/chat/completions) and the OpenAI path
+(/v1/chat/completions), including stream=True (server-sent events) and stream_options include_usage.
+
+Arguments are templated from the prompt for the agents' functions (see utils/llm_stub.py). Latency is drawn
+from a configurable distribution, per function if wanted, and a share of requests can be failed with a 429 or
+5xx to exercise the retry policy. GET /stats returns request counts and latency per function.
+
+Point the app at it by setting fake_llm_endpoint in .env (openai_util then uses it instead of Azure):
+    python scripts/fake_llm_server.py --port 8765 --latency lognormal:0.8,0.4 --function-latency get_location=fixed:0.2
+    fake_llm_endpoint=http://127.0.0.1:8765
+
+Latency specs: fixed:S, uniform:LOW,HIGH, normal:MEAN,SD, lognormal:MEDIAN,SIGMA (seconds).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dotenv import load_dotenv
+# Load environment variables
+load_dotenv()
+base_dir = os.getenv('base_dir')
+# Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+import numpy as np
+from utils.llm_stub import StubOpenAIClient
+
+
+class LatencyModel:
+    def __init__(self, spec):
+        """
+        Parse a latency spec like "lognormal:0.8,0.4" into a sampler.
+        """
+        self.spec = spec
+        kind, _, params = spec.partition(':')
+        values = [float(v) for v in params.split(',') if v]
+        if kind == 'fixed':
+            self.sample_fn = lambda: values[0]
+        elif kind == 'uniform':
+            self.sample_fn = lambda: random.uniform(values[0], values[1])
+        elif kind == 'normal':
+            self.sample_fn = lambda: random.gauss(values[0], values[1])
+        elif kind == 'lognormal':
+            self.sample_fn = lambda: values[0] * random.lognormvariate(0, values[1])
+        else:
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self):
+        return max(0.0, self.sample_fn())
+
+
+class FakeLLMState:
+    def __init__(self, latency, function_latency, error_rate, error_status):
+        self.latency = latency
+        self.function_latency = function_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.latencies = defaultdict(list)
+
+    def record(self, function_name, latency=None, error=False):
+        with self.lock:
+            self.requests[function_name] += 1
+            if error:
+                self.errors[function_name] += 1
+            if latency is not None:
+                self.latencies[function_name].append(latency)
+
+    def stats(self):
+        with self.lock:
+            return {
+                name: {
+                    'requests': self.requests[name],
+                    'errors': self.errors[name],
+                    'p50_seconds': float(np.percentile(self.latencies[name], 50)) if self.latencies[name] else None,
+                    'p95_seconds': float(np.percentile(self.latencies[name], 95)) if self.latencies[name] else None,
+                }
+                for name in self.requests
+            }
+
+
+def make_handler(state):
+    class FakeLLMHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            #Keep the console quiet under load
+            pass
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.startswith('/health'):
+                self._send_json(200, {'status': 'ok'})
+            elif self.path.startswith('/stats'):
+                self._send_json(200, state.stats())
+            else:
+                self._send_json(404, {'error': {'message': 'Not found'}})
+
+        def do_POST(self):
+            path = self.path.split('?', 1)[0]
+            if not path.endswith('/chat/completions'):
+                self._send_json(404, {'error': {'message': 'Not found'}})
+                return
+
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            function_call = request.get('function_call')
+            function_name = function_call.get('name') if isinstance(function_call, dict) else None
+            #Azure names the deployment in the path rather than the body
+            if 'model' not in request and '/deployments/' in path:
+                request['model'] = path.split('/deployments/', 1)[1].split('/', 1)[0]
+
+            if random.random() < state.error_rate:
+                state.record(function_name, error=True)
+                self._send_json(state.error_status, {'error': {'message': 'Injected error', 'code': str(state.error_status)}},
+                                headers={'Retry-After': '1'})
+                return
+
+            latency = state.function_latency.get(function_name, state.latency).sample()
+            client = StubOpenAIClient(latency_seconds=latency)
+            start = time.perf_counter()
+            kwargs = {key: request.get(key) for key in ('messages', 'functions', 'function_call', 'model', 'stream_options')}
+
+            if request.get('stream'):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                for chunk in client.chat.completions.create(stream=True, **kwargs):
+                    self.wfile.write(f"data: {chunk.model_dump_json(exclude_none=True)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+            else:
+                completion = client.chat.completions.create(**kwargs)
+                self._send_json(200, completion.model_dump(exclude_none=True))
+
+            state.record(function_name, latency=time.perf_counter() - start)
+
+    return FakeLLMHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local OpenAI compatible fake LLM server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', default='lognormal:0.8,0.4', help='Default latency distribution')
+    parser.add_argument('--function-latency', action='append', default=[],
+                        help='Per function latency, e.g. get_location=fixed:0.2 (repeatable)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with an error')
+    parser.add_argument('--error-status', type=int, default=429, help='HTTP status of injected errors')
+    args = parser.parse_args()
+
+    function_latency = {}
+    for item in args.function_latency:
+        name, spec = item.split('=', 1)
+        function_latency[name] = LatencyModel(spec)
+
+    state = FakeLLMState(LatencyModel(args.latency), function_latency, args.error_rate, args.error_status)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"Fake LLM server listening on http://{args.host}:{args.port} (latency {args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
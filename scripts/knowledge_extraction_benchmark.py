@@ -0,0 +1,106 @@
+"""
+knowledge_extraction_benchmark.py
+
+Micro-benchmark of the knowledge_web page extraction: the lxml engine, which parses only the target section
+(div#mplus-content, div.drug-label-sections) in one walk, against the original BeautifulSoup html.parser
+version that parses the whole page. Runs on saved fixture pages so timings are reproducible and offline,
+and checks that both engines produce the same text.
+
+Fixtures are HTML files in data/fixtures/knowledge (MedlinePlus pages named medlineplus_*.html, DailyMed labels
+named dailymed_*.html). --save fetches and saves fixtures for the given conditions and drugs first.
+
+Usage:
+    python scripts/knowledge_extraction_benchmark.py --save --conditions diabetes asthma --drugs ibuprofen metformin
+    python scripts/knowledge_extraction_benchmark.py --repeat 20
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+from dotenv import load_dotenv
+# Load environment variables
+load_dotenv()
+base_dir = os.getenv('base_dir')
+# Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+import numpy as np
+from bs4 import BeautifulSoup
+from agents.helpers import knowledge_web
+
+FIXTURE_DIR = os.path.join('data', 'fixtures', 'knowledge')
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+}
+SECTIONS = {
+    'medlineplus': {'tag': 'div', 'id': 'mplus-content'},
+    'dailymed': {'tag': 'div', 'class_': 'drug-label-sections'},
+}
+
+
+def save_fixtures(conditions, drugs):
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for condition in conditions:
+        url = 'https://medlineplus.gov/' + condition.lower().replace(' ', '') + '.html'
+        content = knowledge_web._http_get(url, HEADERS)
+        with open(os.path.join(FIXTURE_DIR, f'medlineplus_{condition.replace(" ", "_")}.html'), 'w', encoding='utf-8') as f:
+            f.write(content)
+    for drug in drugs:
+        #Same search as get_drug_page, following the first result to its label
+        url = 'https://dailymed.nlm.nih.gov/dailymed/search.cfm?labeltype=all&query=' + drug + '&audience=consumer'
+        content = knowledge_web._http_get(url, HEADERS)
+        link = BeautifulSoup(content, 'html.parser').find('a', class_='drug-info-link')
+        if link is not None:
+            content = knowledge_web._http_get('https://dailymed.nlm.nih.gov' + link['href'], HEADERS)
+        with open(os.path.join(FIXTURE_DIR, f'dailymed_{drug.replace(" ", "_")}.html'), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+
+def time_engine(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = fn()
+        timings.append(time.perf_counter() - start)
+    return text, float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark knowledge_web page extraction on fixture pages.')
+    parser.add_argument('--save', action='store_true', help='Fetch and save fixtures first')
+    parser.add_argument('--conditions', nargs='*', default=[])
+    parser.add_argument('--drugs', nargs='*', default=[])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.save:
+        save_fixtures(args.conditions, args.drugs)
+
+    paths = sorted(glob.glob(os.path.join(FIXTURE_DIR, '*.html')))
+    if not paths:
+        print(f"No fixtures in {FIXTURE_DIR}, run with --save first")
+        return
+    if knowledge_web.etree is None:
+        print("lxml is not installed, both engines would be BeautifulSoup")
+        return
+
+    totals = {'bs4': 0.0, 'lxml': 0.0}
+    for path in paths:
+        name = os.path.basename(path)
+        section = SECTIONS[name.split('_', 1)[0]]
+        with open(path, encoding='utf-8') as f:
+            content = f.read()
+
+        bs4_text, bs4_seconds = time_engine(lambda: knowledge_web._section_text_bs4(content, **section), args.repeat)
+        lxml_text, lxml_seconds = time_engine(lambda: knowledge_web.extract_section_text(content, **section), args.repeat)
+        totals['bs4'] += bs4_seconds
+        totals['lxml'] += lxml_seconds
+        print(f"{name}: {len(content) / 1024:.0f} KB, bs4 {bs4_seconds * 1000:.1f} ms, lxml {lxml_seconds * 1000:.1f} ms "
+              f"({bs4_seconds / lxml_seconds:.1f}x), same text: {bs4_text == lxml_text}")
+
+    print(f"Total: bs4 {totals['bs4'] * 1000:.1f} ms, lxml {totals['lxml'] * 1000:.1f} ms ({totals['bs4'] / totals['lxml']:.1f}x)")
+
+if __name__ == "__main__":
+    main()
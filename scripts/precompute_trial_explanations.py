@@ -0,0 +1,132 @@
+"""
+precompute_trial_explanations.py
+
+Batch job that generates Trial Explainer Agent explanations ahead of time and writes them to the explanation
+store (agents/helpers/explanation_store.py), which the app reads before calling the LLM.
+
+It walks every active trial, or the top N trials by how often they appear in search results, fetches trial
+details in bulk and calls the LLM with bounded concurrency and a requests-per-minute limit. Trials whose stored
+explanation is already current are skipped, so the job can be interrupted and re-run to resume.
+
+Usage:
+    python scripts/precompute_trial_explanations.py --top 1000 --workers 4 --requests-per-minute 60
+    python scripts/precompute_trial_explanations.py --stub --limit 20   # local stub LLM, separate store
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+from dotenv import load_dotenv
+# Load environment variables
+load_dotenv()
+base_dir = os.getenv('base_dir')
+# Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils import llm_governor
+from utils import sql_util
+from utils.llm_stub import StubOpenAIClient
+from agents.trial_explainer import TrialExplainerAgent, PROMPT_VERSION
+from agents.helpers import trial_filters, explanation_store, search_stats
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute):
+        """Space calls out evenly so at most requests_per_minute start per minute."""
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def get_active_nct_ids():
+    active_studies = sql_util.get_table("""
+        select nct_id from aact.ctgov.studies s
+        where overall_status in ('ENROLLING_BY_INVITATION','NOT_YET_RECRUITING','RECRUITING')
+        order by nct_id
+    """)
+    return active_studies['nct_id'].tolist()
+
+
+def get_last_updates(nct_ids):
+    last_updates = sql_util.get_table(f"""
+        select nct_id, last_update_posted_date from studies
+        where nct_id in {sql_util.format_in_list(nct_ids)}
+    """)
+    return {nct_id: str(date) for nct_id, date in zip(last_updates['nct_id'], last_updates['last_update_posted_date'])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute trial explanations into the explanation store.')
+    parser.add_argument('--top', type=int, default=0, help='Only the top N trials by search frequency (default: all active trials)')
+    parser.add_argument('--limit', type=int, default=0, help='Stop after this many trials (useful for testing)')
+    parser.add_argument('--batch-size', type=int, default=200, help='Trials fetched from AACT per bulk query')
+    parser.add_argument('--workers', type=int, default=4, help='Maximum concurrent LLM calls')
+    parser.add_argument('--requests-per-minute', type=float, default=60, help='Maximum LLM calls started per minute')
+    parser.add_argument('--stub', action='store_true', help='Use the local stub LLM and write to a separate store')
+    parser.add_argument('--stub-latency', type=float, default=0.5, help='Simulated stub LLM latency in seconds')
+    args = parser.parse_args()
+
+    if args.stub:
+        agent = TrialExplainerAgent(client=StubOpenAIClient(latency_seconds=args.stub_latency))
+        store_name = 'trial_explanations_stub'
+    else:
+        agent = TrialExplainerAgent()
+        store_name = explanation_store.DEFAULT_STORE
+
+    nct_ids = search_stats.get_top_trials(args.top) if args.top else get_active_nct_ids()
+    if args.limit:
+        nct_ids = nct_ids[:args.limit]
+    print(f'{len(nct_ids)} trials to check')
+
+    limiter = RateLimiter(args.requests_per_minute)
+    done, skipped, failed = 0, 0, 0
+
+    def explain(nct_id, trial_dfs, last_update):
+        limiter.wait()
+        # Batch work yields to interactive calls when the app shares the process
+        with llm_governor.priority(llm_governor.BACKGROUND):
+            trial_summary = agent.summarize_trial(nct_id, trial_dfs)
+        explanation_store.save_explanation(nct_id, last_update, PROMPT_VERSION, trial_summary, store_name=store_name)
+        return nct_id
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for start in range(0, len(nct_ids), args.batch_size):
+            batch = nct_ids[start:start + args.batch_size]
+
+            # Resume: skip trials whose stored explanation is already current
+            last_updates = get_last_updates(batch)
+            todo = []
+            for nct_id in batch:
+                entry = explanation_store.get_explanation(nct_id, store_name=store_name)
+                if entry is not None and explanation_store.is_current(entry, last_updates.get(nct_id), PROMPT_VERSION):
+                    skipped += 1
+                else:
+                    todo.append(nct_id)
+            if not todo:
+                continue
+
+            details = trial_filters.get_trial_details_bulk(todo)
+            futures = {executor.submit(explain, nct_id, details[nct_id], last_updates.get(nct_id)): nct_id for nct_id in todo}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    print(f'{futures[future]} failed: {e}')
+
+            print(f'Progress: {start + len(batch)}/{len(nct_ids)} checked, {done} explained, {skipped} already current, {failed} failed')
+
+if __name__ == "__main__":
+    main()
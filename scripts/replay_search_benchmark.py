@@ -0,0 +1,82 @@
+"""
+replay_search_benchmark.py
+
+Runs the full AgentCoordinator search flow (location fix, synonyms, trial and site matching, condition page,
+then the details page of the first few sites) and times each stage. Combined with the cassette layer
+(utils/cassette.py) it records a live search once and then replays it offline, for reproducible regression
+benchmarks of everything that is not AACT, the web or the LLM.
+
+Usage:
+    python scripts/replay_search_benchmark.py --mode record --condition "breast cancer" --location "Boston, MA"
+    python scripts/replay_search_benchmark.py --mode replay --condition "breast cancer" --location "Boston, MA" --latency zero --runs 5
+"""
+
+import os
+import sys
+import time
+import argparse
+from dotenv import load_dotenv
+# Load environment variables
+load_dotenv()
+base_dir = os.getenv('base_dir')
+# Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Time the search flow, optionally recording or replaying a cassette.')
+    parser.add_argument('--condition', required=True)
+    parser.add_argument('--location', required=True)
+    parser.add_argument('--sites', type=int, default=3, help='Number of result sites whose details page is opened')
+    parser.add_argument('--mode', choices=['off', 'record', 'replay'], default='replay')
+    parser.add_argument('--cassette', help='Cassette file (default: cassette_file from .env)')
+    parser.add_argument('--latency', choices=['original', 'zero'], default='original', help='Replay latency')
+    parser.add_argument('--runs', type=int, default=1)
+    return parser.parse_args()
+
+
+def run_search(coordinator, condition, location, site_count):
+    timings = {}
+
+    def timed(stage, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    fixed_location = timed('fix_location', coordinator.fix_location, location)
+    synonyms = timed('synonyms', coordinator.get_synonyms, condition)
+    trials = timed('matching_trials', coordinator.find_matching_trials_from_synonyms, synonyms)
+    sites = timed('sites', coordinator.find_matching_trials_from_location_with_age_gender, trials, fixed_location)
+    timed('condition_page', coordinator.get_condition_md, condition)
+    for i in range(min(site_count, len(sites))):
+        timed(f'trial_page_{i + 1}', coordinator.get_trial_page, sites.loc[i])
+
+    timings['total'] = sum(timings.values())
+    return timings
+
+
+def main():
+    args = parse_args()
+    #The cassette settings are read at import time, so set them before loading the agents
+    os.environ['cassette_mode'] = args.mode
+    os.environ['cassette_replay_latency'] = args.latency
+    if args.cassette:
+        os.environ['cassette_file'] = args.cassette
+
+    from utils import cassette
+    from agents.agent_coordinator import AgentCoordinator
+
+    coordinator = AgentCoordinator()
+    for run in range(1, args.runs + 1):
+        timings = run_search(coordinator, args.condition, args.location, args.sites)
+        print(f"Run {run}: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
+
+    if cassette.get_cassette() is not None:
+        if args.mode == 'record':
+            cassette.get_cassette().save()
+        print(f"Cassette {cassette.get_cassette().path}: {cassette.get_cassette().summary()}")
+
+if __name__ == "__main__":
+    main()
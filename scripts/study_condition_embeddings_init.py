@@ -2,6 +2,9 @@
 study_condition_embeddings_init.py
 
 Script that initializes the study condition embeddings and also updates the embeddings when new rows are added to the database.
+It also rebuilds the spatial index (BallTree) over the recruiting facilities of all active trials used for distance search.
+Run it whenever the AACT data is refreshed: the index is loaded once at app start and ignored (with a warning) once it is
+older than facility_index_max_age_days, the site search then queries AACT directly until it is rebuilt.
 """
 
 import os
@@ -13,7 +16,10 @@ base_dir = os.getenv('base_dir')
 # Change the working directory to the base directory
 os.chdir(base_dir)
 sys.path.append(base_dir)
+import time
 import pandas as pd
+import numpy as np
+from sklearn.neighbors import BallTree
 from utils import sql_util
 from sentence_transformers import SentenceTransformer
 import torch
@@ -27,6 +33,31 @@ model = SentenceTransformer('all-MiniLM-L6-v2', device=device)
 
 
 
+def build_facility_index():
+    """
+    Build a haversine BallTree over every recruiting facility of every active trial (with their study and
+    eligibility columns) and write it to data/active_facilities_index.pkl so distance search is a local radius query.
+    """
+    # Same joined site search columns the live query returns, so an index hit needs no SQL at all
+    facilities_query = sql_util.get_site_search_query(sql_util.ACTIVE_FACILITY_FILTER + """
+    and f.latitude is not null and f.longitude is not null
+    """)
+    facilities = sql_util.get_table(facilities_query).reset_index(drop=True)
+
+    # The haversine metric expects [lat, lon] in radians
+    tree = BallTree(np.radians(facilities[['latitude', 'longitude']].to_numpy()), metric='haversine')
+
+    out = {
+        'facilities': facilities,
+        'tree': tree,
+        'built_at': time.time()
+    }
+
+    out_file = os.path.join(base_dir, 'data', 'active_facilities_index.pkl')
+    with open(out_file, 'wb') as f:
+        pd.to_pickle(out, f)
+
+
 def main():
 
     # Check if data file exists in the data folder, if it does, read it in
@@ -92,6 +123,9 @@ def main():
     with open(out_file, 'wb') as f:
         pd.to_pickle(out, f)
 
+    # Rebuild the facility spatial index from the same snapshot of active trials
+    build_facility_index()
+
 if __name__ == "__main__":
     main()
 
@@ -0,0 +1,133 @@
+"""
+synonym_mode_eval.py
+
+Offline evaluation of local synonym expansion (agents/helpers/local_synonyms.py) against the Synonym Generator
+Agent. For each condition both synonym lists are run through the same trial matching
+(trial_filters.get_relevant_studies_from_conditions) and the retrieved trial sets are compared, taking the LLM
+path as the reference: recall of the LLM's trials, precision and Jaccard overlap, plus the latency of each path
+and how often hybrid mode would have skipped the LLM.
+
+By default the conditions are typed user queries (lay terms, abbreviations and misspellings, DEFAULT_QUERIES).
+--top adds the most common condition strings from the trials themselves. Those always find themselves in the
+condition embeddings (top similarity about 1.0), which flatters the local path, so they are reported separately.
+
+LLM synonyms are read from the synonym cache when present (and cached when generated), so re-runs are cheap.
+
+Usage:
+    python scripts/synonym_mode_eval.py
+    python scripts/synonym_mode_eval.py --top 100
+    python scripts/synonym_mode_eval.py --conditions "MS" "breast cancer" "type 2 diabetes" --output synonym_eval.csv
+"""
+
+import os
+import sys
+import time
+import argparse
+from dotenv import load_dotenv
+# Load environment variables
+load_dotenv()
+base_dir = os.getenv('base_dir')
+# Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+import numpy as np
+import pandas as pd
+from agents.synonym_generator import SynonymGeneratorAgent
+from agents.agent_coordinator import HYBRID_MIN_SIMILARITY
+from agents.helpers import trial_filters, local_synonyms, synonym_cache
+
+
+#What users actually type: lay terms, abbreviations and misspellings rather than the trials' own vocabulary
+DEFAULT_QUERIES = [
+    'MS', 'ALS', 'COPD', 'IBD', 'PTSD', 'ADHD', 'NASH', 'afib', 'CHF', 'T2D',
+    'sugar diabetes', 'high blood pressure', 'heart attack', 'stroke', 'lung cancer', 'breast cancer',
+    'skin cancer', 'bone marrow cancer', 'kidney failure', 'fatty liver', 'long covid', 'memory loss',
+    'depression', 'anxiety', 'chronic back pain', 'migraines', 'eczema', 'acne', 'obesity', 'sleep apnea',
+    'alzheimers', 'parkinsons', 'crohns', 'rheumatoid arthritis', 'lupus', 'psoriasis', 'asthma', 'epilepsy',
+    'diabetis', 'alzheimer disease', 'parkinson disease', 'schizophrenia', 'autism', 'leukemia', 'lymphoma',
+    'pancreatic cancer', 'prostate cancer', 'colon cancer', 'hepatitis c', 'hiv',
+]
+
+
+def get_top_conditions(top_n):
+    # Conditions with the most active trials are the ones users are most likely to search
+    conditions_df = trial_filters.conditions_df
+    trial_counts = conditions_df['nct_ids'].apply(len)
+    return conditions_df.loc[trial_counts.sort_values(ascending=False).index[:top_n], 'condition'].tolist()
+
+
+def get_llm_synonyms(agent, condition):
+    synonyms = synonym_cache.get_cached_synonyms(condition)
+    if synonyms is None:
+        synonyms = agent.generate_synonyms(condition)
+        synonym_cache.cache_synonyms(condition, synonyms)
+    return synonyms
+
+
+def trial_set(synonyms):
+    return set(trial_filters.get_relevant_studies_from_conditions(synonyms)['nct_ids'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare trials retrieved with local synonyms against LLM synonyms.')
+    parser.add_argument('--top', type=int, default=0,
+                        help='Also evaluate the top N trial condition strings by active trial count (reported separately)')
+    parser.add_argument('--conditions', nargs='*', help='Evaluate these typed queries instead of DEFAULT_QUERIES')
+    parser.add_argument('--output', help='Optional CSV file for the per condition results')
+    args = parser.parse_args()
+
+    queries = args.conditions if args.conditions else DEFAULT_QUERIES
+    conditions = [(condition, 'typed') for condition in queries]
+    if args.top:
+        conditions += [(condition, 'vocabulary') for condition in get_top_conditions(args.top)]
+    agent = SynonymGeneratorAgent()
+
+    rows = []
+    for i, (condition, source) in enumerate(conditions, start=1):
+        start = time.perf_counter()
+        llm_synonyms = get_llm_synonyms(agent, condition)
+        llm_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        local_list, top_similarity = local_synonyms.expand_condition(condition)
+        local_seconds = time.perf_counter() - start
+
+        llm_trials = trial_set(llm_synonyms)
+        local_trials = trial_set(local_list)
+        overlap = len(llm_trials & local_trials)
+        union = len(llm_trials | local_trials)
+
+        rows.append({
+            'condition': condition,
+            'source': source,
+            'llm_synonyms': len(llm_synonyms) - 1,
+            'local_synonyms': len(local_list) - 1,
+            'top_similarity': top_similarity,
+            'hybrid_uses_local': top_similarity >= HYBRID_MIN_SIMILARITY,
+            'llm_trials': len(llm_trials),
+            'local_trials': len(local_trials),
+            'recall': overlap / len(llm_trials) if llm_trials else np.nan,
+            'precision': overlap / len(local_trials) if local_trials else np.nan,
+            'jaccard': overlap / union if union else np.nan,
+            'llm_seconds': llm_seconds,
+            'local_seconds': local_seconds,
+        })
+        print(f"[{i}/{len(conditions)}] {condition}: recall {rows[-1]['recall']:.2f}, jaccard {rows[-1]['jaccard']:.2f}")
+
+    results = pd.DataFrame(rows)
+    #Vocabulary strings match themselves exactly, keep them out of the typed query numbers
+    for source, source_results in results.groupby('source', sort=False):
+        hybrid = source_results[source_results['hybrid_uses_local']]
+        print(f"\n{len(source_results)} {source} conditions")
+        print(f"Mean recall of LLM trials:   {source_results['recall'].mean():.3f}")
+        print(f"Mean precision:              {source_results['precision'].mean():.3f}")
+        print(f"Mean Jaccard:                {source_results['jaccard'].mean():.3f}")
+        print(f"Median synonym latency:      LLM {source_results['llm_seconds'].median():.3f}s (includes cache hits), local {source_results['local_seconds'].median():.3f}s")
+        print(f"Hybrid would skip the LLM:   {len(hybrid) / len(source_results):.1%} of conditions, "
+              f"mean recall on those {hybrid['recall'].mean():.3f}")
+
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+us_gazetteer_init.py
+
+Script that builds the local U.S. gazetteer (data/us_gazetteer.pkl) used by agents/helpers/gazetteer.py
+from the Census Bureau gazetteer files for places and ZIP code tabulation areas.
+
+By default the files are downloaded from census.gov. To build without network access, pass local copies:
+    python scripts/us_gazetteer_init.py --places-file 2023_Gaz_place_national.zip --zcta-file 2023_Gaz_zcta_national.zip
+"""
+
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+# Load environment variables
+load_dotenv()
+base_dir = os.getenv('base_dir')
+# Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+import pandas as pd
+
+
+census_gazetteer_url = 'https://www2.census.gov/geo/docs/maps-data/data/gazetteer/2023_Gazetteer'
+places_url = f'{census_gazetteer_url}/2023_Gaz_place_national.zip'
+zcta_url = f'{census_gazetteer_url}/2023_Gaz_zcta_national.zip'
+
+# Census place names carry their legal/statistical area description, e.g. "Allentown city"
+place_suffix_pattern = r'\s+(city and borough|consolidated government|metropolitan government|unified government|urban county|city|town|township|borough|village|municipality|comunidad|zona urbana|CDP)(\s+\(balance\))?$'
+
+
+def read_gazetteer_file(path):
+    # Gazetteer files are tab separated and the last header has trailing whitespace
+    df = pd.read_csv(path, sep='\t', dtype=str)
+    df.columns = [c.strip() for c in df.columns]
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build data/us_gazetteer.pkl from Census gazetteer files.')
+    parser.add_argument('--places-file', default=places_url, help='Path or URL of the Census national places gazetteer file')
+    parser.add_argument('--zcta-file', default=zcta_url, help='Path or URL of the Census national ZCTA gazetteer file')
+    args = parser.parse_args()
+
+    # Places: one row per incorporated place or CDP
+    places = read_gazetteer_file(args.places_file)
+    places = pd.DataFrame({
+        'name': places['NAME'].str.replace(place_suffix_pattern, '', regex=True).str.strip(),
+        'state': places['USPS'],
+        'latitude': places['INTPTLAT'].astype(float),
+        'longitude': places['INTPTLONG'].astype(float),
+        'land_area': places['ALAND'].astype(float),
+    })
+    # When a city and a CDP share a name within a state keep the larger one
+    places = places.sort_values('land_area', ascending=False)
+    places = places.drop_duplicates(subset=['name', 'state'], keep='first').reset_index(drop=True)
+    places = places[['name', 'state', 'latitude', 'longitude']]
+
+    # ZIP code tabulation areas
+    zips = read_gazetteer_file(args.zcta_file)
+    zips = pd.DataFrame({
+        'zip': zips['GEOID'].str.zfill(5),
+        'latitude': zips['INTPTLAT'].astype(float),
+        'longitude': zips['INTPTLONG'].astype(float),
+    })
+
+    print(f'Places: {len(places)}, ZIP codes: {len(zips)}')
+
+    out = {
+        'places': places,
+        'zips': zips
+    }
+
+    out_file = os.path.join(base_dir, 'data', 'us_gazetteer.pkl')
+    with open(out_file, 'wb') as f:
+        pd.to_pickle(out, f)
+
+if __name__ == "__main__":
+    main()
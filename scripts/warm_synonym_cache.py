@@ -0,0 +1,62 @@
+"""
+warm_synonym_cache.py
+
+Script that pre-populates the synonym cache (agents/helpers/synonym_cache.py) for the top N conditions,
+ranked by how many active trials list them, so common searches never wait on the Synonym Generator Agent.
+Conditions that are already cached are skipped, so the script can be stopped and re-run.
+
+Run the condition embeddings init script first:
+    python scripts/warm_synonym_cache.py --top 500
+"""
+
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+# Load environment variables
+load_dotenv()
+base_dir = os.getenv('base_dir')
+# Change the working directory to the base directory
+os.chdir(base_dir)
+sys.path.append(base_dir)
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils import llm_governor
+from agents.synonym_generator import SynonymGeneratorAgent
+from agents.helpers import synonym_cache
+
+
+def get_top_conditions(top_n):
+    # Conditions with the most active trials are the ones users are most likely to search
+    active_trials_w_conditions_object = pd.read_pickle(os.path.join(base_dir, 'data', 'active_trials_w_condition_embeddings.pkl'))
+    conditions_df = active_trials_w_conditions_object['conditions_df']
+    trial_counts = conditions_df['nct_ids'].apply(len)
+    return conditions_df.loc[trial_counts.sort_values(ascending=False).index[:top_n], 'condition'].tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-populate the synonym cache for the most common conditions.')
+    parser.add_argument('--top', type=int, default=500, help='Number of conditions to warm')
+    parser.add_argument('--workers', type=int, default=4, help='Number of concurrent LLM calls')
+    args = parser.parse_args()
+
+    agent = SynonymGeneratorAgent()
+    conditions = [c for c in get_top_conditions(args.top) if synonym_cache.get_cached_synonyms(c) is None]
+    print(f'Warming synonyms for {len(conditions)} conditions')
+
+    def warm(condition):
+        with llm_governor.priority(llm_governor.BACKGROUND):
+            synonyms = agent.generate_synonyms(condition)
+        synonym_cache.cache_synonyms(condition, synonyms)
+        return condition
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(warm, condition) for condition in conditions]
+        for i, future in enumerate(as_completed(futures), start=1):
+            try:
+                print(f'[{i}/{len(conditions)}] {future.result()}')
+            except Exception as e:
+                print(f'[{i}/{len(conditions)}] failed: {e}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import os
+os.environ.setdefault('base_dir', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+import threading
+import pytest
+from agents import agent_coordinator
+from agents.agent_coordinator import AgentCoordinator
+from utils.single_flight import SingleFlight
+
+PARTIAL = {'title': 'A study', 'about': 'About it'}
+COMPLETE = {'title': 'A study', 'about': 'About it', 'who': 'Adults', 'what': 'Visits'}
+
+
+class StubExplainer:
+    def __init__(self, summaries):
+        #One list of streamed summaries per summarize_trial_stream call
+        self.summaries = list(summaries)
+
+    def summarize_trial_stream(self, nct_id, trial_dfs):
+        yield from self.summaries.pop(0)
+
+    def is_complete_summary(self, trial_summary):
+        return trial_summary is not None and all(trial_summary.get(k) for k in ('about', 'who', 'what'))
+
+    def add_site_details(self, trial_summary, ssp):
+        return dict(trial_summary, nct_id=ssp['nct_id'])
+
+    def generate_trial_markdown(self, trial_data):
+        return ', '.join(sorted(trial_data))
+
+
+@pytest.fixture
+def coordinator(monkeypatch):
+    saved = []
+    monkeypatch.setattr(agent_coordinator.trial_filters, 'get_trial_last_update', lambda nct_id, study_details=None: '2024-01-01')
+    monkeypatch.setattr(agent_coordinator.explanation_store, 'get_explanation', lambda nct_id: None)
+    monkeypatch.setattr(agent_coordinator.explanation_store, 'save_explanation', lambda nct_id, *args: saved.append(nct_id))
+    #Skip the agents' LLM clients, only the explanation flight is exercised
+    coordinator = AgentCoordinator.__new__(AgentCoordinator)
+    coordinator.flights = SingleFlight()
+    coordinator.saved = saved
+    return coordinator
+
+
+def follow(coordinator, session):
+    #Run session in a second thread and wait until it is waiting on the first session's explanation
+    thread = threading.Thread(target=session)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while coordinator.flights.get_stats()['by_kind']['explanation']['followers'] < 1:
+        assert time.monotonic() < deadline, 'second session never joined the explanation flight'
+        time.sleep(0.001)
+    return thread
+
+
+def test_second_session_streams_itself_when_the_first_is_closed(coordinator):
+    ssp, trial_dfs = {'nct_id': 'NCT1'}, {'study_details': None}
+    coordinator.explainer_agent = StubExplainer([[PARTIAL, COMPLETE], [PARTIAL, COMPLETE]])
+
+    first = coordinator.stream_trial_explanation(ssp, trial_dfs)
+    next(first)
+    results = []
+    second = follow(coordinator, lambda: results.extend(coordinator.stream_trial_explanation(ssp, trial_dfs)))
+    #The first user navigates away (Streamlit rerun) before the explanation finished
+    first.close()
+    second.join(5)
+
+    assert results[-1][0] == dict(COMPLETE, nct_id='NCT1')
+    assert coordinator.saved == ['NCT1']
+    assert coordinator.flights.get_stats()['in_flight'] == 0
+
+
+def test_second_session_streams_itself_when_the_first_ends_incomplete(coordinator):
+    ssp, trial_dfs = {'nct_id': 'NCT1'}, {'study_details': None}
+    coordinator.explainer_agent = StubExplainer([[PARTIAL], [PARTIAL, COMPLETE]])
+
+    first = coordinator.stream_trial_explanation(ssp, trial_dfs)
+    next(first)
+    results = []
+    second = follow(coordinator, lambda: results.extend(coordinator.stream_trial_explanation(ssp, trial_dfs)))
+    assert list(first) == []
+    second.join(5)
+
+    assert results[-1][0] == dict(COMPLETE, nct_id='NCT1')
+    assert coordinator.saved == ['NCT1']
+
+
+def test_generation_errors_are_shared(coordinator):
+    ssp, trial_dfs = {'nct_id': 'NCT1'}, {'study_details': None}
+
+    def failing_stream(nct_id, trial_dfs):
+        yield PARTIAL
+        raise KeyError('who_can_join_this_study')
+
+    coordinator.explainer_agent = StubExplainer([])
+    coordinator.explainer_agent.summarize_trial_stream = failing_stream
+
+    first = coordinator.stream_trial_explanation(ssp, trial_dfs)
+    next(first)
+    errors = []
+
+    def second_session():
+        try:
+            list(coordinator.stream_trial_explanation(ssp, trial_dfs))
+        except KeyError as e:
+            errors.append(e)
+
+    second = follow(coordinator, second_session)
+    with pytest.raises(KeyError):
+        list(first)
+    second.join(5)
+
+    assert len(errors) == 1
+    assert coordinator.saved == []
@@ -0,0 +1,77 @@
+import os
+os.environ.setdefault('base_dir', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from agents.helpers.drug_resolver import resolve_drug, normalize_drug_name
+
+
+def trial(interventions, design_groups=(), title='A study'):
+    return {
+        'interventions': pd.DataFrame(list(interventions), columns=['intervention_type', 'name', 'description']),
+        'design_groups': pd.DataFrame(list(design_groups), columns=['group_type', 'title', 'description']),
+        'study_details': pd.DataFrame([{'brief_title': title}]),
+    }
+
+
+def test_description_mentioning_placebo_keeps_the_drug():
+    decision = resolve_drug(trial([
+        ('DRUG', 'Drug X', 'Drug X once daily versus placebo'),
+        ('DRUG', 'Placebo', 'Matching placebo tablets'),
+    ]))
+    assert decision == {'is_drug_study': True, 'drug_name': 'Drug X', 'reason_if_no_drug': ''}
+
+
+def test_description_mentioning_saline_keeps_the_drug():
+    decision = resolve_drug(trial([('DRUG', 'Drug X 10 mg', 'Diluted in saline')]))
+    assert decision['drug_name'] == 'Drug X'
+
+
+def test_placebo_only_trial_is_ambiguous():
+    assert resolve_drug(trial([('DRUG', 'Placebo', None)])) is None
+
+
+def test_experimental_arm_picks_the_drug():
+    decision = resolve_drug(trial(
+        [('DRUG', 'Drug A', None), ('DRUG', 'Drug B', None)],
+        design_groups=[
+            ('EXPERIMENTAL', 'Drug A plus Drug B', 'Drug A added to standard Drug B'),
+            ('ACTIVE_COMPARATOR', 'Drug B alone', None),
+        ],
+    ))
+    assert decision['drug_name'] == 'Drug A'
+
+
+def test_title_picks_the_drug():
+    decision = resolve_drug(trial(
+        [('DRUG', 'Drug A', None), ('BIOLOGICAL', 'Drug B', None)],
+        title='A Study of Drug B in Adults With Asthma',
+    ))
+    assert decision['drug_name'] == 'Drug B'
+
+
+def test_several_candidates_are_ambiguous():
+    decision = resolve_drug(trial(
+        [('DRUG', 'Drug A', None), ('DRUG', 'Drug B', None)],
+        design_groups=[('EXPERIMENTAL', 'Drug A and Drug B', None)],
+        title='Combination therapy for asthma',
+    ))
+    assert decision is None
+
+
+def test_normalize_drug_name():
+    assert normalize_drug_name('Aspirin 81 mg tablets (ASA)') == 'Aspirin'
+    assert normalize_drug_name('Metformin extended-release tablets') == 'Metformin'
+    assert normalize_drug_name('Pembrolizumab [MK-3475] IV infusion') == 'Pembrolizumab'
+    assert normalize_drug_name('Insulin glargine 0.5 mg/kg subcutaneous injection') == 'Insulin glargine'
+
+
+def test_no_drug_decision_names_the_interventions():
+    decision = resolve_drug(trial([
+        ('DEVICE', 'Smartwatch', None),
+        ('Behavioral', 'Cognitive behavioral therapy', None),
+    ]))
+    assert decision == {
+        'is_drug_study': False,
+        'drug_name': '',
+        'reason_if_no_drug': 'This study tests a device (Smartwatch), a behavioral program (Cognitive behavioral therapy) rather than a drug.',
+    }
@@ -0,0 +1,77 @@
+import os
+os.environ.setdefault('base_dir', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import pytest
+from agents.helpers import gazetteer
+
+
+@pytest.fixture
+def places_file(tmp_path, monkeypatch):
+    path = tmp_path / 'us_gazetteer.pkl'
+    pd.to_pickle({
+        'places': pd.DataFrame([
+            ('Boston', 'MA', 42.3601, -71.0589),
+            ('Los Angeles', 'CA', 34.0522, -118.2437),
+            ('Toronto', 'OH', 40.4642, -80.6009),
+            ('Springfield', 'IL', 39.7817, -89.6501),
+            ('Springfield', 'MA', 42.1015, -72.5898),
+        ], columns=['name', 'state', 'latitude', 'longitude']),
+        'zips': pd.DataFrame([('19103', 39.9522, -75.1741)], columns=['zip', 'latitude', 'longitude']),
+    }, path)
+    monkeypatch.setattr(gazetteer, 'gazetteer_file', str(path))
+    monkeypatch.setattr(gazetteer, '_index', None)
+    return path
+
+
+@pytest.fixture
+def no_places_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(gazetteer, 'gazetteer_file', str(tmp_path / 'missing.pkl'))
+    monkeypatch.setattr(gazetteer, '_index', None)
+
+
+@pytest.mark.parametrize('query, name, kind, score', [
+    ('Pennsylvania', 'Pennsylvania', 'state', 1.0),
+    ('PA', 'Pennsylvania', 'state', 1.0),
+    ('19103', '19103', 'zip', 1.0),
+    ('19103-1234', '19103', 'zip', 1.0),
+    ('Boston, MA', 'Boston, Massachusetts', 'place', 1.0),
+    ('boston, massachusetts, USA', 'Boston, Massachusetts', 'place', 1.0),
+    ('Boston MA', 'Boston, Massachusetts', 'place', 1.0),
+    ('LA', 'Los Angeles, California', 'place', 1.0),
+    ('Toronto', 'Toronto, Ohio', 'place', gazetteer.BARE_CITY_SCORE),
+    ('Springfield', 'Springfield, Illinois', 'place', 0.5),
+])
+def test_lookup(places_file, query, name, kind, score):
+    match = gazetteer.lookup(query)
+    assert (match.name, match.kind) == (name, kind)
+    assert match.score == pytest.approx(score)
+
+
+@pytest.mark.parametrize('query, confident', [
+    ('pensylvania', True),
+    ('pnsylvnia', False),
+])
+def test_misspelled_state(places_file, query, confident):
+    match = gazetteer.lookup(query)
+    assert match.name == 'Pennsylvania'
+    assert (match.score >= gazetteer.MIN_SCORE) == confident
+
+
+@pytest.mark.parametrize('query', ['Paris, France', 'Toronto, Ontario', 'Atlantis', '99999', ''])
+def test_lookup_misses(places_file, query):
+    assert gazetteer.lookup(query) is None
+
+
+@pytest.mark.parametrize('query, name, kind', [
+    ('Massachusetts', 'Massachusetts', 'state'),
+    ('LA', 'Louisiana', 'state'),
+    ('Boston, MA', None, None),
+    ('19103', None, None),
+])
+def test_states_only_without_places_file(no_places_file, query, name, kind):
+    match = gazetteer.lookup(query)
+    if name is None:
+        assert match is None
+    else:
+        assert (match.name, match.kind, match.score) == (name, kind, 1.0)
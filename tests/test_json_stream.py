@@ -0,0 +1,56 @@
+import json
+from utils.json_stream import TopLevelFieldParser
+
+DOCUMENT = {
+    'title': 'He said "take it \\ with food"',
+    'about': 'Café au lait spots — and \U0001F600',
+    'who': {'inclusion_criteria': ['Age {18+}', 'No [prior] "therapy"'], 'nested': {'deep': [1, [2, 3], {'x': None}]}},
+    'what': [{'summary_of_activities': 'Visits, tests'}, True, 1.5e3],
+}
+
+
+def feed_all(chunks):
+    parser = TopLevelFieldParser()
+    fields = []
+    for chunk in chunks:
+        fields.extend(parser.feed(chunk))
+    return fields
+
+
+def test_fields_come_back_in_order_whatever_the_chunking():
+    text = json.dumps(DOCUMENT)
+    for size in (1, 2, 3, 7, len(text)):
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        assert feed_all(chunks) == list(DOCUMENT.items()), size
+
+
+def test_escaped_quotes_and_backslashes_stay_inside_strings():
+    fields = feed_all(['{"a": "x \\"}, {\\" y", ', '"b": "ends with \\\\", "c": 1}'])
+    assert fields == [('a', 'x "}, {" y'), ('b', 'ends with \\'), ('c', 1)]
+
+
+def test_escape_split_across_chunks():
+    #The backslash arrives at the end of one chunk and the escaped quote at the start of the next
+    fields = feed_all(['{"a": "say \\', '"hi\\', '" now", "b": 2}'])
+    assert fields == [('a', 'say "hi" now'), ('b', 2)]
+
+
+def test_unicode_escape_split_across_chunks():
+    fields = feed_all(['{"a": "caf\\u00', 'e9", "b": "\\ud83d', '\\ude00"}'])
+    assert fields == [('a', 'café'), ('b', '\U0001F600')]
+
+
+def test_field_is_only_returned_once_nested_values_close():
+    parser = TopLevelFieldParser()
+    assert parser.feed('{"who": {"list": [1, {"k": "v, w"') == []
+    assert parser.feed('}, 2], "more": {}') == []
+    assert parser.feed('}, "what": []') == [('who', {'list': [1, {'k': 'v, w'}, 2], 'more': {}})]
+    assert parser.feed('}') == [('what', [])]
+
+
+def test_truncated_stream_keeps_the_completed_fields():
+    parser = TopLevelFieldParser()
+    fields = parser.feed('{"about": "A study", "who": {"inclusion_criteria": ["Adults"')
+    assert fields == [('about', 'A study')]
+    #Nothing more arrives, the unfinished field is never returned
+    assert parser.feed('') == []
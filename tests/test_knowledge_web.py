@@ -0,0 +1,50 @@
+import os
+os.environ.setdefault('base_dir', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from agents.helpers import knowledge_web
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'knowledge')
+#Saved pages and the section get_condition_page / get_drug_page extract from them
+PAGES = [
+    ('medlineplus_diabetes.html', {'tag': 'div', 'id': 'mplus-content'}),
+    ('dailymed_metformin.html', {'tag': 'div', 'class_': 'drug-label-sections'}),
+]
+
+requires_lxml = pytest.mark.skipif(knowledge_web.etree is None, reason='lxml is not installed')
+
+
+def read_page(name):
+    with open(os.path.join(FIXTURE_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+@requires_lxml
+@pytest.mark.parametrize('name, section', PAGES)
+def test_lxml_and_bs4_extract_the_same_text(name, section):
+    content = read_page(name)
+    start = knowledge_web._section_start(content, **section)
+    lxml_text = knowledge_web._section_text_lxml(knowledge_web._parse_section(content, start, section['tag']))
+
+    bs4_text = knowledge_web._section_text_bs4(content, **section)
+    assert lxml_text == bs4_text
+    assert knowledge_web.extract_section_text(content, **section) == bs4_text
+
+
+@pytest.mark.parametrize('html, found', [
+    ('<div class="drug-label-sections">', True),
+    ('<div class="col drug-label-sections" id="x">', True),
+    ("<div id='x' class='drug-label-sections col'>", True),
+    ('<div class="drug-label-sections-wrapper">', False),
+    ('<div class="my-drug-label-sections">', False),
+    ('<div data-class="drug-label-sections">', False),
+])
+def test_section_start_matches_whole_class_names(html, found):
+    start = knowledge_web._section_start(f'<body>{html}</div></body>', 'div', class_='drug-label-sections')
+    assert (start is not None) == found
+
+
+def test_section_start_skips_similar_classes():
+    content = read_page('dailymed_metformin.html')
+    start = knowledge_web._section_start(content, 'div', class_='drug-label-sections')
+    assert content[start:].startswith('<div class="col-md-12 drug-label-sections"')
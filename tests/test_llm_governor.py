@@ -0,0 +1,138 @@
+import time
+import threading
+import pytest
+from utils import llm_governor
+from utils.llm_governor import LLMGovernor, GovernorTimeout, INTERACTIVE, NORMAL, BACKGROUND
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def governor(clock, rpm=600, tpm=600000, max_concurrency=10):
+    return LLMGovernor(rpm, tpm, max_concurrency, clock=clock)
+
+
+def test_requests_per_minute_limit(clock):
+    llm = governor(clock, rpm=2)
+    llm.acquire(10, timeout=0)
+    llm.acquire(10, timeout=0)
+    with pytest.raises(GovernorTimeout):
+        llm.acquire(10, timeout=0)
+
+    #2 RPM refills one request every 30 seconds
+    clock.advance(29)
+    with pytest.raises(GovernorTimeout):
+        llm.acquire(10, timeout=0)
+    clock.advance(1)
+    assert llm.acquire(10, timeout=0) == 0
+
+
+def test_tokens_per_minute_limit(clock):
+    llm = governor(clock, tpm=6000)
+    llm.acquire(5000, timeout=0)
+    with pytest.raises(GovernorTimeout):
+        llm.acquire(2000, timeout=0)
+
+    #6000 TPM refills 100 tokens a second, 1000 more are needed
+    clock.advance(10)
+    llm.acquire(2000, timeout=0)
+    assert llm.get_stats()['tokens_available'] == pytest.approx(0)
+
+
+def test_request_larger_than_the_bucket_waits_for_a_full_bucket(clock):
+    llm = governor(clock, tpm=6000)
+    llm.acquire(100, timeout=0)
+    with pytest.raises(GovernorTimeout):
+        llm.acquire(50000, timeout=0)
+    clock.advance(1)
+    llm.acquire(50000, timeout=0)
+
+
+def test_concurrency_limit(clock):
+    llm = governor(clock, max_concurrency=1)
+    llm.acquire(10, timeout=0)
+    with pytest.raises(GovernorTimeout):
+        llm.acquire(10, timeout=0)
+    llm.release()
+    llm.acquire(10, timeout=0)
+    assert llm.get_stats()['in_flight'] == 1
+
+
+def test_pause_stops_grants_until_it_ends(clock):
+    llm = governor(clock)
+    llm.pause(5)
+    with pytest.raises(GovernorTimeout):
+        llm.acquire(10, timeout=0)
+    clock.advance(5)
+    llm.acquire(10, timeout=0)
+    assert llm.get_stats()['pauses'] == 1
+    assert llm.get_stats()['by_priority']['normal']['timeouts'] == 1
+
+
+def test_higher_priority_requests_are_granted_first(clock):
+    llm = governor(clock, max_concurrency=1)
+    llm.acquire(10, timeout=0)
+    granted = []
+
+    def request(level):
+        llm.acquire(10, level)
+        granted.append(level)
+        llm.release()
+
+    #Queued lowest priority first, so the order of arrival cannot explain the order of grants
+    threads = []
+    for depth, level in enumerate([BACKGROUND, NORMAL, INTERACTIVE], start=1):
+        threads.append(threading.Thread(target=request, args=(level,)))
+        threads[-1].start()
+        deadline = time.monotonic() + 5
+        while llm.get_stats()['queue_depth'] < depth:
+            assert time.monotonic() < deadline, 'request never queued'
+            time.sleep(0.001)
+
+    assert llm.get_stats()['queue_depth_by_priority'] == {'background': 1, 'normal': 1, 'interactive': 1}
+    llm.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert granted == [INTERACTIVE, NORMAL, BACKGROUND]
+
+
+def test_background_waits_behind_queued_interactive_work(clock):
+    llm = governor(clock, rpm=1)
+    llm.acquire(10, INTERACTIVE, timeout=0)
+    interactive = threading.Thread(target=lambda: llm.acquire(10, INTERACTIVE))
+    interactive.start()
+    deadline = time.monotonic() + 5
+    while llm.get_stats()['queue_depth'] < 1:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+    #Capacity is back, but an interactive request is first in line
+    clock.advance(60)
+    with pytest.raises(GovernorTimeout):
+        llm.acquire(10, BACKGROUND, timeout=0)
+    llm.release()
+    interactive.join(5)
+    assert not interactive.is_alive()
+
+
+def test_background_context_lowers_agent_priority():
+    assert llm_governor.get_priority('synonym_generator') == INTERACTIVE
+    assert llm_governor.get_priority('trial_explainer') == NORMAL
+    with llm_governor.priority(BACKGROUND):
+        assert llm_governor.get_priority('synonym_generator') == BACKGROUND
+        assert llm_governor.get_priority('trial_explainer') == BACKGROUND
+    assert llm_governor.get_priority('unknown_agent') == NORMAL
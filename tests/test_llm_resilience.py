@@ -0,0 +1,179 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import openai
+import pytest
+from utils import llm_resilience
+from utils.llm_resilience import call_with_policy, LLMDeadlineExceeded
+from utils.llm_stub import StubOpenAIClient
+
+REQUEST = httpx.Request('POST', 'https://example.openai.azure.com/openai/deployments/gpt/chat/completions')
+MESSAGES = [{'role': 'user', 'content': 'Generate synonyms for: asthma'}]
+FUNCTIONS = [{'name': 'generate_disease_synonyms', 'parameters': {'type': 'object', 'properties': {}}}]
+
+
+def status_error(status_code, retry_after=None):
+    headers = {'retry-after': retry_after} if retry_after else {}
+    response = httpx.Response(status_code, headers=headers, request=REQUEST)
+    return openai.APIStatusError(f'Error code: {status_code}', response=response, body=None)
+
+
+def stub_send(errors=(), client=None, on_call=None):
+    #Raise the given errors in turn, then answer like the agents' chat completion call
+    client = client or StubOpenAIClient()
+    errors = list(errors)
+    calls = []
+
+    def send(timeout):
+        calls.append(timeout)
+        if on_call:
+            on_call(timeout)
+        if errors:
+            raise errors.pop(0)
+        return client.chat.completions.create(messages=MESSAGES, functions=FUNCTIONS, function_call={'name': 'generate_disease_synonyms'})
+
+    send.calls = calls
+    return send
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_resilience, '_clock', clock)
+    monkeypatch.setattr(llm_resilience, '_sleep', clock.sleep)
+    monkeypatch.setattr(llm_resilience, 'MAX_ATTEMPTS', 3)
+    monkeypatch.setenv('llm_deadline_test_agent', '10')
+    return clock
+
+
+@pytest.fixture
+def max_jitter(monkeypatch):
+    #Full jitter draws from [0, cap], take the cap so the delays are known
+    monkeypatch.setattr(llm_resilience.random, 'uniform', lambda low, high: high)
+
+
+def test_retries_with_exponential_backoff(clock, max_jitter):
+    send = stub_send([status_error(503), openai.APITimeoutError(request=REQUEST)])
+    result, info = call_with_policy('test_agent', send, hedge=False)
+
+    assert 'asthma' in result.choices[0].message.function_call.arguments.lower()
+    assert info == {'retries': 2, 'hedges': 0}
+    assert clock.sleeps == [0.5, 1.0]
+    #Each attempt gets what is left of the deadline as its request timeout
+    assert send.calls == [10, 9.5, 8.5]
+
+
+def test_backoff_is_jittered_below_the_cap():
+    for attempt in range(8):
+        cap = min(llm_resilience.BACKOFF_MAX_SECONDS, llm_resilience.BACKOFF_BASE_SECONDS * 2 ** attempt)
+        delays = {llm_resilience.backoff_delay(attempt) for _ in range(20)}
+        assert all(0 <= delay <= cap for delay in delays)
+        assert len(delays) > 1
+
+
+def test_retry_after_is_honoured(clock):
+    send = stub_send([status_error(429, retry_after='2')])
+    call_with_policy('test_agent', send, hedge=False)
+    assert clock.sleeps == [2.0]
+
+
+def test_backoff_past_the_deadline_fails_without_sleeping(clock):
+    #The first attempt takes 6 of the 10 seconds, the 5 second Retry-After would end past the deadline
+    send = stub_send([status_error(429, retry_after='5')], on_call=lambda timeout: clock.sleep(6))
+    with pytest.raises(LLMDeadlineExceeded):
+        call_with_policy('test_agent', send, hedge=False)
+    assert clock.sleeps == [6]
+    assert len(send.calls) == 1
+
+
+def test_gives_up_after_max_attempts(clock, max_jitter):
+    send = stub_send([status_error(503)] * 5)
+    with pytest.raises(openai.APIStatusError):
+        call_with_policy('test_agent', send, hedge=False)
+    assert len(send.calls) == 3
+
+
+def test_non_retryable_errors_are_raised_at_once(clock):
+    send = stub_send([status_error(400)])
+    with pytest.raises(openai.APIStatusError):
+        call_with_policy('test_agent', send, hedge=False)
+    assert len(send.calls) == 1
+    assert clock.sleeps == []
+
+
+class ClosableResponse:
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+def test_fast_primary_is_not_hedged(monkeypatch):
+    monkeypatch.setattr(llm_resilience, 'hedge_delay', lambda agent: 5.0)
+    send = stub_send()
+    _, info = call_with_policy('test_hedge_fast', send, hedge=True)
+    assert info['hedges'] == 0
+    assert len(send.calls) == 1
+
+
+def test_hedge_wins_and_the_slow_primary_is_closed(monkeypatch):
+    monkeypatch.setattr(llm_resilience, 'hedge_delay', lambda agent: 0.01)
+    hedge_answered = threading.Event()
+    slow_response = ClosableResponse()
+    calls = []
+
+    def send(timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            #The primary is stuck until the hedge has answered
+            hedge_answered.wait(5)
+            return slow_response
+        return 'hedge response'
+
+    result, info = call_with_policy('test_hedge_win', send, hedge=True)
+    hedge_answered.set()
+
+    assert result == 'hedge response'
+    assert info['hedges'] == 1
+    assert llm_resilience.get_stats()['test_hedge_win']['hedge_wins'] == 1
+    assert slow_response.closed.wait(5)
+
+
+def test_hedge_that_never_started_is_cancelled(monkeypatch):
+    #One worker: the stuck primary keeps the queued hedge from ever being sent
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(llm_resilience, '_hedge_executor', executor)
+    monkeypatch.setattr(llm_resilience, 'hedge_delay', lambda agent: 0.01)
+    monkeypatch.setattr(llm_resilience, 'MAX_ATTEMPTS', 1)
+    monkeypatch.setenv('llm_deadline_test_hedge_cancel', '0.2')
+    release = threading.Event()
+    calls = []
+
+    def send(timeout):
+        calls.append(timeout)
+        release.wait(5)
+        return ClosableResponse()
+
+    start = time.monotonic()
+    with pytest.raises(openai.APITimeoutError):
+        call_with_policy('test_hedge_cancel', send, hedge=True)
+    assert time.monotonic() - start < 1.0
+    release.set()
+    executor.shutdown(wait=True)
+
+    assert len(calls) == 1
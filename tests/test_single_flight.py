@@ -0,0 +1,95 @@
+import time
+import threading
+import pytest
+from utils.single_flight import SingleFlight
+
+
+class Cancelled(BaseException):
+    #Stands in for Streamlit's rerun / stop exceptions, which are BaseExceptions too
+    pass
+
+
+def wait_for_followers(flights, kind, count):
+    deadline = time.monotonic() + 5
+    while flights.get_stats()['by_kind'].get(kind, {}).get('followers', 0) < count:
+        assert time.monotonic() < deadline, 'follower never joined the flight'
+        time.sleep(0.001)
+
+
+def run_follower(flights, key, fn, results):
+    def follow():
+        try:
+            results.append(flights.do(key, fn))
+        except Exception as e:
+            results.append(e)
+    thread = threading.Thread(target=follow)
+    thread.start()
+    return thread
+
+
+def test_follower_shares_the_leader_result():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return 'summary'
+
+    results = []
+    leader = run_follower(flights, ('explanation', 'NCT1'), work, results)
+    while flights.get_stats()['in_flight'] == 0:
+        time.sleep(0.001)
+    follower = run_follower(flights, ('explanation', 'NCT1'), work, results)
+    wait_for_followers(flights, 'explanation', 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert results == ['summary', 'summary']
+    assert len(calls) == 1
+
+
+def test_follower_gets_the_leader_error():
+    flights = SingleFlight()
+    future, is_leader = flights.begin(('explanation', 'NCT1'))
+    results = []
+    follower = run_follower(flights, ('explanation', 'NCT1'), lambda: 'unused', results)
+    wait_for_followers(flights, 'explanation', 1)
+    flights.finish(('explanation', 'NCT1'), error=ValueError('bad trial'))
+    follower.join(5)
+
+    assert is_leader
+    assert isinstance(results[0], ValueError)
+
+
+def test_cancelled_leader_hands_the_work_to_a_follower():
+    flights = SingleFlight()
+    started = threading.Event()
+    cancel = threading.Event()
+
+    def cancelled_work():
+        started.set()
+        cancel.wait(5)
+        raise Cancelled()
+
+    def leader():
+        with pytest.raises(Cancelled):
+            flights.do(('explanation', 'NCT1'), cancelled_work)
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+    started.wait(5)
+
+    results = []
+    follower = run_follower(flights, ('explanation', 'NCT1'), lambda: 'generated by the follower', results)
+    wait_for_followers(flights, 'explanation', 1)
+    cancel.set()
+    leader_thread.join(5)
+    follower.join(5)
+
+    assert results == ['generated by the follower']
+    stats = flights.get_stats()
+    assert stats['in_flight'] == 0
+    assert stats['by_kind']['explanation'] == {'leaders': 2, 'followers': 1, 'abandoned': 1}
@@ -0,0 +1,128 @@
+import os
+os.environ.setdefault('base_dir', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.neighbors import BallTree
+from agents.helpers import trial_filters
+from agents.helpers.geocoding import GeocodedLocation
+
+ORIGINS = {
+    'Philadelphia, PA': GeocodedLocation('Philadelphia, Pennsylvania', 39.9526, -75.1652),
+    'New York, NY': GeocodedLocation('New York, New York', 40.7128, -74.0060),
+}
+
+#Trenton lies between both origins and within 250 miles of each
+FACILITIES = pd.DataFrame([
+    ('NCT1', 'Penn', 39.9496, -75.1932),
+    ('NCT1', 'Trenton Clinic', 40.2206, -74.7597),
+    ('NCT2', 'Mount Sinai', 40.7900, -73.9526),
+    ('NCT2', 'Cedars-Sinai', 34.0754, -118.3804),
+    ('NCT3', 'Brigham', 42.3358, -71.1069),
+], columns=['nct_id', 'name', 'latitude', 'longitude'])
+
+
+@pytest.fixture
+def geocode(monkeypatch):
+    monkeypatch.setattr(trial_filters.geocoding, 'geocode', lambda location: ORIGINS.get(location))
+
+
+@pytest.fixture
+def facility_index(monkeypatch):
+    tree = BallTree(np.radians(FACILITIES[['latitude', 'longitude']].to_numpy()), metric='haversine')
+    monkeypatch.setattr(trial_filters, 'active_facilities', FACILITIES)
+    monkeypatch.setattr(trial_filters, 'facility_tree', tree)
+
+
+@pytest.fixture
+def no_facility_index(monkeypatch):
+    monkeypatch.setattr(trial_filters, 'active_facilities', None)
+    monkeypatch.setattr(trial_filters, 'facility_tree', None)
+    #The site search query filters on the searched trials, which are NCT1 and NCT2 in these tests
+    monkeypatch.setattr(trial_filters.sql_util, 'get_table', lambda sql: FACILITIES[FACILITIES['nct_id'] != 'NCT3'].copy())
+
+
+def trials(*nct_ids):
+    return pd.DataFrame({'nct_ids': list(nct_ids)})
+
+
+@pytest.mark.parametrize('index', ['facility_index', 'no_facility_index'])
+def test_sites_are_labelled_with_their_nearest_origin(geocode, index, request):
+    request.getfixturevalue(index)
+    sites = trial_filters.get_sites_sorted_by_distance(trials('NCT1', 'NCT2'), list(ORIGINS), max_distance=250)
+
+    nearest = dict(zip(sites['name'], sites['nearest_origin']))
+    assert nearest == {
+        'Penn': 'Philadelphia, PA',
+        'Trenton Clinic': 'Philadelphia, PA',
+        'Mount Sinai': 'New York, NY',
+    }
+    assert sites['distance'].is_monotonic_increasing
+    assert 'nearest_origin_index' not in sites.columns
+
+
+def test_sites_near_several_origins_are_listed_once(geocode, facility_index):
+    sites = trial_filters.get_sites_sorted_by_distance(trials('NCT1'), list(ORIGINS), max_distance=250)
+
+    assert sorted(sites['name']) == ['Penn', 'Trenton Clinic']
+
+
+def test_single_location_has_no_nearest_origin_column(geocode, facility_index):
+    sites = trial_filters.get_sites_sorted_by_distance(trials('NCT1', 'NCT2'), 'New York, NY', max_distance=250)
+
+    assert 'nearest_origin' not in sites.columns
+    assert sites.loc[0, 'name'] == 'Mount Sinai'
+
+
+def test_no_location_is_a_clear_error(geocode, facility_index):
+    with pytest.raises(ValueError, match='No location'):
+        trial_filters.get_sites_sorted_by_distance(trials('NCT1'), [])
+
+
+def test_add_origin_distances_needs_an_origin():
+    with pytest.raises(ValueError, match='origin'):
+        trial_filters.add_origin_distances(FACILITIES.copy(), [], [])
+
+
+AGE_STRINGS = [
+    '18 Years', '65 Years', '17.5 Years', '1 Year', '6 Months', '12 Weeks', '30 Days', '0 Years',
+    'N/A', '', None, np.nan, 'Years', '18', 'about 18 years', '18 yrs',
+]
+
+
+def baseline_age_groups(min_age, max_age):
+    #determine_age_groups before the bitmask, kept as the reference for the vectorized version
+    min_age_val = 0 if min_age is None else trial_filters.parse_age(min_age) or 0
+    max_age_val = 120 if max_age is None else trial_filters.parse_age(max_age) or 120
+    groups = []
+    if min_age_val <= 17 and max_age_val >= 0:
+        groups.append("Child: 0-17")
+    if min_age_val <= 65 and max_age_val >= 18:
+        groups.append("Adult: 18-64")
+    if max_age_val >= 65:
+        groups.append("Senior: 65+")
+    return groups
+
+
+def test_parse_age_series_matches_parse_age():
+    ages = pd.Series(AGE_STRINGS, dtype=object)
+    expected = ages.apply(trial_filters.parse_age).astype(float)
+
+    pd.testing.assert_series_equal(trial_filters.parse_age_series(ages), expected, check_names=False)
+
+
+def test_age_group_mask_matches_the_old_labels():
+    pairs = [(min_age, max_age) for min_age in AGE_STRINGS for max_age in AGE_STRINGS]
+    min_ages = pd.Series([min_age for min_age, _ in pairs], dtype=object)
+    max_ages = pd.Series([max_age for _, max_age in pairs], dtype=object)
+
+    #Same fills as get_sites_sorted_by_distance_with_age_gender
+    masks = trial_filters.age_group_mask(
+        trial_filters.parse_age_series(min_ages).fillna(0), trial_filters.parse_age_series(max_ages).fillna(120)
+    )
+
+    for (min_age, max_age), mask in zip(pairs, masks):
+        expected = baseline_age_groups(min_age, max_age)
+        assert trial_filters.AGE_GROUP_LABELS[mask] == ", ".join(expected), (min_age, max_age)
+        assert trial_filters.determine_age_groups(min_age, max_age) == baseline_age_groups(min_age, max_age)
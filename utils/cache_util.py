@@ -0,0 +1,179 @@
+"""
+Utility functions and classes for caching results that are expensive to recompute (geocodes, LLM outputs, web pages).
+
+PersistentCache keeps a small in-memory LRU in front of an on-disk SQLite store so cached values are shared
+by every Streamlit session and survive app restarts. Entries can carry a TTL, and the on-disk store can be
+bounded in number of entries and/or total bytes, evicting the least recently used entries first.
+"""
+
+
+import os
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+load_dotenv()
+
+
+#Default folder for cache files, can be overridden with the cache_dir environment variable
+cache_dir = os.getenv('cache_dir') or os.path.join(os.getenv('base_dir') or os.getcwd(), 'data', 'cache')
+
+#Sentinel so callers can cache None (e.g. negative caching) and still tell it apart from a miss
+MISSING = object()
+
+
+class PersistentCache:
+    def __init__(self, name, ttl_seconds=None, max_entries=None, memory_entries=1024, path=None, max_bytes=None):
+        """
+        Initialize a named cache backed by data/cache/<name>.sqlite.
+
+        ttl_seconds: default time to live for entries (None means entries never expire).
+        max_entries: maximum number of entries kept on disk (None means unbounded).
+        memory_entries: number of entries kept in the in-memory LRU.
+        max_bytes: maximum total size of the pickled values kept on disk (None means unbounded).
+        """
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.path = path or os.path.join(cache_dir, f'{name}.sqlite')
+
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB,
+                expires_at REAL,
+                accessed_at REAL,
+                size INTEGER
+            )
+        """)
+        #Cache files created before the size column existed
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(cache)')]
+        if 'size' not in columns:
+            self._conn.execute('ALTER TABLE cache ADD COLUMN size INTEGER')
+            self._conn.execute('UPDATE cache SET size = length(value)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)')
+        self._conn.commit()
+
+    def get(self, key, default=MISSING):
+        """
+        Return the cached value for key, or default if it is missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            #Check the in-memory LRU first
+            if key in self._memory:
+                value, expires_at = self._memory[key]
+                if expires_at is None or expires_at > now:
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+            #Fall back to the on-disk store
+            row = self._conn.execute('SELECT value, expires_at FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return default
+
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+                self._conn.commit()
+                return default
+
+            self._conn.execute('UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+
+            value = pickle.loads(value)
+            self._remember(key, value, expires_at)
+            return value
+
+    def set(self, key, value, ttl_seconds=MISSING):
+        """
+        Store value under key. ttl_seconds overrides the cache default for this entry.
+        """
+        ttl_seconds = self.ttl_seconds if ttl_seconds is MISSING else ttl_seconds
+        now = time.time()
+        expires_at = None if ttl_seconds is None else now + ttl_seconds
+
+        data = pickle.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)',
+                (key, data, expires_at, now, len(data))
+            )
+            self._evict()
+            self._conn.commit()
+            self._remember(key, value, expires_at)
+
+    def delete(self, key):
+        """Remove key from both the in-memory and on-disk store."""
+        with self._lock:
+            self._memory.pop(key, None)
+            self._conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+            self._conn.commit()
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute('DELETE FROM cache')
+            self._conn.commit()
+
+    def __contains__(self, key):
+        return self.get(key) is not MISSING
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def total_bytes(self):
+        """Total size of the values stored on disk."""
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+
+    def _remember(self, key, value, expires_at):
+        #Keep the in-memory LRU bounded
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        #Drop expired entries, then the least recently used ones above max_entries and max_bytes
+        self._conn.execute('DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?', (time.time(),))
+        if self.max_entries is not None:
+            count = self._conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?)',
+                    (count - self.max_entries,)
+                )
+        if self.max_bytes is not None:
+            excess = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0] - self.max_bytes
+            if excess > 0:
+                evicted = []
+                for key, size in self._conn.execute('SELECT key, size FROM cache ORDER BY accessed_at ASC'):
+                    if excess <= 0:
+                        break
+                    evicted.append((key,))
+                    excess -= size or 0
+                self._conn.executemany('DELETE FROM cache WHERE key = ?', evicted)
+                for (key,) in evicted:
+                    self._memory.pop(key, None)
+
+
+#Example usage of the cache
+'''
+cache = PersistentCache('example', ttl_seconds=60)
+cache.set('key', {'a': 1})
+cache.get('key')
+'''
@@ -0,0 +1,137 @@
+"""
+Utility functions for recording and replaying external traffic (AACT queries, web pages, geocodes, LLM calls).
+
+With cassette_mode=record every call made through through() is executed and its result and latency are saved to
+a cassette file (a zlib compressed pickle). With cassette_mode=replay the results are served from the cassette
+instead, so a real search can be re-run offline and reproducibly, sleeping the original latency or none at all
+(cassette_replay_latency=original|zero). A request missing from the cassette raises CassetteMiss.
+
+Hooked in: sql_util.get_table, knowledge_web._http_get, geocoding.geocode and openai_util.create_chat_completion.
+Identical requests are replayed in the order they were recorded. Streamed LLM responses are recorded as their
+list of chunks, so in record mode a stream is only passed on once it has finished.
+
+Settings (environment variables):
+- cassette_mode: off (default), record or replay
+- cassette_file: cassette path (default <base_dir>/data/cassettes/session.cassette)
+- cassette_replay_latency: original (default) or zero
+"""
+
+import os
+import time
+import json
+import zlib
+import atexit
+import pickle
+import hashlib
+import threading
+from collections import defaultdict
+from dotenv import load_dotenv
+load_dotenv()
+
+
+CASSETTE_MODE = os.getenv('cassette_mode', 'off')
+CASSETTE_FILE = os.getenv('cassette_file') or os.path.join(os.getenv('base_dir', '.'), 'data', 'cassettes', 'session.cassette')
+REPLAY_LATENCY = os.getenv('cassette_replay_latency', 'original')
+#Save the cassette every this many recorded calls, on top of saving at exit
+SAVE_EVERY = 25
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when a request was not recorded in the cassette."""
+
+
+class Cassette:
+    def __init__(self, path, mode):
+        """
+        Open a cassette file for recording or replaying.
+        """
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        #key -> [(kind, result, latency_seconds), ...] in the order they were recorded
+        self.entries = defaultdict(list)
+        self.positions = defaultdict(int)
+        self.unsaved = 0
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                self.entries.update(pickle.loads(zlib.decompress(f.read())))
+
+    @staticmethod
+    def make_key(kind, request):
+        raw = json.dumps([kind, request], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def record(self, key, kind, result, latency_seconds):
+        with self.lock:
+            self.entries[key].append((kind, result, latency_seconds))
+            self.unsaved += 1
+            save = self.unsaved >= SAVE_EVERY
+        if save:
+            self.save()
+
+    def replay(self, key, kind):
+        with self.lock:
+            recorded = self.entries.get(key)
+            if not recorded:
+                raise CassetteMiss(f"No {kind} response recorded for this request in {self.path}")
+            #Identical requests replay in order, then the last response repeats
+            position = min(self.positions[key], len(recorded) - 1)
+            self.positions[key] += 1
+        _, result, latency_seconds = recorded[position]
+        if REPLAY_LATENCY == 'original' and latency_seconds:
+            time.sleep(latency_seconds)
+        return result
+
+    def save(self):
+        with self.lock:
+            data = zlib.compress(pickle.dumps(dict(self.entries), protocol=pickle.HIGHEST_PROTOCOL))
+            self.unsaved = 0
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def summary(self):
+        with self.lock:
+            counts = defaultdict(int)
+            for recorded in self.entries.values():
+                for kind, _, _ in recorded:
+                    counts[kind] += 1
+        return dict(counts)
+
+
+_cassette = None
+if CASSETTE_MODE in ('record', 'replay'):
+    _cassette = Cassette(CASSETTE_FILE, CASSETTE_MODE)
+    if CASSETTE_MODE == 'record':
+        atexit.register(_cassette.save)
+
+
+def through(kind, request, fn):
+    """
+    Return fn(), recording it or replaying it from the cassette depending on cassette_mode.
+    kind names the traffic ('sql', 'http', 'geocode', 'llm') and request is a JSON-able description of the call.
+    """
+    if _cassette is None:
+        return fn()
+
+    key = Cassette.make_key(kind, request)
+    if _cassette.mode == 'replay':
+        return _cassette.replay(key, kind)
+
+    start = time.perf_counter()
+    result = fn()
+    _cassette.record(key, kind, result, time.perf_counter() - start)
+    return result
+
+
+def get_cassette():
+    return _cassette
+
+
+#Example usage
+'''
+#.env: cassette_mode=record, run a search in the app, stop it, then cassette_mode=replay to re-run it offline
+df = through('sql', ['select 1'], lambda: sql_util.get_table('select 1'))
+'''
@@ -0,0 +1,112 @@
+"""
+Utility functions and classes for caching web pages on disk with HTTP validators.
+
+The MedlinePlus topic pages and DailyMed labels the Knowledge Curator Agent reads change rarely, yet were fetched
+on every search and trial click. HTTPCache keeps each page body on disk (a PersistentCache bounded in bytes,
+least recently used pages evicted first) together with its ETag and Last-Modified headers:
+- a fresh entry is served without any request
+- a stale entry is revalidated with a conditional GET (If-None-Match / If-Modified-Since), a 304 renews it
+  without transferring the page again
+- if revalidation fails (timeout, 5xx) the stale page is served rather than failing the page
+
+An entry is fresh for the server's Cache-Control max-age when it sends a positive one, otherwise for
+fresh_seconds, since NLM sends short or no lifetimes for content that changes a few times a year.
+"""
+
+import time
+import threading
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+import requests
+from utils import http_client
+from utils.cache_util import PersistentCache, MISSING
+
+
+class HTTPCache:
+    def __init__(self, name, max_bytes, fresh_seconds):
+        """
+        Initialize a page cache backed by data/cache/<name>.sqlite, holding at most max_bytes of pages.
+        """
+        self.fresh_seconds = fresh_seconds
+        #Pages are large, keep only a few in memory
+        self.store = PersistentCache(name, max_bytes=max_bytes, memory_entries=32)
+        self.stats = defaultdict(int)
+        self.stats_lock = threading.Lock()
+
+    def _count(self, counter):
+        with self.stats_lock:
+            self.stats[counter] += 1
+
+    def _fresh_until(self, response, now):
+        cache_control = response.headers.get('Cache-Control', '')
+        for directive in cache_control.split(','):
+            name, _, value = directive.strip().partition('=')
+            if name.lower() == 'max-age' and value.isdigit() and int(value) > 0:
+                return now + int(value)
+        expires = response.headers.get('Expires')
+        if expires:
+            try:
+                expires_at = parsedate_to_datetime(expires).timestamp()
+                if expires_at > now:
+                    return expires_at
+            except (TypeError, ValueError):
+                pass
+        return now + self.fresh_seconds
+
+    def _store(self, url, text, response, now):
+        entry = {
+            'text': text,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fresh_until': self._fresh_until(response, now),
+        }
+        self.store.set(url, entry)
+        return entry
+
+    def get(self, url, headers=None):
+        """
+        Return the decoded text of url, from the cache when fresh, otherwise fetched or revalidated.
+        """
+        now = time.time()
+        entry = self.store.get(url)
+        if entry is not MISSING and entry['fresh_until'] > now:
+            self._count('fresh_hits')
+            return entry['text']
+
+        request_headers = dict(headers or {})
+        if entry is not MISSING:
+            if entry['etag']:
+                request_headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request_headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            response = http_client.get(url, headers=request_headers)
+        except requests.RequestException:
+            if entry is MISSING:
+                raise
+            self._count('stale_served')
+            return entry['text']
+
+        if response.status_code == 304 and entry is not MISSING:
+            self._count('revalidated')
+            entry = dict(entry, fresh_until=self._fresh_until(response, now))
+            self.store.set(url, entry)
+            return entry['text']
+
+        self._count('misses' if entry is MISSING else 'changed')
+        return self._store(url, response.content.decode('utf-8'), response, now)['text']
+
+    def get_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats.update({'entries': len(self.store), 'bytes': self.store.total_bytes()})
+        return stats
+
+
+#Example usage
+'''
+pages = HTTPCache('web_pages', max_bytes=200 * 1024 * 1024, fresh_seconds=24 * 60 * 60)
+text = pages.get('https://medlineplus.gov/diabetes.html', headers={'User-Agent': 'Mozilla/5.0'})
+pages.get_stats()
+'''
@@ -0,0 +1,139 @@
+"""
+Utility functions for fetching web pages from the public medical sites the agents scrape (MedlinePlus, DailyMed).
+
+Every request used to be a bare requests.get with no timeout, a new connection each time and no retry, so a hung
+NLM server froze the user's page indefinitely. get() now goes through one pooled requests.Session per host with:
+- connect and read timeouts
+- retries with exponential backoff for connection errors and 429/5xx responses, honouring Retry-After
+- gzip and deflate compressed transfers
+- a limit on concurrent requests per host, so a burst of searches does not hammer one site
+
+get_stats reports per host requests, errors, bytes, latency percentiles and time spent waiting for a host slot.
+
+Settings (environment variables):
+- http_connect_timeout, http_read_timeout: seconds (default 5 and 20)
+- http_max_retries: retries after the first attempt (default 2)
+- http_max_per_host: concurrent requests per host (default 4)
+"""
+
+import os
+import time
+import threading
+from collections import deque, defaultdict
+from urllib.parse import urlparse
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+load_dotenv()
+
+
+CONNECT_TIMEOUT = float(os.getenv('http_connect_timeout', 5))
+READ_TIMEOUT = float(os.getenv('http_read_timeout', 20))
+MAX_RETRIES = int(os.getenv('http_max_retries', 2))
+MAX_PER_HOST = int(os.getenv('http_max_per_host', 4))
+BACKOFF_FACTOR = 0.5
+LATENCY_WINDOW = 500
+
+DEFAULT_HEADERS = {
+    'Accept-Encoding': 'gzip, deflate',
+}
+
+_sessions = {}
+_semaphores = {}
+_sessions_lock = threading.Lock()
+
+_latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+_counters = defaultdict(lambda: defaultdict(float))
+_stats_lock = threading.Lock()
+
+
+def _new_session():
+    retry = Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        #A read timeout already cost a full READ_TIMEOUT, retry it at most once so a hung server is given up on quickly
+        read=min(MAX_RETRIES, 1),
+        status=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_PER_HOST, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def _host_session(host):
+    with _sessions_lock:
+        if host not in _sessions:
+            _sessions[host] = _new_session()
+            _semaphores[host] = threading.BoundedSemaphore(MAX_PER_HOST)
+        return _sessions[host], _semaphores[host]
+
+
+def _count(host, counter, n=1):
+    with _stats_lock:
+        _counters[host][counter] += n
+
+
+def get(url, headers=None, timeout=None):
+    """
+    GET url through the host's pooled session and return the response. Raises for connection errors,
+    timeouts and error statuses left after the retries.
+    """
+    host = urlparse(url).netloc
+    session, semaphore = _host_session(host)
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+    queued = time.perf_counter()
+    with semaphore:
+        start = time.perf_counter()
+        _count(host, 'queue_wait_seconds', start - queued)
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+            response.raise_for_status()
+        except requests.RequestException:
+            _count(host, 'errors')
+            raise
+        finally:
+            _count(host, 'requests')
+        elapsed = time.perf_counter() - start
+
+    with _stats_lock:
+        _latencies[host].append(elapsed)
+        _counters[host]['bytes'] += len(response.content)
+        _counters[host]['retries'] += len(response.raw.retries.history) if getattr(response.raw, 'retries', None) else 0
+    return response
+
+
+def get_stats():
+    """
+    Per host counters and latency percentiles (seconds) over the recent window.
+    """
+    with _stats_lock:
+        stats = {}
+        for host in set(_counters) | set(_latencies):
+            latencies = list(_latencies[host])
+            stats[host] = dict(_counters[host])
+            if latencies:
+                stats[host].update({
+                    'p50_seconds': float(np.percentile(latencies, 50)),
+                    'p95_seconds': float(np.percentile(latencies, 95)),
+                    'max_seconds': max(latencies),
+                })
+    return stats
+
+
+#Example usage
+'''
+response = get('https://medlineplus.gov/diabetes.html', headers={'User-Agent': 'Mozilla/5.0'})
+response.text
+get_stats()
+'''
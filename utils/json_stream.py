@@ -0,0 +1,73 @@
+"""
+Utility functions for parsing JSON that arrives in pieces, like streamed function call arguments.
+
+TopLevelFieldParser is fed the argument text chunk by chunk and hands back each top level field of the
+JSON object as soon as its value is complete, so callers can act on a field before the rest has streamed in.
+"""
+
+import json
+
+
+class TopLevelFieldParser:
+    def __init__(self):
+        """
+        Initialize a parser for a single streamed JSON object.
+        """
+        self.buffer = ''
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        #Start of the current top level "key": value fragment in the buffer
+        self.field_start = None
+
+    def feed(self, text):
+        """
+        Add the next chunk of text and return a list of (key, value) pairs for the top level fields it completed.
+        """
+        self.buffer += text
+        completed = []
+
+        while self.position < len(self.buffer):
+            char = self.buffer[self.position]
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+                if self.depth == 1:
+                    self.field_start = self.position + 1
+            elif char in '}]':
+                if self.depth == 1:
+                    completed.extend(self._parse_field(self.position))
+                self.depth -= 1
+            elif char == ',' and self.depth == 1:
+                completed.extend(self._parse_field(self.position))
+                self.field_start = self.position + 1
+
+            self.position += 1
+
+        return completed
+
+    def _parse_field(self, end):
+        fragment = self.buffer[self.field_start:end].strip()
+        if not fragment:
+            return []
+        parsed = json.loads('{' + fragment + '}')
+        return list(parsed.items())
+
+
+#Example usage of the parser
+'''
+parser = TopLevelFieldParser()
+parser.feed('{"about": "A st')          # []
+parser.feed('udy", "who": {"inclu')     # [('about', 'A study')]
+parser.feed('sion_criteria": []}}')      # [('who', {'inclusion_criteria': []})]
+'''
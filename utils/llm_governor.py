@@ -0,0 +1,237 @@
+"""
+Utility functions for governing the rate and concurrency of LLM calls across the whole process.
+
+Every Streamlit session shares one AgentCoordinator, so bursts of searches used to fire unbounded concurrent LLM
+calls and trip Azure's requests per minute (RPM) and tokens per minute (TPM) limits, which then cost more time in
+429 retries than they saved. openai_util.create_chat_completion now acquires a slot from this governor before each
+request. A slot needs:
+- a free concurrency slot (llm_governor_max_concurrency)
+- one request from the RPM bucket and the request's estimated tokens from the TPM bucket. Like Azure's own limiter
+  the estimate is the prompt tokens plus max_tokens.
+- no higher priority request waiting. Interactive calls (synonyms, location) go first, then page content
+  (explanations, condition and drug pages), then background work (explanation refreshes and batch jobs).
+
+A 429 from Azure pauses all grants for its Retry-After. get_stats reports queue depth, waits and grants.
+
+Use priority(BACKGROUND) around work that no user is waiting on.
+"""
+
+import os
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import defaultdict
+from dotenv import load_dotenv
+load_dotenv()
+
+
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', NORMAL: 'normal', BACKGROUND: 'background'}
+
+AGENT_PRIORITIES = {
+    'synonym_generator': INTERACTIVE,
+    'location_fixer': INTERACTIVE,
+    'trial_explainer': NORMAL,
+    'knowledge_curator': NORMAL,
+}
+
+#Set these to the deployment's limits in Azure
+REQUESTS_PER_MINUTE = float(os.getenv('llm_governor_rpm', 300))
+TOKENS_PER_MINUTE = float(os.getenv('llm_governor_tpm', 200000))
+MAX_CONCURRENCY = int(os.getenv('llm_governor_max_concurrency', 16))
+
+_priority = contextvars.ContextVar('llm_priority', default=None)
+
+
+class GovernorTimeout(TimeoutError):
+    """Raised when a request could not get a slot before its timeout."""
+
+
+@contextmanager
+def priority(level):
+    """
+    Run LLM calls in this block (and tasks submitted from it with a copied context) at the given priority.
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def get_priority(agent):
+    #A background context wins over the agent's own priority
+    context_priority = _priority.get()
+    agent_priority = AGENT_PRIORITIES.get(agent, NORMAL)
+    return agent_priority if context_priority is None else max(context_priority, agent_priority)
+
+
+class TokenBucket:
+    def __init__(self, per_minute, clock=time.monotonic):
+        """
+        Bucket holding up to a minute's worth of capacity, refilled continuously.
+        """
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = clock()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        #A request bigger than the whole bucket only needs a full bucket, otherwise it could never run
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+class LLMGovernor:
+    def __init__(self, requests_per_minute, tokens_per_minute, max_concurrency, clock=time.monotonic):
+        """
+        Initialize a governor with RPM and TPM token buckets and a concurrency limit.
+        clock (seconds, monotonic) can be replaced to test the limits without waiting on real time.
+        """
+        self.clock = clock
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.stats = defaultdict(lambda: {'granted': 0, 'timeouts': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0})
+        self.max_queue_depth = 0
+        self.pauses = 0
+
+    def _wait_time(self, now, estimated_tokens):
+        #Seconds until this request could be granted, 0 if it can go now
+        if self.in_flight >= self.max_concurrency:
+            return None
+        return max(self.paused_until - now, self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+
+    def acquire(self, estimated_tokens, level=NORMAL, timeout=None):
+        """
+        Block until the request may be sent. Returns the seconds spent waiting.
+        """
+        start = self.clock()
+        deadline = start + timeout if timeout is not None else None
+        waiter = (level, next(self.sequence))
+
+        with self.condition:
+            heapq.heappush(self.waiters, waiter)
+            self.max_queue_depth = max(self.max_queue_depth, len(self.waiters))
+            try:
+                while True:
+                    now = self.clock()
+                    self.requests.refill(now)
+                    self.tokens.refill(now)
+                    wait = self._wait_time(now, estimated_tokens)
+                    if self.waiters[0] == waiter and wait == 0:
+                        break
+                    if deadline is not None and now >= deadline:
+                        self.stats[level]['timeouts'] += 1
+                        raise GovernorTimeout(f"No LLM slot within {timeout:g}s ({len(self.waiters)} requests queued)")
+                    #Sleep until capacity refills, a slot is released or the queue head changes (notify)
+                    sleep = wait if (wait and self.waiters[0] == waiter) else 1.0
+                    if deadline is not None:
+                        sleep = min(sleep, deadline - now)
+                    self.condition.wait(max(sleep, 0.001))
+            finally:
+                self.waiters.remove(waiter)
+                heapq.heapify(self.waiters)
+                self.condition.notify_all()
+
+            self.requests.take(1)
+            self.tokens.take(estimated_tokens)
+            self.in_flight += 1
+
+            waited = self.clock() - start
+            stats = self.stats[level]
+            stats['granted'] += 1
+            stats['wait_seconds'] += waited
+            stats['max_wait_seconds'] = max(stats['max_wait_seconds'], waited)
+        return waited
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def pause(self, seconds):
+        """
+        Stop granting requests for seconds, e.g. the Retry-After of a 429.
+        """
+        with self.condition:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+            self.pauses += 1
+
+    def get_stats(self):
+        with self.condition:
+            queued = defaultdict(int)
+            for level, _ in self.waiters:
+                queued[PRIORITY_NAMES.get(level, level)] += 1
+            return {
+                'queue_depth': len(self.waiters),
+                'queue_depth_by_priority': dict(queued),
+                'max_queue_depth': self.max_queue_depth,
+                'in_flight': self.in_flight,
+                'pauses': self.pauses,
+                'requests_available': self.requests.level,
+                'tokens_available': self.tokens.level,
+                'by_priority': {PRIORITY_NAMES.get(level, level): dict(stats) for level, stats in self.stats.items()},
+            }
+
+
+_governor = LLMGovernor(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, MAX_CONCURRENCY)
+
+
+def acquire(agent, estimated_tokens, timeout=None):
+    """
+    Take a governor slot for one LLM request from agent, returns the seconds spent queued. Pair with release(),
+    e.g. when the slot has to outlive the call that took it (streams).
+    """
+    return _governor.acquire(estimated_tokens, get_priority(agent), timeout)
+
+
+def release():
+    _governor.release()
+
+
+@contextmanager
+def slot(agent, estimated_tokens, timeout=None):
+    """
+    Hold a governor slot for one LLM request from agent, yields the seconds spent queued.
+    """
+    waited = acquire(agent, estimated_tokens, timeout)
+    try:
+        yield waited
+    finally:
+        release()
+
+
+def pause(seconds):
+    _governor.pause(seconds)
+
+
+def get_stats():
+    return _governor.get_stats()
+
+
+#Example usage
+'''
+with slot('synonym_generator', estimated_tokens=1200, timeout=20):
+    response = client.chat.completions.create(...)
+
+with priority(BACKGROUND):
+    coordinator.refresh_trial_explanation(ssp, last_update)
+'''
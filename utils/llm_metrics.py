@@ -0,0 +1,178 @@
+"""
+Utility functions for recording metrics about every LLM call the agents make.
+
+openai_util.create_chat_completion records one entry per chat completion call (agent, function name, latency,
+prompt and completion tokens, retries, error and estimated cost) in an in-process registry. Entries are tagged
+with the current session and search id, which are context variables so they follow the work into the
+coordinator's thread pools when tasks are submitted with contextvars.copy_context().run.
+
+Records can be aggregated per agent, session or search, and dumped as JSON lines. Setting the llm_metrics_log
+environment variable to a file path also appends every record to that file as it is recorded, and the app
+appends a per agent summary line after each search (log_search_summary).
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque, defaultdict
+from dotenv import load_dotenv
+load_dotenv()
+
+
+MAX_RECORDS = int(os.getenv('llm_metrics_max_records', 10000))
+METRICS_LOG_FILE = os.getenv('llm_metrics_log')
+
+#USD per million (prompt, completion) tokens, used to estimate cost
+MODEL_PRICES_PER_MILLION = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+}
+
+_session_id = contextvars.ContextVar('llm_session_id', default=None)
+_search_id = contextvars.ContextVar('llm_search_id', default=None)
+
+_records = deque(maxlen=MAX_RECORDS)
+_records_lock = threading.Lock()
+
+
+def new_id():
+    return uuid.uuid4().hex[:12]
+
+
+def set_context(session_id=None, search_id=None):
+    """
+    Tag LLM calls made from the current context (and tasks copied from it) with a session and search id.
+    """
+    _session_id.set(session_id)
+    _search_id.set(search_id)
+
+
+def get_context():
+    return {'session_id': _session_id.get(), 'search_id': _search_id.get()}
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = MODEL_PRICES_PER_MILLION.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def record_call(agent, function_name, model, latency_seconds, prompt_tokens=0, completion_tokens=0,
+                retries=0, error=None, stream=False, first_token_seconds=None, hedged=False):
+    """
+    Add one LLM call to the registry and return the record.
+    """
+    record = {
+        'timestamp': time.time(),
+        **get_context(),
+        'agent': agent,
+        'function_name': function_name,
+        'model': model,
+        'stream': stream,
+        'latency_seconds': round(latency_seconds, 4),
+        'first_token_seconds': round(first_token_seconds, 4) if first_token_seconds is not None else None,
+        'prompt_tokens': prompt_tokens or 0,
+        'completion_tokens': completion_tokens or 0,
+        'retries': retries,
+        'hedged': hedged,
+        'error': error,
+        'cost_usd': estimate_cost(model, prompt_tokens or 0, completion_tokens or 0),
+    }
+    with _records_lock:
+        _records.append(record)
+        if METRICS_LOG_FILE:
+            with open(METRICS_LOG_FILE, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+    return record
+
+
+def get_records(session_id=None, search_id=None, agent=None):
+    """
+    Return the recorded calls, optionally only those of a session, a search or an agent.
+    """
+    with _records_lock:
+        records = list(_records)
+    return [
+        r for r in records
+        if (session_id is None or r['session_id'] == session_id)
+        and (search_id is None or r['search_id'] == search_id)
+        and (agent is None or r['agent'] == agent)
+    ]
+
+
+def aggregate(records=None, by='agent'):
+    """
+    Sum calls, errors, retries, latency, tokens and cost of the records grouped by a record field
+    (agent, function_name, session_id or search_id).
+    """
+    if records is None:
+        records = get_records()
+    totals = defaultdict(lambda: {'calls': 0, 'errors': 0, 'retries': 0, 'hedged': 0, 'latency_seconds': 0.0,
+                                  'max_latency_seconds': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cost_usd': 0.0})
+    for r in records:
+        total = totals[r[by]]
+        total['calls'] += 1
+        total['errors'] += 1 if r['error'] else 0
+        total['retries'] += r['retries']
+        total['hedged'] += 1 if r.get('hedged') else 0
+        total['latency_seconds'] += r['latency_seconds']
+        total['max_latency_seconds'] = max(total['max_latency_seconds'], r['latency_seconds'])
+        total['prompt_tokens'] += r['prompt_tokens']
+        total['completion_tokens'] += r['completion_tokens']
+        total['cost_usd'] += r['cost_usd']
+    return dict(totals)
+
+
+def summarize_search(search_id):
+    """
+    Per agent totals of a single search.
+    """
+    return aggregate(get_records(search_id=search_id), by='agent')
+
+
+def log_search_summary(search_id):
+    """
+    Append the per agent totals of a search to the llm_metrics_log file, if one is set.
+    """
+    if not METRICS_LOG_FILE:
+        return
+    summary = {'timestamp': time.time(), 'search_id': search_id, 'summary': summarize_search(search_id)}
+    with _records_lock:
+        with open(METRICS_LOG_FILE, 'a') as f:
+            f.write(json.dumps(summary) + '\n')
+
+
+def summarize_session(session_id):
+    """
+    Per agent totals of a single session.
+    """
+    return aggregate(get_records(session_id=session_id), by='agent')
+
+
+def dump_records(path=None, records=None):
+    """
+    Write the records as JSON lines to path, or return them as a JSON lines string when path is None.
+    """
+    if records is None:
+        records = get_records()
+    lines = ''.join(json.dumps(r) + '\n' for r in records)
+    if path is None:
+        return lines
+    with open(path, 'a') as f:
+        f.write(lines)
+
+
+def clear():
+    with _records_lock:
+        _records.clear()
+
+
+#Example usage
+'''
+set_context(session_id=new_id(), search_id=new_id())
+...run a search...
+summarize_search(get_context()['search_id'])
+dump_records('llm_calls.jsonl')
+'''
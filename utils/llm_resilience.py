@@ -0,0 +1,220 @@
+"""
+Utility functions for making agent LLM calls resilient to slow and failing Azure responses.
+
+openai_util.create_chat_completion runs every request through call_with_policy, which gives each agent:
+- A deadline for the whole call (all attempts), each attempt gets the remaining time as its request timeout.
+- Retries with jittered exponential backoff for retryable errors (timeouts, connection errors, 408/409/429/5xx),
+  honouring the Retry-After header Azure sends with 429s.
+- Optional hedging: if the first request has not answered after the agent's recent p95 latency, a duplicate is
+  sent and whichever answers first wins. Hedging is for the small, cheap calls (synonyms, location). The losing
+  request is cancelled if it has not started yet, otherwise (a sync HTTP call cannot be interrupted) it finishes
+  in the background and its response is closed, which frees its governor slot when it is a stream.
+
+get_stats reports per agent calls, retries, hedges, timeouts, failures and latency percentiles.
+
+Settings (environment variables):
+- llm_deadline_<agent>: deadline in seconds for that agent's calls (defaults in AGENT_DEADLINES)
+- llm_max_attempts: attempts per call including the first (default 3)
+- llm_hedge_agents: comma separated agents whose calls are hedged (default synonym_generator,location_fixer)
+"""
+
+import os
+import time
+import random
+import threading
+import contextvars
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import openai
+from dotenv import load_dotenv
+load_dotenv()
+
+
+AGENT_DEADLINES = {
+    'synonym_generator': 20.0,
+    'location_fixer': 10.0,
+    'trial_explainer': 60.0,
+    'knowledge_curator': 45.0,
+}
+DEFAULT_DEADLINE = 30.0
+
+MAX_ATTEMPTS = int(os.getenv('llm_max_attempts', 3))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+HEDGE_AGENTS = {agent.strip() for agent in os.getenv('llm_hedge_agents', 'synonym_generator,location_fixer').split(',') if agent.strip()}
+#Hedge delay used until an agent has enough latency samples for a p95
+HEDGE_DEFAULT_DELAY = 3.0
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 500
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """Raised when an agent's LLM call did not succeed within its deadline."""
+
+
+_latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+_counters = defaultdict(lambda: defaultdict(int))
+_stats_lock = threading.Lock()
+
+_hedge_executor = ThreadPoolExecutor(max_workers=int(os.getenv('llm_hedge_workers', 16)), thread_name_prefix='llm-hedge')
+
+#Clock and sleep of the policy, replaced in tests to run backoff and deadlines without waiting
+_clock = time.monotonic
+_sleep = time.sleep
+
+
+def get_deadline(agent):
+    return float(os.getenv(f'llm_deadline_{agent}', AGENT_DEADLINES.get(agent, DEFAULT_DEADLINE)))
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def backoff_delay(attempt, error=None):
+    """
+    Full jitter exponential backoff, or the server's Retry-After when it sent one.
+    """
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX_SECONDS)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def hedge_delay(agent):
+    """
+    The agent's recent p95 latency, so only the slowest 5% of calls get a duplicate request.
+    """
+    with _stats_lock:
+        latencies = list(_latencies[agent])
+    if len(latencies) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return float(np.percentile(latencies, 95))
+
+
+def _count(agent, counter, n=1):
+    with _stats_lock:
+        _counters[agent][counter] += n
+
+
+def _close_result(future):
+    if not future.cancelled() and future.exception() is None:
+        close = getattr(future.result(), 'close', None)
+        if close is not None:
+            close()
+
+
+def _cancel_losers(futures):
+    #Not started yet: never sent. Already running: close whatever it returns.
+    for future in futures:
+        if not future.cancel():
+            future.add_done_callback(_close_result)
+
+
+def _hedged(agent, send, timeout, info):
+    start = _clock()
+    primary = _hedge_executor.submit(contextvars.copy_context().run, send, timeout)
+    done, _ = wait([primary], timeout=min(hedge_delay(agent), timeout))
+    if done:
+        return primary.result()
+
+    info['hedges'] += 1
+    _count(agent, 'hedges')
+    #The hedge only gets what is left of the attempt's time, so it cannot overrun the deadline
+    hedge = _hedge_executor.submit(contextvars.copy_context().run, send, max(timeout - (_clock() - start), 0.1))
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        remaining = timeout - (_clock() - start)
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    _count(agent, 'hedge_wins')
+                _cancel_losers({primary, hedge} - {future})
+                return future.result()
+            error = future.exception()
+    if pending:
+        #Neither request answered in time, the policy turns this into a retry or LLMDeadlineExceeded
+        _cancel_losers(pending)
+        raise openai.APITimeoutError(request=None)
+    raise error
+
+
+def call_with_policy(agent, send, hedge=None):
+    """
+    Run send(timeout), which makes one request, under the agent's deadline, retry and hedging policy.
+    Returns (result, info) where info has the number of retries and hedges used.
+    """
+    if hedge is None:
+        hedge = agent in HEDGE_AGENTS
+    deadline = get_deadline(agent)
+    start = _clock()
+    info = {'retries': 0, 'hedges': 0}
+    _count(agent, 'calls')
+
+    attempt = 0
+    while True:
+        remaining = deadline - (_clock() - start)
+        if remaining <= 0:
+            _count(agent, 'deadline_exceeded')
+            raise LLMDeadlineExceeded(f"{agent} LLM call exceeded its {deadline:g}s deadline")
+        try:
+            result = _hedged(agent, send, remaining, info) if hedge else send(remaining)
+        except Exception as e:
+            if not is_retryable(e) or attempt + 1 >= MAX_ATTEMPTS:
+                _count(agent, 'failures')
+                raise
+            delay = backoff_delay(attempt, e)
+            if _clock() - start + delay >= deadline:
+                _count(agent, 'deadline_exceeded')
+                raise LLMDeadlineExceeded(f"{agent} LLM call exceeded its {deadline:g}s deadline: {e}") from e
+            _sleep(delay)
+            attempt += 1
+            info['retries'] += 1
+            _count(agent, 'retries')
+            continue
+
+        with _stats_lock:
+            _latencies[agent].append(_clock() - start)
+        return result, info
+
+
+def get_stats():
+    """
+    Per agent counters and latency percentiles (seconds) over the recent window.
+    """
+    with _stats_lock:
+        agents = set(_counters) | set(_latencies)
+        stats = {}
+        for agent in agents:
+            latencies = list(_latencies[agent])
+            stats[agent] = dict(_counters[agent])
+            if latencies:
+                stats[agent].update({
+                    'p50_seconds': float(np.percentile(latencies, 50)),
+                    'p95_seconds': float(np.percentile(latencies, 95)),
+                    'p99_seconds': float(np.percentile(latencies, 99)),
+                    'max_seconds': max(latencies),
+                })
+    return stats
+
+
+#Example usage
+'''
+result, info = call_with_policy('synonym_generator', lambda timeout: client.chat.completions.create(..., timeout=timeout))
+get_stats()
+'''
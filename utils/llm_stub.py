@@ -0,0 +1,234 @@
+"""
+Utility functions for a local stand-in of the Azure OpenAI chat completions API.
+
+StubOpenAIClient mimics client.chat.completions.create for the function-calling requests our agents make and
+returns schema-valid arguments, templated from the prompt for the agents' own functions (FUNCTION_TEMPLATES) and
+generated from the requested function's JSON schema otherwise, with an optional simulated latency. stream=True
+returns the arguments as a stream of chunks. It lets batch jobs and benchmarks run end to end without spending
+on Azure, and backs the HTTP stand-in in scripts/fake_llm_server.py.
+"""
+
+import re
+import time
+import json
+import uuid
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+
+def fake_arguments(schema, name='value'):
+    """
+    Generate a value that satisfies a (simple) JSON schema, e.g. a function's parameters.
+    """
+    schema_type = schema.get('type', 'string')
+    if 'enum' in schema:
+        return schema['enum'][0]
+    if schema_type == 'object':
+        return {key: fake_arguments(prop, key) for key, prop in schema.get('properties', {}).items()}
+    if schema_type == 'array':
+        return [fake_arguments(schema.get('items', {}), f'{name} {i}') for i in range(1, 3)]
+    if schema_type == 'boolean':
+        return False
+    if schema_type in ('number', 'integer'):
+        return 0
+    return f'Sample {name.replace("_", " ")}'
+
+
+def _user_text(messages):
+    return next((m.get('content') or '' for m in reversed(messages or []) if m.get('role') == 'user'), '')
+
+
+def _after(text, marker):
+    #The text after a marker in the agent's prompt, e.g. the condition after "synonyms for:"
+    return text.split(marker, 1)[1].strip().strip("'\"") if marker in text else text.strip()
+
+
+def _synonyms_template(text):
+    condition = _after(text, 'synonyms for:')
+    return {'synonyms': [condition.title(), f'{condition} disease', f'{condition} disorder']}
+
+
+def _location_template(text):
+    return {'location': _after(text, 'location:').title()}
+
+
+def _trial_summary_template(text):
+    try:
+        payload = json.loads(text[text.index('{'):])
+    except ValueError:
+        payload = {}
+    criteria = str(payload.get('eligibility_criteria') or '')
+    lines = [line.strip('-* ').strip() for line in criteria.splitlines() if line.strip('-* ').strip()]
+    split = next((i for i, line in enumerate(lines) if line.lower().startswith('exclusion')), len(lines))
+    inclusion = [line for line in lines[:split] if not line.lower().startswith('inclusion')][:5]
+    exclusion = lines[split + 1:split + 6]
+    title = payload.get('official_title') or payload.get('brief_summary') or 'this study'
+    return {
+        'what_is_this_study_about': f'This study looks at {title}.',
+        'who_can_join_this_study': {'inclusion_criteria': inclusion, 'exclusion_criteria': exclusion},
+        'what_happens_in_this_study': {'summary_of_activities': f'Participants will take part in {title}. The study team will follow them during the study.'},
+    }
+
+
+def _medical_page_template(text):
+    return {
+        'summary': {
+            'what_it_is': 'A medical condition described in the provided content.',
+            'symptoms': 'Symptoms vary from person to person.',
+            'causes': 'Causes are described in the provided content.',
+            'diagnosis_and_tests': 'Doctors use an exam and tests to diagnose it.',
+            'treatments_and_therapies': 'Treatment depends on the person and may include medicines.',
+        },
+        'related_links': [{
+            'title': 'MedlinePlus',
+            'description': 'Patient friendly health information.',
+            'url': 'https://medlineplus.gov/',
+            'source': 'MedlinePlus',
+        }],
+    }
+
+
+def _drug_study_template(text):
+    drug = re.search(r'-\s*(?:DRUG|BIOLOGICAL)\s*:\s*([^(\n]+)', text, flags=re.IGNORECASE)
+    if drug:
+        return {'is_drug_study': True, 'drug_name': drug.group(1).strip(), 'reason_if_no_drug': ''}
+    return {'is_drug_study': False, 'drug_name': '', 'reason_if_no_drug': 'This study is not testing a specific drug.'}
+
+
+def _drug_summary_template(text):
+    return {
+        'what_is_this_drug': 'A medicine described in the provided drug information.',
+        'how_to_take_it': 'Take it exactly as your doctor tells you.',
+        'warnings_and_precautions': 'Tell your doctor about your health conditions and other medicines.',
+        'possible_side_effects': 'Side effects can include nausea and headache.',
+    }
+
+
+#Templated arguments for the agents' functions, built from the prompt so outputs look like the real thing
+FUNCTION_TEMPLATES = {
+    'generate_disease_synonyms': _synonyms_template,
+    'get_location': _location_template,
+    'generate_patient_friendly_trial_summary': _trial_summary_template,
+    'curate_medical_page': _medical_page_template,
+    'identify_drug_study': _drug_study_template,
+    'curate_drug_summary': _drug_summary_template,
+}
+
+
+def templated_arguments(function, messages):
+    """
+    Arguments for a function call: the function's template when there is one, otherwise generated from its schema.
+    """
+    template = FUNCTION_TEMPLATES.get(function['name'])
+    if template is not None:
+        return template(_user_text(messages))
+    return fake_arguments(function.get('parameters', {}), function['name'])
+
+
+def _requested_function(functions, function_call):
+    #The agents always force a specific function with function_call={"name": ...}
+    if isinstance(function_call, dict) and function_call.get('name'):
+        for function in functions:
+            if function['name'] == function_call['name']:
+                return function
+    return functions[0]
+
+
+def build_completion(model, function_name, arguments, prompt_tokens=0):
+    """
+    Build a ChatCompletion object with a single function call, like the API returns.
+    """
+    arguments_json = json.dumps(arguments)
+    completion_tokens = max(1, len(arguments_json) // 4)
+    return ChatCompletion.model_validate({
+        'id': f'stub-{uuid.uuid4().hex}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model or 'stub',
+        'choices': [{
+            'index': 0,
+            'finish_reason': 'stop',
+            'message': {
+                'role': 'assistant',
+                'content': None,
+                'function_call': {'name': function_name, 'arguments': arguments_json},
+            },
+        }],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        },
+    })
+
+
+def build_completion_chunks(model, function_name, arguments, chunk_size=16, delay_seconds=0.0, prompt_tokens=None):
+    """
+    Yield ChatCompletionChunk objects that stream a single function call's arguments, like the API does with stream=True.
+    When prompt_tokens is given a final usage chunk is added, like stream_options={"include_usage": True}.
+    """
+    arguments_json = json.dumps(arguments)
+    completion_id = f'stub-{uuid.uuid4().hex}'
+    created = int(time.time())
+
+    def chunk(delta, finish_reason=None, usage=None):
+        return ChatCompletionChunk.model_validate({
+            'id': completion_id,
+            'object': 'chat.completion.chunk',
+            'created': created,
+            'model': model or 'stub',
+            'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}] if delta is not None else [],
+            'usage': usage,
+        })
+
+    yield chunk({'role': 'assistant', 'function_call': {'name': function_name, 'arguments': ''}})
+    for start in range(0, len(arguments_json), chunk_size):
+        if delay_seconds:
+            time.sleep(delay_seconds)
+        yield chunk({'function_call': {'arguments': arguments_json[start:start + chunk_size]}})
+    yield chunk({}, finish_reason='stop')
+    if prompt_tokens is not None:
+        completion_tokens = max(1, len(arguments_json) // 4)
+        yield chunk(None, usage={
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        })
+
+
+class _StubCompletions:
+    def __init__(self, latency_seconds):
+        self.latency_seconds = latency_seconds
+
+    def create(self, messages=None, functions=None, function_call=None, model=None, stream=False, stream_options=None, **kwargs):
+        function = _requested_function(functions or [], function_call)
+        arguments = templated_arguments(function, messages)
+        prompt_tokens = len(json.dumps(messages or [])) // 4
+        if stream:
+            #Spread the latency over the chunks, like tokens arriving
+            chunk_count = max(1, len(json.dumps(arguments)) // 16)
+            include_usage = bool(stream_options and stream_options.get('include_usage'))
+            return build_completion_chunks(model, function['name'], arguments, delay_seconds=self.latency_seconds / chunk_count,
+                                           prompt_tokens=prompt_tokens if include_usage else None)
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return build_completion(model, function['name'], arguments, prompt_tokens)
+
+
+class _StubChat:
+    def __init__(self, latency_seconds):
+        self.completions = _StubCompletions(latency_seconds)
+
+
+class StubOpenAIClient:
+    def __init__(self, latency_seconds=0.0):
+        """
+        Initialize a stub client that answers function calls with schema-valid arguments after latency_seconds.
+        """
+        self.chat = _StubChat(latency_seconds)
+
+
+#Example usage of the stub client
+'''
+from agents.trial_explainer import TrialExplainerAgent
+agent = TrialExplainerAgent(client=StubOpenAIClient(latency_seconds=0.5))
+'''
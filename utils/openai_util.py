@@ -1,36 +1,289 @@
 """
 Utility functions for Azure OpenAI API interactions.
+
+All agents share one AzureOpenAI client per process. The client owns a pooled httpx connection with
+keep-alive, so LLM calls reuse open TLS connections instead of setting up a new one every request.
+
+count_tokens / count_message_tokens / truncate_to_tokens measure and trim prompt sizes with the model's tokenizer (tiktoken).
+
+Agents make every chat completion call through create_chat_completion, which applies the agent's deadline, retry
+and hedging policy (utils/llm_resilience.py), waits for the process-wide rate limiter (utils/llm_governor.py) and
+records the call's latency, tokens, retries and errors in utils/llm_metrics.py.
 """
 
 import os
 import sys
+import time
+import threading
+import contextvars
 from dotenv import load_dotenv
 load_dotenv()
 
 #File specific imports
+import json
+import httpx
+import openai
+import tiktoken
 from openai import AzureOpenAI
+from utils import llm_metrics
+from utils import llm_resilience
+from utils import cassette
+from utils import llm_governor
 
 azure_endpoint = os.getenv('azure_openai_endpoint')
 azure_subscription_key = os.getenv('azure_openai_key')
 azure_api_version = "2024-12-01-preview"
 
+#Local stand-in server (scripts/fake_llm_server.py), when set every agent talks to it instead of Azure
+fake_llm_endpoint = os.getenv('fake_llm_endpoint')
+
 github_endpoint = os.getenv('github_endpoint')
 github_ai_token = os.getenv('github_ai_token')
 
+#Connection pool and timeout settings for the shared client
+max_connections = int(os.getenv('azure_openai_max_connections', 20))
+max_keepalive_connections = int(os.getenv('azure_openai_max_keepalive_connections', 10))
+keepalive_expiry = float(os.getenv('azure_openai_keepalive_expiry', 120))
+connect_timeout = float(os.getenv('azure_openai_connect_timeout', 10))
+read_timeout = float(os.getenv('azure_openai_read_timeout', 120))
+#Retries are handled by utils/llm_resilience.py, the client's own retries are off by default
+max_retries = int(os.getenv('azure_openai_max_retries', 0))
 
-def get_azure_openai_client():
-    # Create the Azure OpenAI client
-    client = AzureOpenAI(
-        api_version=azure_api_version,
-        azure_endpoint=azure_endpoint,
-        api_key=azure_subscription_key,
+_client = None
+_client_lock = threading.Lock()
+
+#HTTP attempts made by the current create_chat_completion call, the client retries internally
+_attempts = contextvars.ContextVar('llm_http_attempts', default=None)
+
+
+def _count_attempt(request):
+    attempts = _attempts.get()
+    if attempts is not None:
+        attempts[0] += 1
+
+
+def _create_http_client():
+    return httpx.Client(
+        event_hooks={'request': [_count_attempt]},
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
     )
 
-    return client
+
+def get_azure_openai_client():
+    """
+    Return the process-wide Azure OpenAI client, creating it on first use.
+    The client is thread safe and shared by all agents and Streamlit sessions.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AzureOpenAI(
+                    api_version=azure_api_version,
+                    azure_endpoint=fake_llm_endpoint or azure_endpoint,
+                    api_key='fake' if fake_llm_endpoint else azure_subscription_key,
+                    max_retries=max_retries,
+                    http_client=_create_http_client(),
+                )
+
+    return _client
+
+
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def _get_encoding(model):
+    #tiktoken downloads the encoding on first use, without network access we fall back to an estimate (None)
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding('o200k_base')
+            except Exception as e:
+                print(f"Could not load the tokenizer for {model}, estimating token counts: {e}")
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def create_chat_completion(client, agent, **kwargs):
+    """
+    Call client.chat.completions.create(**kwargs) and record the call in the LLM metrics registry.
+    With stream=True the chunks are passed through and the call is recorded once the stream is consumed.
+    """
+    model = kwargs.get('model')
+    function_call = kwargs.get('function_call')
+    function_name = function_call.get('name') if isinstance(function_call, dict) else None
+    stream = kwargs.get('stream', False)
+    if stream:
+        #Ask for a final usage chunk so streamed calls are counted too
+        kwargs.setdefault('stream_options', {'include_usage': True})
+
+    #Azure charges prompt tokens plus max_tokens against the tokens per minute limit when a request arrives
+    estimated_tokens = (count_message_tokens(kwargs.get('messages') or [], model or "gpt-4o-mini")
+                        + count_tokens(json.dumps(kwargs.get('functions') or []), model or "gpt-4o-mini")
+                        + int(kwargs.get('max_tokens') or 0))
+
+    def send(timeout):
+        #Wait for a slot from the process-wide rate limiter (utils/llm_governor.py), it also gets the 429s
+        waited = llm_governor.acquire(agent, estimated_tokens, timeout)
+        timeout = max(timeout - waited, 0.1)
+        try:
+            #Recorded or replayed when a cassette is active (utils/cassette.py), streams are recorded as their chunks
+            request = {key: value for key, value in kwargs.items() if key != 'stream_options'}
+            if stream and cassette.get_cassette() is not None:
+                chunks = cassette.through('llm', request, lambda: list(client.chat.completions.create(timeout=timeout, **kwargs)))
+                llm_governor.release()
+                return iter(chunks)
+            response = cassette.through('llm', request, lambda: client.chat.completions.create(timeout=timeout, **kwargs))
+        except openai.RateLimitError as e:
+            llm_governor.pause(llm_resilience.backoff_delay(0, e))
+            llm_governor.release()
+            raise
+        except BaseException:
+            llm_governor.release()
+            raise
+        if stream:
+            #The response returns once the headers arrive, keep the slot until the last token has been read
+            return _SlotStream(response)
+        llm_governor.release()
+        return response
+
+    attempts = [0]
+    info = {'retries': 0, 'hedges': 0}
+    token = _attempts.set(attempts)
+    start = time.perf_counter()
+    try:
+        #Deadline, retries and hedging, streams are not hedged since the duplicate would stream too
+        response, info = llm_resilience.call_with_policy(agent, send, hedge=False if stream else None)
+    except Exception as e:
+        llm_metrics.record_call(agent, function_name, model, time.perf_counter() - start,
+                                retries=_retries(attempts, info), error=f"{type(e).__name__}: {e}", stream=stream)
+        raise
+    finally:
+        _attempts.reset(token)
+
+    if stream:
+        return _record_stream(response, agent, function_name, model, start, attempts, info)
+
+    usage = getattr(response, 'usage', None)
+    llm_metrics.record_call(agent, function_name, model, time.perf_counter() - start,
+                            prompt_tokens=usage.prompt_tokens if usage else 0,
+                            completion_tokens=usage.completion_tokens if usage else 0,
+                            retries=_retries(attempts, info), hedged=info['hedges'] > 0)
+    return response
+
+
+def _retries(attempts, info):
+    #HTTP attempts beyond the first that were not hedges, or the policy's count when nothing went over HTTP (stub clients)
+    return max(attempts[0] - 1 - info['hedges'], info['retries'])
+
+
+class _SlotStream:
+    def __init__(self, stream):
+        """
+        Iterate a streamed response while holding its governor slot, released when the stream ends or is closed.
+        """
+        self.stream = stream
+        self.iterator = iter(stream)
+        self.holding = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.holding:
+            self.holding = False
+            llm_governor.release()
+            close = getattr(self.stream, 'close', None)
+            if close is not None:
+                close()
+
+    def __del__(self):
+        #A stream that is never read must not keep its slot
+        self.close()
+
+
+def _record_stream(stream, agent, function_name, model, start, attempts, info):
+    first_token_seconds = None
+    usage = None
+    error = None
+    try:
+        for chunk in stream:
+            if first_token_seconds is None and chunk.choices:
+                first_token_seconds = time.perf_counter() - start
+            if getattr(chunk, 'usage', None) is not None:
+                usage = chunk.usage
+            yield chunk
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        #Also when the consumer stopped early, so the connection and governor slot are given back
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            close()
+        llm_metrics.record_call(agent, function_name, model, time.perf_counter() - start,
+                                prompt_tokens=usage.prompt_tokens if usage else 0,
+                                completion_tokens=usage.completion_tokens if usage else 0,
+                                retries=_retries(attempts, info), error=error, stream=True,
+                                first_token_seconds=first_token_seconds)
+
+
+def count_tokens(text, model="gpt-4o-mini"):
+    """
+    Count the tokens in text with the model's tokenizer.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        #Roughly 4 characters per token for English text
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model="gpt-4o-mini"):
+    """
+    Cut text down to at most max_tokens tokens, ending with an ellipsis when anything was cut.
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    encoding = _get_encoding(model)
+    if encoding is None:
+        cut = text[:max_tokens * 4]
+    else:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    return cut.rstrip() + '...'
+
+
+def count_message_tokens(messages, model="gpt-4o-mini"):
+    """
+    Count the prompt tokens of a list of chat messages, including the per message overhead the API adds.
+    """
+    tokens = 3
+    for message in messages:
+        tokens += 3 + count_tokens(message.get('content') or '', model) + count_tokens(message.get('role', ''), model)
+    return tokens
 
 
 
 #Example usage of the client
 '''
 client = get_azure_openai_client()
+count_tokens("What is this study about?")
 '''
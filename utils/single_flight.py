@@ -0,0 +1,116 @@
+"""
+Utility functions for coalescing identical in-flight work.
+
+When several sessions ask for the same thing at once (a trending condition's synonyms or condition page, the same
+trial's explanation, the same drug page) only the first caller, the leader, runs the work. Callers that arrive
+while it is running wait for it and get the same result, or the same exception. Nothing is cached: once the
+leader finishes the key is forgotten, caching is left to the stores and caches behind the work.
+
+Only real failures of the work are handed to followers. A leader that is cancelled (page closed, Streamlit rerun)
+or gives up without a usable result abandons the flight instead, and one of its followers then runs the work itself.
+
+do(key, fn, *args) covers plain calls. begin(key) / finish(key, ...) cover work whose leader produces its result
+over time, like a streamed explanation, while followers just wait for the final value.
+"""
+
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+
+
+class FlightAbandoned(Exception):
+    """
+    Raised to followers when the leader gave up without a result, the follower should run the work itself.
+    """
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Initialize an empty group of in-flight calls.
+        """
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.stats = defaultdict(lambda: {'leaders': 0, 'followers': 0, 'abandoned': 0})
+
+    def begin(self, key):
+        """
+        Join the flight for key. Returns (future, is_leader), the leader must call finish(key, ...) when done.
+        """
+        kind = key[0] if isinstance(key, tuple) else key
+        with self.lock:
+            future = self.flights.get(key)
+            if future is not None:
+                self.stats[kind]['followers'] += 1
+                return future, False
+            future = Future()
+            self.flights[key] = future
+            self.stats[kind]['leaders'] += 1
+            return future, True
+
+    def finish(self, key, result=None, error=None):
+        """
+        Hand the leader's result (or error) to every follower and close the flight.
+        """
+        with self.lock:
+            future = self.flights.pop(key, None)
+        if future is None:
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def abandon(self, key):
+        """
+        Close the flight without a result (the leader was cancelled or its result is unusable). Waiting followers
+        get FlightAbandoned and, through do() or their own retry, run the work themselves.
+        """
+        with self.lock:
+            kind = key[0] if isinstance(key, tuple) else key
+            self.stats[kind]['abandoned'] += 1
+        self.finish(key, error=FlightAbandoned(f"The leader of {key!r} gave up without a result"))
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Return fn(*args, **kwargs), sharing a single call among all concurrent callers with the same key.
+        """
+        while True:
+            future, is_leader = self.begin(key)
+            if is_leader:
+                break
+            try:
+                return future.result()
+            except FlightAbandoned:
+                # The leader was cancelled, try again (the first follower back becomes the new leader)
+                continue
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.finish(key, error=e)
+            raise
+        except BaseException:
+            # Cancelled (KeyboardInterrupt, Streamlit's rerun and stop exceptions), not a failure of the work itself
+            self.abandon(key)
+            raise
+        self.finish(key, result)
+        return result
+
+    def get_stats(self):
+        """
+        Per kind (the first element of tuple keys) counts of calls that ran the work, calls that shared it and
+        flights abandoned by their leader.
+        """
+        with self.lock:
+            return {
+                'in_flight': len(self.flights),
+                'by_kind': {kind: dict(counts) for kind, counts in self.stats.items()},
+            }
+
+
+#Example usage
+'''
+flights = SingleFlight()
+synonyms = flights.do(('synonyms', 'breast cancer'), agent.generate_synonyms, 'Breast Cancer')
+flights.get_stats()
+'''
@@ -10,6 +10,7 @@ load_dotenv()
 #File specific imports
 import pandas as pd
 import psycopg
+from utils import cassette
 
 
 
@@ -32,7 +33,11 @@ def get_table(query):
     """
     Get table from AACT database using SQL query
     """
-    
+    #Recorded or replayed when a cassette is active (utils/cassette.py)
+    return cassette.through('sql', [query], lambda: _query_aact(query))
+
+
+def _query_aact(query):
     conn = connect_to_aact()
     
     # Execute the SQL query and fetch the results into a DataFrame
@@ -41,4 +46,38 @@ def get_table(query):
     # Close the connection
     conn.close()
     
-    return df
\ No newline at end of file
+    return df
+
+
+
+def format_in_list(values):
+    """
+    Format values as a SQL IN list, e.g. ('NCT01', 'NCT02'). Unlike str(tuple(values)) this
+    also works for a single value.
+    """
+    return '(' + ', '.join("'" + str(v).replace("'", "''") + "'" for v in values) + ')'
+
+
+#Facilities of active trials that are themselves recruiting, shared by the live site search and the facility index
+#(scripts/study_condition_embeddings_init.py) so both return the same sites
+ACTIVE_FACILITY_FILTER = """
+    s.overall_status in ('ENROLLING_BY_INVITATION','NOT_YET_RECRUITING','RECRUITING')
+    and f.status in ('ENROLLING_BY_INVITATION','NOT_YET_RECRUITING','RECRUITING')
+"""
+
+
+def get_site_search_query(where_clause):
+    """
+    Site search query that joins facilities, studies and eligibilities server side and returns
+    exactly the columns the results page needs, so a search is a single round trip
+    """
+    return f"""
+    SELECT f.id, f.nct_id, f.status, f.name, f.city, f.state, f.zip, f.country,
+        f.latitude, f.longitude,
+        s.phase, s.study_type, s.overall_status,
+        e.gender, e.minimum_age, e.maximum_age
+    FROM facilities f
+    JOIN studies s ON s.nct_id = f.nct_id
+    LEFT JOIN eligibilities e ON e.nct_id = f.nct_id
+    WHERE {where_clause}
+    """